@@ -0,0 +1,60 @@
+"""add track vectors
+
+Revision ID: a8c1e5f3d9b7
+Revises: f3a9d5b1c7e2
+Create Date: 2026-10-17 22:14:37.920615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import pgvector.sqlalchemy
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c1e5f3d9b7'
+down_revision: Union[str, None] = 'f3a9d5b1c7e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('track_vectors',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('plugin_name', sa.String(), nullable=False),
+    sa.Column('plugin_version', sa.String(), nullable=False),
+    sa.Column('track_id', sa.UUID(), nullable=False),
+    sa.Column('embedding', pgvector.sqlalchemy.Vector(), nullable=False),
+    sa.Column('num_embeddings', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'plugin_name', 'plugin_version', 'track_id')
+    )
+    op.create_index(
+        'ix_track_vectors_track_id',
+        'track_vectors',
+        ['track_id'],
+    )
+    # pool the existing embeddings of every track, except for tracks whose
+    # embeddings have mixed dimensions, which can not be averaged
+    op.execute(
+        "INSERT INTO track_vectors "
+        "(user_id, plugin_name, plugin_version, track_id, embedding, num_embeddings) "
+        "SELECT user_id, plugin_name, plugin_version, track_id, avg(embedding), count(*) "
+        "FROM embeddings "
+        "WHERE embedding IS NOT NULL AND user_id IS NOT NULL "
+        "AND plugin_name IS NOT NULL AND plugin_version IS NOT NULL "
+        "AND track_id IS NOT NULL "
+        "AND (user_id, plugin_name, plugin_version, track_id) NOT IN ("
+        "SELECT user_id, plugin_name, plugin_version, track_id FROM embeddings "
+        "WHERE embedding IS NOT NULL "
+        "GROUP BY user_id, plugin_name, plugin_version, track_id "
+        "HAVING min(vector_dims(embedding)) <> max(vector_dims(embedding))"
+        ") "
+        "GROUP BY user_id, plugin_name, plugin_version, track_id",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_track_vectors_track_id', table_name='track_vectors')
+    # drops the ANN indexes of the track vectors as well
+    op.drop_table('track_vectors')
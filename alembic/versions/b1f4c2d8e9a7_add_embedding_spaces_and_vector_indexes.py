@@ -0,0 +1,85 @@
+"""add embedding spaces and vector indexes
+
+Revision ID: b1f4c2d8e9a7
+Revises: 594dc8613eca
+Create Date: 2026-10-17 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from nendo_plugin_library_postgres.vector_index import (
+    MAX_INDEX_DIMENSIONS,
+    OPERATOR_CLASSES,
+    VectorIndexMethod,
+    create_vector_index_sql,
+    vector_index_name,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b1f4c2d8e9a7'
+down_revision: Union[str, None] = '594dc8613eca'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _get_spaces():
+    return op.get_bind().execute(
+        sa.text(
+            "SELECT plugin_name, plugin_version, dimensions FROM embedding_spaces",
+        ),
+    ).all()
+
+
+def upgrade() -> None:
+    op.create_table('embedding_spaces',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('plugin_name', sa.String(), nullable=False),
+    sa.Column('plugin_version', sa.String(), nullable=False),
+    sa.Column('dimensions', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('plugin_name', 'plugin_version')
+    )
+    # declare all existing embedding spaces whose vectors share the same dimensions
+    op.execute(
+        """
+        INSERT INTO embedding_spaces (id, plugin_name, plugin_version, dimensions)
+        SELECT gen_random_uuid(), plugin_name, plugin_version,
+               min(vector_dims(embedding))
+        FROM embeddings
+        WHERE plugin_name IS NOT NULL AND plugin_version IS NOT NULL
+        GROUP BY plugin_name, plugin_version
+        HAVING min(vector_dims(embedding)) = max(vector_dims(embedding))
+        """,
+    )
+    for plugin_name, plugin_version, dimensions in _get_spaces():
+        if dimensions > MAX_INDEX_DIMENSIONS:
+            continue
+        for distance_metric in OPERATOR_CLASSES:
+            op.execute(
+                create_vector_index_sql(
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                    dimensions=dimensions,
+                    method=VectorIndexMethod.hnsw,
+                    distance_metric=distance_metric,
+                    m=16,
+                    ef_construction=64,
+                ),
+            )
+
+
+def downgrade() -> None:
+    for plugin_name, plugin_version, _ in _get_spaces():
+        for method in VectorIndexMethod:
+            for distance_metric in OPERATOR_CLASSES:
+                op.execute(
+                    "DROP INDEX IF EXISTS "
+                    + vector_index_name(
+                        plugin_name, plugin_version, method, distance_metric,
+                    ),
+                )
+    op.drop_table('embedding_spaces')
@@ -0,0 +1,138 @@
+"""partition embeddings by space
+
+Revision ID: b5d2f8a4c6e1
+Revises: a8c1e5f3d9b7
+Create Date: 2026-10-17 23:05:52.417930
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import pgvector.sqlalchemy
+import sqlalchemy as sa
+
+from nendo_plugin_library_postgres.partitions import (
+    create_default_partition_sql,
+    create_space_partition_sql,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2f8a4c6e1'
+down_revision: Union[str, None] = 'a8c1e5f3d9b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, track_id, user_id, plugin_name, plugin_version, text, embedding"
+
+
+def _get_vector_indexes():
+    """Return the definitions of the ANN indexes of the embeddings, on the parent table."""
+    indexes = op.get_bind().execute(
+        sa.text(
+            "SELECT DISTINCT ON (indexname) indexname, indexdef FROM pg_indexes "
+            "WHERE (tablename = 'embeddings' OR tablename LIKE 'embeddings\\_%') "
+            "AND indexname LIKE 'ix\\_embeddings\\_%' "
+            "AND indexname NOT IN ('ix_embeddings_space', 'ix_embeddings_track_id')",
+        ),
+    ).all()
+    return [
+        re.sub(r" ON (ONLY )?\S+ USING ", " ON embeddings USING ", indexdef)
+        for _, indexdef in indexes
+    ]
+
+
+def _create_embeddings_indexes() -> None:
+    op.create_index(
+        'ix_embeddings_space',
+        'embeddings',
+        ['user_id', 'plugin_name', 'plugin_version'],
+    )
+    op.create_index('ix_embeddings_track_id', 'embeddings', ['track_id'])
+
+
+def upgrade() -> None:
+    # ANN indexes can not be moved to another table, so they are recreated
+    vector_indexes = _get_vector_indexes()
+    spaces = op.get_bind().execute(
+        sa.text(
+            "SELECT DISTINCT plugin_name, plugin_version FROM embeddings "
+            "WHERE plugin_name IS NOT NULL AND plugin_version IS NOT NULL "
+            "ORDER BY plugin_name, plugin_version",
+        ),
+    ).all()
+    op.rename_table('embeddings', 'embeddings_unpartitioned')
+    op.execute(
+        "ALTER TABLE embeddings_unpartitioned "
+        "RENAME CONSTRAINT embeddings_pkey TO embeddings_unpartitioned_pkey",
+    )
+    op.drop_index('ix_embeddings_space', table_name='embeddings_unpartitioned')
+    op.drop_index('ix_embeddings_track_id', table_name='embeddings_unpartitioned')
+    op.create_table('embeddings',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('track_id', sa.UUID(), nullable=True),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('plugin_name', sa.String(), nullable=False),
+    sa.Column('plugin_version', sa.String(), nullable=False),
+    sa.Column('text', sa.String(), nullable=True),
+    sa.Column('embedding', pgvector.sqlalchemy.Vector(), nullable=True),
+    sa.ForeignKeyConstraint(['track_id'], ['tracks.id'], ),
+    sa.PrimaryKeyConstraint('id', 'plugin_name', 'plugin_version'),
+    postgresql_partition_by='LIST (plugin_name)',
+    )
+    op.execute(create_default_partition_sql())
+    _create_embeddings_indexes()
+    # every existing embedding space gets a partition of its own
+    plugins = set()
+    for plugin_name, plugin_version in spaces:
+        for statement in create_space_partition_sql(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+            plugin_partition_exists=plugin_name in plugins,
+        ):
+            op.execute(statement)
+        plugins.add(plugin_name)
+    # embeddings without a plugin name or version are kept in the default partition
+    op.execute(
+        f"INSERT INTO embeddings ({COLUMNS}) "
+        "SELECT id, track_id, user_id, coalesce(plugin_name, ''), "
+        "coalesce(plugin_version, ''), text, embedding "
+        "FROM embeddings_unpartitioned",
+    )
+    op.drop_table('embeddings_unpartitioned')
+    for indexdef in vector_indexes:
+        op.execute(indexdef)
+
+
+def downgrade() -> None:
+    vector_indexes = _get_vector_indexes()
+    op.rename_table('embeddings', 'embeddings_partitioned')
+    op.execute(
+        "ALTER TABLE embeddings_partitioned "
+        "RENAME CONSTRAINT embeddings_pkey TO embeddings_partitioned_pkey",
+    )
+    op.drop_index('ix_embeddings_space', table_name='embeddings_partitioned')
+    op.drop_index('ix_embeddings_track_id', table_name='embeddings_partitioned')
+    op.create_table('embeddings',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('track_id', sa.UUID(), nullable=True),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('plugin_name', sa.String(), nullable=True),
+    sa.Column('plugin_version', sa.String(), nullable=True),
+    sa.Column('text', sa.String(), nullable=True),
+    sa.Column('embedding', pgvector.sqlalchemy.Vector(), nullable=True),
+    sa.ForeignKeyConstraint(['track_id'], ['tracks.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    )
+    _create_embeddings_indexes()
+    op.execute(
+        f"INSERT INTO embeddings ({COLUMNS}) "
+        "SELECT id, track_id, user_id, nullif(plugin_name, ''), "
+        "nullif(plugin_version, ''), text, embedding "
+        "FROM embeddings_partitioned",
+    )
+    # drops all partitions as well
+    op.drop_table('embeddings_partitioned')
+    for indexdef in vector_indexes:
+        op.execute(indexdef)
@@ -0,0 +1,52 @@
+"""add embedding secondary indexes
+
+Revision ID: c7e3a9d1f2b4
+Revises: b1f4c2d8e9a7
+Create Date: 2026-10-17 14:03:27.540913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e3a9d1f2b4'
+down_revision: Union[str, None] = 'b1f4c2d8e9a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # build the indexes without blocking writes to large libraries
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_embeddings_space',
+            'embeddings',
+            ['user_id', 'plugin_name', 'plugin_version'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_embeddings_track_id',
+            'embeddings',
+            ['track_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_embeddings_track_id',
+            table_name='embeddings',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_embeddings_space',
+            table_name='embeddings',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,60 @@
+"""add unique embedding key
+
+Revision ID: c9e4a7b2d6f8
+Revises: b5d2f8a4c6e1
+Create Date: 2026-10-18 09:41:26.308154
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e4a7b2d6f8'
+down_revision: Union[str, None] = 'b5d2f8a4c6e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the number of conflicting keys listed in the error message
+MAX_LISTED_CONFLICTS = 20
+
+
+def upgrade() -> None:
+    # embeddings without a text are keyed by the empty text, see the index below
+    conflicts = op.get_bind().execute(
+        sa.text(
+            "SELECT track_id, plugin_name, plugin_version, coalesce(text, '') AS text, "
+            "array_agg(id::text ORDER BY id) AS ids, count(*) OVER () AS total "
+            "FROM embeddings WHERE track_id IS NOT NULL "
+            "GROUP BY track_id, plugin_name, plugin_version, coalesce(text, '') "
+            "HAVING count(*) > 1 "
+            "ORDER BY track_id, plugin_name, plugin_version, coalesce(text, '') "
+            "LIMIT :limit",
+        ),
+        {"limit": MAX_LISTED_CONFLICTS},
+    ).all()
+    if len(conflicts) > 0:
+        listed = "\n".join(
+            f"  track {row.track_id}, plugin {row.plugin_name} "
+            f"{row.plugin_version}, text {row.text!r}: embeddings {', '.join(row.ids)}"
+            for row in conflicts
+        )
+        raise RuntimeError(
+            f"Found {conflicts[0].total} sets of embeddings with the same track, "
+            "plugin name, plugin version and text, which can not be unique:\n"
+            f"{listed}\n"
+            "Remove all but one embedding of each set, e.g. with "
+            "`remove_embedding()`, and run the migration again.",
+        )
+    op.create_index(
+        'uq_embeddings_track_text',
+        'embeddings',
+        ['track_id', 'plugin_name', 'plugin_version', sa.text("coalesce(text, '')")],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_embeddings_track_text', table_name='embeddings')
@@ -0,0 +1,45 @@
+"""add meta trigram index
+
+Revision ID: d2b8f6a3e5c9
+Revises: c9e4a7b2d6f8
+Create Date: 2026-10-18 11:27:53.604718
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from nendo_plugin_library_postgres.meta_search import (
+    META_VALUES_FUNCTION,
+    META_VALUES_INDEX,
+    create_meta_values_function_sql,
+    create_meta_values_index_sql,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b8f6a3e5c9'
+down_revision: Union[str, None] = 'c9e4a7b2d6f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().execute(
+        sa.text("SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'"),
+    ).scalar() == 0:
+        # meta data searches keep scanning all tracks
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(create_meta_values_function_sql())
+    # build the index without blocking writes to large libraries
+    with op.get_context().autocommit_block():
+        op.execute(create_meta_values_index_sql(concurrently=True))
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {META_VALUES_INDEX}")
+    # the extension is left installed, as other indexes might use it
+    op.execute(f"DROP FUNCTION IF EXISTS {META_VALUES_FUNCTION}(json)")
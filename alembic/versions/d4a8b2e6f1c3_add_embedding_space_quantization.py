@@ -0,0 +1,57 @@
+"""add embedding space quantization
+
+Revision ID: d4a8b2e6f1c3
+Revises: c7e3a9d1f2b4
+Create Date: 2026-10-17 16:48:05.302177
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from nendo_plugin_library_postgres.vector_index import (
+    VectorIndexMethod,
+    VectorQuantization,
+    index_distance_metrics,
+    vector_index_name,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8b2e6f1c3'
+down_revision: Union[str, None] = 'c7e3a9d1f2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing spaces keep their full precision indexes. To quantize a space,
+    # drop its indexes and declare it again using
+    # `set_embedding_space(..., quantization=...)`, then recreate them using
+    # `create_vector_index(concurrently=True)`. The stored vectors are unchanged.
+    op.add_column(
+        'embedding_spaces',
+        sa.Column('quantization', sa.String(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    spaces = op.get_bind().execute(
+        sa.text("SELECT plugin_name, plugin_version FROM embedding_spaces"),
+    ).all()
+    for plugin_name, plugin_version in spaces:
+        for method in VectorIndexMethod:
+            for quantization in VectorQuantization:
+                for distance_metric in index_distance_metrics(quantization):
+                    op.execute(
+                        "DROP INDEX IF EXISTS "
+                        + vector_index_name(
+                            plugin_name,
+                            plugin_version,
+                            method,
+                            distance_metric,
+                            quantization,
+                        ),
+                    )
+    op.drop_column('embedding_spaces', 'quantization')
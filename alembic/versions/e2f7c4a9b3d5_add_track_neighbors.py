@@ -0,0 +1,50 @@
+"""add track neighbors
+
+Revision ID: e2f7c4a9b3d5
+Revises: d4a8b2e6f1c3
+Create Date: 2026-10-17 19:21:44.610382
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f7c4a9b3d5'
+down_revision: Union[str, None] = 'd4a8b2e6f1c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('neighbor_graphs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('plugin_name', sa.String(), nullable=False),
+    sa.Column('plugin_version', sa.String(), nullable=False),
+    sa.Column('distance_metric', sa.String(), nullable=False),
+    sa.Column('k', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'plugin_name', 'plugin_version', 'distance_metric')
+    )
+    op.create_table('track_neighbors',
+    sa.Column('graph_id', sa.UUID(), nullable=False),
+    sa.Column('track_id', sa.UUID(), nullable=False),
+    sa.Column('neighbor_id', sa.UUID(), nullable=False),
+    sa.Column('distance', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['graph_id'], ['neighbor_graphs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('graph_id', 'track_id', 'neighbor_id')
+    )
+    op.create_index(
+        'ix_track_neighbors_neighbor_id',
+        'track_neighbors',
+        ['neighbor_id'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_track_neighbors_neighbor_id', table_name='track_neighbors')
+    op.drop_table('track_neighbors')
+    op.drop_table('neighbor_graphs')
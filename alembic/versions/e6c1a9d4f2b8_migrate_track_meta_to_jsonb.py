@@ -0,0 +1,72 @@
+"""migrate track meta to jsonb
+
+Opt-in, as it rewrites the tracks table, which is locked meanwhile:
+
+    alembic upgrade meta_jsonb@head
+
+Revision ID: e6c1a9d4f2b8
+Revises:
+Create Date: 2026-10-18 14:52:08.731942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from nendo_plugin_library_postgres.meta_search import (
+    META_CONTAINMENT_INDEX,
+    META_VALUES_FUNCTION,
+    create_meta_containment_index_sql,
+    create_meta_values_function_sql,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6c1a9d4f2b8'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = ('meta_jsonb',)
+depends_on: Union[str, Sequence[str], None] = 'd2b8f6a3e5c9'
+
+
+def _has_meta_values_function(json_type: str) -> bool:
+    return op.get_bind().execute(
+        sa.text("SELECT to_regprocedure(:signature) IS NOT NULL").bindparams(
+            signature=f"{META_VALUES_FUNCTION}({json_type})",
+        ),
+    ).scalar()
+
+
+def upgrade() -> None:
+    # the meta data indexes are rebuilt by the type change, so the trigram
+    # index needs the function's jsonb variant
+    has_function = _has_meta_values_function("json")
+    if has_function:
+        op.execute(create_meta_values_function_sql(jsonb=True))
+    op.alter_column(
+        'tracks',
+        'meta',
+        type_=postgresql.JSONB(),
+        postgresql_using='meta::jsonb',
+    )
+    if has_function:
+        op.execute(f"DROP FUNCTION {META_VALUES_FUNCTION}(json)")
+    with op.get_context().autocommit_block():
+        op.execute(create_meta_containment_index_sql(concurrently=True))
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {META_CONTAINMENT_INDEX}")
+    has_function = _has_meta_values_function("jsonb")
+    if has_function:
+        op.execute(create_meta_values_function_sql())
+    op.alter_column(
+        'tracks',
+        'meta',
+        type_=sa.JSON(),
+        postgresql_using='meta::json',
+    )
+    if has_function:
+        op.execute(f"DROP FUNCTION {META_VALUES_FUNCTION}(jsonb)")
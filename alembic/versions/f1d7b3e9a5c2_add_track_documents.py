@@ -0,0 +1,51 @@
+"""add track documents
+
+Revision ID: f1d7b3e9a5c2
+Revises: d2b8f6a3e5c9
+Create Date: 2026-10-19 09:41:26.318504
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from nendo_plugin_library_postgres.text_search import (
+    create_track_documents_sql,
+    drop_track_documents_sql,
+    refresh_track_documents_sql,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1d7b3e9a5c2'
+down_revision: Union[str, None] = 'd2b8f6a3e5c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('track_documents',
+    sa.Column('track_id', sa.UUID(), nullable=False),
+    sa.Column('document', postgresql.TSVECTOR(), nullable=False),
+    sa.ForeignKeyConstraint(['track_id'], ['tracks.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('track_id')
+    )
+    for statement in create_track_documents_sql():
+        op.execute(statement)
+    # index the existing tracks
+    op.execute(refresh_track_documents_sql())
+    op.create_index(
+        'ix_track_documents_document',
+        'track_documents',
+        ['document'],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    for statement in drop_track_documents_sql():
+        op.execute(statement)
+    op.drop_index('ix_track_documents_document', table_name='track_documents')
+    op.drop_table('track_documents')
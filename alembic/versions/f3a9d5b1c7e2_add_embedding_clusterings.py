@@ -0,0 +1,66 @@
+"""add embedding clusterings
+
+Revision ID: f3a9d5b1c7e2
+Revises: e2f7c4a9b3d5
+Create Date: 2026-10-17 21:02:13.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import pgvector.sqlalchemy
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9d5b1c7e2'
+down_revision: Union[str, None] = 'e2f7c4a9b3d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('clusterings',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('plugin_name', sa.String(), nullable=False),
+    sa.Column('plugin_version', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('distance_metric', sa.String(), nullable=False),
+    sa.Column('k', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'plugin_name', 'plugin_version', 'name')
+    )
+    op.create_table('cluster_centroids',
+    sa.Column('clustering_id', sa.UUID(), nullable=False),
+    sa.Column('cluster', sa.Integer(), nullable=False),
+    sa.Column('centroid', pgvector.sqlalchemy.Vector(), nullable=False),
+    sa.ForeignKeyConstraint(['clustering_id'], ['clusterings.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('clustering_id', 'cluster')
+    )
+    op.create_table('track_clusters',
+    sa.Column('clustering_id', sa.UUID(), nullable=False),
+    sa.Column('track_id', sa.UUID(), nullable=False),
+    sa.Column('cluster', sa.Integer(), nullable=False),
+    sa.Column('distance', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['clustering_id'], ['clusterings.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('clustering_id', 'track_id')
+    )
+    op.create_index(
+        'ix_track_clusters_cluster',
+        'track_clusters',
+        ['clustering_id', 'cluster', 'distance'],
+    )
+    op.create_index(
+        'ix_track_clusters_track_id',
+        'track_clusters',
+        ['track_id'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_track_clusters_track_id', table_name='track_clusters')
+    op.drop_index('ix_track_clusters_cluster', table_name='track_clusters')
+    op.drop_table('track_clusters')
+    op.drop_table('cluster_centroids')
+    op.drop_table('clusterings')
@@ -0,0 +1,88 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark the secondary indexes of the embeddings table.
+
+Times `get_embeddings(track_id=...)` and `remove_track()` with and without the
+`ix_embeddings_track_id` and `ix_embeddings_space` indexes. The indexes are
+dropped temporarily, so only run this against a scratch database:
+
+    python benchmarks/bench_embedding_indexes.py --tracks 20000
+"""
+
+import argparse
+import statistics
+
+from common import cleanup_library, make_nendo, populate_library, time_ms
+from nendo import Nendo
+
+from nendo_plugin_library_postgres.model import NendoEmbeddingDB
+
+PLUGIN_NAME = "bench_embedding_indexes"
+PLUGIN_VERSION = "0.1.0"
+
+
+def _run(nd: Nendo, track_ids: list) -> dict:
+    get_ms = [
+        time_ms(
+            nd.library.get_embeddings,
+            track_id=track_id,
+            plugin_name=PLUGIN_NAME,
+            plugin_version=PLUGIN_VERSION,
+        )
+        for track_id in track_ids
+    ]
+    remove_ms = [
+        time_ms(nd.library.remove_track, track_id, remove_resources=False)
+        for track_id in track_ids
+    ]
+    return {
+        "get_embeddings": statistics.median(get_ms),
+        "remove_track": statistics.median(remove_ms),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the median latencies."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=20000)
+    parser.add_argument("--embeddings-per-track", type=int, default=2)
+    parser.add_argument("--dimensions", type=int, default=128)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    nd = make_nendo()
+    indexes = list(NendoEmbeddingDB.__table__.indexes)
+    track_ids = populate_library(
+        nd,
+        plugin_name=PLUGIN_NAME,
+        plugin_version=PLUGIN_VERSION,
+        tracks=args.tracks,
+        per_track=args.embeddings_per_track,
+        dimensions=args.dimensions,
+    )
+    samples = track_ids[: 2 * args.samples]
+    try:
+        for index in indexes:
+            index.create(bind=nd.library.db, checkfirst=True)
+        with_indexes = _run(nd, samples[: args.samples])
+        for index in indexes:
+            index.drop(bind=nd.library.db, checkfirst=True)
+        without_indexes = _run(nd, samples[args.samples :])
+    finally:
+        for index in indexes:
+            index.create(bind=nd.library.db, checkfirst=True)
+        cleanup_library(nd, PLUGIN_NAME, track_ids)
+
+    print(  # noqa: T201
+        f"{args.tracks} tracks, {args.embeddings_per_track} embeddings per "
+        f"track, median of {args.samples} calls",
+    )
+    print(f"{'':<16}{'with indexes':>16}{'without indexes':>18}")  # noqa: T201
+    for name in with_indexes:
+        print(  # noqa: T201
+            f"{name:<16}{with_indexes[name]:>13.2f} ms"
+            f"{without_indexes[name]:>15.2f} ms",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark filtering tracks by their meta data, before and after JSONB.
+
+Times `filter_tracks_by_meta()` with fuzzy and exact matches of a meta data
+value, first with `tracks.meta` stored as `json` and then after converting it
+to `jsonb` with the containment index, as done by the `meta_jsonb` migration.
+The column is converted back afterwards, so only run this against a scratch
+database whose meta data is still stored as `json`:
+
+    python benchmarks/bench_meta_filter.py --tracks 1000000
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+
+from common import cleanup_library, insert_tracks, make_nendo, time_ms
+from nendo import Nendo
+from sqlalchemy import text
+
+from nendo_plugin_library_postgres.meta_search import (
+    META_CONTAINMENT_INDEX,
+    META_VALUES_FUNCTION,
+    create_meta_containment_index_sql,
+    create_meta_values_function_sql,
+)
+
+GENRES = [
+    "ambient", "blues", "classical", "country", "electronic", "folk", "jazz",
+    "metal", "pop", "rock",
+]
+
+
+def _synthetic_meta(artists: int, seed: int = 0):
+    rng = random.Random(seed)
+    while True:
+        yield {
+            "artist": f"artist_{rng.randrange(artists):06d}",
+            "genre": rng.choice(GENRES),
+            "year": rng.randrange(1950, 2024),
+        }
+
+
+def _meta_type(nd: Nendo) -> str:
+    with nd.library.db.connect() as connection:
+        return connection.execute(
+            text(
+                "SELECT atttypid::regtype::text FROM pg_attribute "
+                "WHERE attrelid = 'tracks'::regclass AND attname = 'meta'",
+            ),
+        ).scalar()
+
+
+def _convert_meta(nd: Nendo, jsonb: bool) -> None:
+    old_type, new_type = ("json", "jsonb") if jsonb else ("jsonb", "json")
+    with nd.library.db.connect() as connection:
+        # the trigram index over the flattened meta data needs the function
+        # variant of the new type
+        has_function = connection.execute(
+            text("SELECT to_regprocedure(:signature) IS NOT NULL").bindparams(
+                signature=f"{META_VALUES_FUNCTION}({old_type})",
+            ),
+        ).scalar()
+        if has_function:
+            connection.execute(text(create_meta_values_function_sql(jsonb=jsonb)))
+        if not jsonb:
+            connection.execute(text(f"DROP INDEX IF EXISTS {META_CONTAINMENT_INDEX}"))
+        connection.execute(
+            text(
+                f"ALTER TABLE tracks ALTER COLUMN meta "
+                f"TYPE {new_type} USING meta::{new_type}",
+            ),
+        )
+        if has_function:
+            connection.execute(
+                text(f"DROP FUNCTION {META_VALUES_FUNCTION}({old_type})"),
+            )
+        if jsonb:
+            connection.execute(text(create_meta_containment_index_sql()))
+        connection.execute(text("ANALYZE tracks"))
+        connection.commit()
+    nd.library.meta_jsonb = None
+
+
+def _run(nd: Nendo, artists: list, limit: int) -> dict:
+    return {
+        meta_match: statistics.median(
+            time_ms(
+                nd.library.filter_tracks_by_meta,
+                search_meta={"artist": [artist]},
+                meta_match=meta_match,
+                limit=limit,
+            )
+            for artist in artists
+        )
+        for meta_match in ("fuzzy", "exact")
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the median latencies."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=1000000)
+    parser.add_argument("--artists", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    nd = make_nendo()
+    if _meta_type(nd) != "json":
+        parser.error("tracks.meta has already been migrated to jsonb")
+    track_ids = insert_tracks(
+        nd,
+        itertools.islice(_synthetic_meta(args.artists), args.tracks),
+    )
+    with nd.library.db.connect() as connection:
+        connection.execute(text("ANALYZE tracks"))
+        connection.commit()
+    rng = random.Random(1)
+    artists = [
+        f"artist_{rng.randrange(args.artists):06d}" for _ in range(2 * args.samples)
+    ]
+    try:
+        with_json = _run(nd, artists[: args.samples], args.limit)
+        _convert_meta(nd, jsonb=True)
+        with_jsonb = _run(nd, artists[args.samples :], args.limit)
+    finally:
+        if _meta_type(nd) == "jsonb":
+            _convert_meta(nd, jsonb=False)
+        cleanup_library(nd, "", track_ids)
+
+    print(  # noqa: T201
+        f"{args.tracks} tracks, {args.artists} artists, limit {args.limit}, "
+        f"median of {args.samples} calls",
+    )
+    print(f"{'':<8}{'json':>12}{'jsonb':>12}")  # noqa: T201
+    for name in with_json:
+        print(  # noqa: T201
+            f"{name:<8}{with_json[name]:>9.2f} ms{with_jsonb[name]:>9.2f} ms",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark reading vectors in pgvector's text and binary formats.
+
+Reads all embeddings of an embedding space, 10k rows by default, as:
+
+- text, parsed by pgvector's SQLAlchemy type, pgvector's default,
+- text, parsed by the library's psycopg2 caster (`adapters.cast_vector()`),
+- binary COPY, decoded by `get_embedding_matrix()`.
+
+Usage:
+
+    python benchmarks/bench_vector_io.py --rows 10000 --dimensions 512
+"""
+
+import argparse
+import statistics
+
+import numpy as np
+from common import cleanup_library, make_nendo, populate_library, time_ms
+from nendo import Nendo
+from pgvector.sqlalchemy import VECTOR
+from sqlalchemy import text
+
+from nendo_plugin_library_postgres.adapters import cast_vector
+
+# the parser pgvector's SQLAlchemy type applies to text vectors
+from_db = VECTOR().result_processor(dialect=None, coltype=None)
+
+PLUGIN_NAME = "bench_vector_io"
+PLUGIN_VERSION = "0.1.0"
+
+SPACE_QUERY = (
+    "FROM embeddings WHERE user_id = :user_id "
+    "AND plugin_name = :plugin_name AND plugin_version = :plugin_version"
+)
+
+
+def _read_text(nd: Nendo, parse) -> np.ndarray:
+    with nd.library.session_scope() as session:
+        rows = session.execute(
+            text(f"SELECT track_id, embedding::text {SPACE_QUERY}"),
+            {
+                "user_id": nd.library.user.id,
+                "plugin_name": PLUGIN_NAME,
+                "plugin_version": PLUGIN_VERSION,
+            },
+        ).all()
+    return np.stack([parse(row[1]) for row in rows])
+
+
+def _read_binary(nd: Nendo) -> np.ndarray:
+    return nd.library.get_embedding_matrix(
+        plugin_name=PLUGIN_NAME,
+        plugin_version=PLUGIN_VERSION,
+    )[1]
+
+
+def _wire_bytes(nd: Nendo) -> tuple:
+    with nd.library.session_scope() as session:
+        return session.execute(
+            text(
+                "SELECT sum(octet_length(embedding::text)), "
+                f"sum(4 + 4 * vector_dims(embedding)) {SPACE_QUERY}",
+            ),
+            {
+                "user_id": nd.library.user.id,
+                "plugin_name": PLUGIN_NAME,
+                "plugin_version": PLUGIN_VERSION,
+            },
+        ).one()
+
+
+def main() -> None:
+    """Run the benchmark and print the median read times."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--dimensions", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    nd = make_nendo()
+    track_ids = populate_library(
+        nd,
+        plugin_name=PLUGIN_NAME,
+        plugin_version=PLUGIN_VERSION,
+        tracks=args.rows,
+        per_track=1,
+        dimensions=args.dimensions,
+    )
+    try:
+        # all three formats must decode to the same matrix
+        expected = np.sort(_read_text(nd, from_db), axis=0)
+        np.testing.assert_array_equal(
+            np.sort(_read_text(nd, lambda v: cast_vector(v, None)), axis=0),
+            expected,
+        )
+        np.testing.assert_array_equal(np.sort(_read_binary(nd), axis=0), expected)
+        readers = {
+            "text, pgvector": lambda: _read_text(nd, from_db),
+            "text, cast_vector": lambda: _read_text(
+                nd, lambda v: cast_vector(v, None),
+            ),
+            "binary COPY": lambda: _read_binary(nd),
+        }
+        timings = {
+            name: statistics.median(time_ms(read) for _ in range(args.repeat))
+            for name, read in readers.items()
+        }
+        text_bytes, binary_bytes = _wire_bytes(nd)
+    finally:
+        cleanup_library(nd, PLUGIN_NAME, track_ids)
+
+    print(  # noqa: T201
+        f"{args.rows} rows of {args.dimensions} dimensions, "
+        f"median of {args.repeat} reads",
+    )
+    for name, ms in timings.items():
+        print(f"{name:<20}{ms:>10.1f} ms")  # noqa: T201
+    print(  # noqa: T201
+        f"vector payload: text {text_bytes / 2**20:.1f} MiB, "
+        f"binary {binary_bytes / 2**20:.1f} MiB",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# -*- encoding: utf-8 -*-
+"""Helpers shared by the benchmark scripts.
+
+The benchmarks insert their own tracks and embeddings and remove them again
+afterwards. Some of them also change the schema temporarily, so only run them
+against a scratch database. The database is configured through the usual
+`POSTGRES_*` environment variables.
+"""
+
+import itertools
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List
+
+import numpy as np
+from nendo import Nendo, NendoConfig, NendoEmbeddingCreate
+from nendo.library import model
+from nendo.schema import NendoResource
+from sqlalchemy import insert
+
+from nendo_plugin_library_postgres.model import NendoEmbeddingDB
+
+
+def make_nendo() -> Nendo:
+    """Create a Nendo instance using the Postgres library plugin."""
+    return Nendo(
+        config=NendoConfig(
+            log_level="WARNING",
+            library_plugin="nendo_plugin_library_postgres",
+            copy_to_library=False,
+            plugins=[],
+        ),
+    )
+
+
+def insert_tracks(
+    nd: Nendo,
+    metas: Iterable[Dict[str, Any]],
+    batch_size: int = 10000,
+) -> List[uuid.UUID]:
+    """Insert tracks without any resources into the library, in batches.
+
+    Args:
+        nd (Nendo): The Nendo instance.
+        metas (Iterable[Dict[str, Any]]): The meta data of each track.
+        batch_size (int): Number of tracks inserted per statement.
+
+    Returns:
+        List[uuid.UUID]: The IDs of the inserted tracks.
+    """
+    track_ids = []
+    metas = iter(metas)
+    while batch := list(itertools.islice(metas, batch_size)):
+        batch_ids = [uuid.uuid4() for _ in batch]
+        with nd.library.session_scope() as session:
+            session.execute(
+                insert(model.NendoTrackDB),
+                [
+                    {
+                        "id": track_id,
+                        "user_id": nd.library.user.id,
+                        "images": [],
+                        "resource": NendoResource(
+                            file_path="",
+                            file_name=f"{track_id}.wav",
+                            resource_type="audio",
+                            location="local",
+                        ).model_dump(mode="json"),
+                        "meta": meta,
+                    }
+                    for track_id, meta in zip(batch_ids, batch)  # noqa: B905
+                ],
+            )
+            session.commit()
+        track_ids.extend(batch_ids)
+    return track_ids
+
+
+def populate_library(
+    nd: Nendo,
+    plugin_name: str,
+    plugin_version: str,
+    tracks: int,
+    per_track: int,
+    dimensions: int,
+) -> List[uuid.UUID]:
+    """Insert random tracks, with `per_track` embeddings each, into the library.
+
+    Args:
+        nd (Nendo): The Nendo instance.
+        plugin_name (str): Name of the embedding space.
+        plugin_version (str): Version of the embedding space.
+        tracks (int): Number of tracks to insert.
+        per_track (int): Number of embeddings per track.
+        dimensions (int): Dimensions of the embeddings.
+
+    Returns:
+        List[uuid.UUID]: The IDs of the inserted tracks.
+    """
+    track_ids = insert_tracks(nd, [{}] * tracks)
+    rng = np.random.default_rng(0)
+    nd.library.add_embeddings(
+        (
+            NendoEmbeddingCreate(
+                track_id=track_id,
+                user_id=nd.library.user.id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                text=str(segment),
+                embedding=rng.standard_normal(dimensions, dtype=np.float32),
+            )
+            for track_id in track_ids
+            for segment in range(per_track)
+        ),
+        return_ids=True,
+    )
+    with nd.library.db.connect() as connection:
+        connection.exec_driver_sql("ANALYZE embeddings")
+        connection.exec_driver_sql("ANALYZE tracks")
+        connection.commit()
+    return track_ids
+
+
+def cleanup_library(nd: Nendo, plugin_name: str, track_ids: List[uuid.UUID]) -> None:
+    """Remove the tracks and embeddings inserted by `populate_library()`."""
+    with nd.library.session_scope() as session:
+        session.query(NendoEmbeddingDB).filter(
+            NendoEmbeddingDB.plugin_name == plugin_name,
+        ).delete()
+        for i in range(0, len(track_ids), 1000):
+            session.query(model.NendoTrackDB).filter(
+                model.NendoTrackDB.id.in_(track_ids[i : i + 1000]),
+            ).delete()
+        session.commit()
+
+
+def time_ms(fn: Callable, *args: Any, **kwargs: Any) -> float:
+    """Call a function and return its wall time, in milliseconds."""
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
@@ -0,0 +1,59 @@
+# -*- encoding: utf-8 -*-
+"""psycopg2 type casters for pgvector's vector type."""
+
+import logging
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger("nendo")
+
+
+def cast_vector(value: Optional[str], cursor: Any) -> Optional[np.ndarray]:  # noqa: ARG001
+    """Parse pgvector's text representation into a float32 NumPy array.
+
+    Parses the values in C, instead of splitting the string in Python like
+    pgvector's SQLAlchemy type does. That type passes arrays returned by the
+    driver through unchanged.
+
+    Args:
+        value (str, optional): The vector as returned by Postgres, e.g. "[1,2,3]".
+        cursor (Any): The psycopg2 cursor, unused.
+
+    Returns:
+        Optional[np.ndarray]: The vector, or None if the value is NULL.
+    """
+    if value is None:
+        return None
+    return np.fromstring(value[1:-1], dtype=np.float32, sep=",")
+
+
+def register_vector_type(dbapi_connection: Any, connection_record: Any = None) -> None:  # noqa: ARG001
+    """Register `cast_vector()` for the vector type on a new psycopg2 connection.
+
+    Meant to be used as a listener for the engine's "connect" event. Unlike
+    `pgvector.psycopg2.register_vector()`, the caster is registered on the
+    connection only, and no global adapter for NumPy arrays is registered.
+    Connections of other drivers, or to databases without the vector
+    extension, are left as they are.
+
+    Args:
+        dbapi_connection (Any): The new DBAPI connection.
+        connection_record (Any): The pool's record of the connection, unused.
+    """
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return
+    if not isinstance(dbapi_connection, extensions.connection):
+        return
+    with dbapi_connection.cursor() as cursor:
+        cursor.execute("SELECT to_regtype('vector')::oid")
+        oid = cursor.fetchone()[0]
+    # end the transaction implicitly opened by the query
+    dbapi_connection.rollback()
+    if oid is None:
+        logger.debug("Vector type not found, using pgvector's default parsing.")
+        return
+    vector_type = extensions.new_type((oid,), "VECTOR", cast_vector)
+    extensions.register_type(vector_type, dbapi_connection)
@@ -0,0 +1,209 @@
+# -*- encoding: utf-8 -*-
+"""Encoding and decoding helpers for Postgres' binary COPY format.
+
+Used for streaming embeddings into and out of the database without going
+through pgvector's text representation.
+"""
+
+import struct
+import uuid
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# signature, flags field, header extension length
+COPY_HEADER = COPY_SIGNATURE + struct.pack("!ii", 0, 0)
+COPY_TRAILER = struct.pack("!h", -1)
+NULL_FIELD = struct.pack("!i", -1)
+
+EMBEDDING_COPY_COLUMNS = (
+    "id",
+    "track_id",
+    "user_id",
+    "plugin_name",
+    "plugin_version",
+    "text",
+    "embedding",
+)
+# columns read by `EmbeddingCopyDecoder`
+EMBEDDING_READ_COLUMNS = ("track_id", "embedding")
+
+
+def vectors_to_float32(vectors: Sequence[npt.ArrayLike]) -> List[np.ndarray]:
+    """Cast a batch of vectors to float32, vectorized if they share a length.
+
+    Args:
+        vectors (Sequence[npt.ArrayLike]): The vectors to cast.
+
+    Returns:
+        List[np.ndarray]: The float32 vectors.
+    """
+    if len({len(vec) for vec in vectors}) == 1:
+        return list(np.asarray(vectors, dtype=np.float32))
+    return [np.asarray(vec, dtype=np.float32) for vec in vectors]
+
+
+def vectors_to_binary(vectors: List[np.ndarray]) -> List[bytes]:
+    """Encode vectors into pgvector's binary wire format.
+
+    Each vector is encoded as its number of dimensions (int16), an unused
+    int16 and the big-endian float32 values.
+
+    Args:
+        vectors (List[np.ndarray]): The vectors to encode.
+
+    Returns:
+        List[bytes]: The binary representations of the vectors.
+    """
+    if len({len(vec) for vec in vectors}) == 1:
+        header = struct.pack("!HH", len(vectors[0]), 0)
+        return [header + row.tobytes() for row in np.asarray(vectors, dtype=">f4")]
+    return [
+        struct.pack("!HH", len(vec), 0) + np.asarray(vec, dtype=">f4").tobytes()
+        for vec in vectors
+    ]
+
+
+def _encode_field(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return NULL_FIELD
+    return struct.pack("!i", len(value)) + value
+
+
+def _encode_uuid(value: Optional[uuid.UUID]) -> Optional[bytes]:
+    return value.bytes if value is not None else None
+
+
+def _encode_text(value: Optional[str]) -> Optional[bytes]:
+    return value.encode("utf-8") if value is not None else None
+
+
+def encode_embeddings_copy(
+    rows: List[Tuple[uuid.UUID, uuid.UUID, Optional[uuid.UUID], str, str, str]],
+    vectors: List[bytes],
+) -> bytes:
+    """Encode embedding rows into a binary COPY payload.
+
+    Args:
+        rows (List[Tuple]): Tuples of (id, track_id, user_id, plugin_name,
+            plugin_version, text), in the order of `EMBEDDING_COPY_COLUMNS`.
+        vectors (List[bytes]): The binary encoded vectors of the rows,
+            as returned by `vectors_to_binary()`.
+
+    Returns:
+        bytes: The payload, to be consumed by
+            `COPY embeddings (...) FROM STDIN WITH (FORMAT BINARY)`.
+    """
+    field_count = struct.pack("!h", len(EMBEDDING_COPY_COLUMNS))
+    chunks = [COPY_HEADER]
+    for row, vec in zip(rows, vectors):  # noqa: B905
+        embedding_id, track_id, user_id, plugin_name, plugin_version, text = row
+        chunks.append(field_count)
+        chunks.append(_encode_field(_encode_uuid(embedding_id)))
+        chunks.append(_encode_field(_encode_uuid(track_id)))
+        chunks.append(_encode_field(_encode_uuid(user_id)))
+        chunks.append(_encode_field(_encode_text(plugin_name)))
+        chunks.append(_encode_field(_encode_text(plugin_version)))
+        chunks.append(_encode_field(_encode_text(text)))
+        chunks.append(_encode_field(vec))
+    chunks.append(COPY_TRAILER)
+    return b"".join(chunks)
+
+
+def embedding_row_dtype(dimensions: int) -> np.dtype:
+    """Return the layout of a binary COPY row of `EMBEDDING_READ_COLUMNS`.
+
+    Rows of vectors with the same dimensions have a fixed size, so they can be
+    decoded with a single `np.frombuffer()` call.
+
+    Args:
+        dimensions (int): The dimensions of the vectors.
+
+    Returns:
+        np.dtype: The structured, big-endian dtype of a row.
+    """
+    return np.dtype(
+        [
+            ("field_count", ">i2"),
+            ("id_length", ">i4"),
+            ("id", "V16"),
+            ("vector_length", ">i4"),
+            ("dimensions", ">u2"),
+            ("unused", ">u2"),
+            ("vector", ">f4", (dimensions,)),
+        ],
+    )
+
+
+class EmbeddingCopyDecoder:
+    """File-like sink decoding `COPY ... TO STDOUT WITH (FORMAT BINARY)` output.
+
+    Decodes rows of `EMBEDDING_READ_COLUMNS`, whose vectors must all have the
+    given dimensions and must not be NULL, as they arrive. Each decoded chunk
+    is passed to `consume` as the track IDs and the float32 matrix of the
+    vectors, so the output is never buffered as a whole.
+    """
+
+    def __init__(
+        self,
+        dimensions: int,
+        consume: Callable[[List[uuid.UUID], np.ndarray], None],
+    ) -> None:
+        """Create a decoder for vectors of the given dimensions."""
+        self.dimensions = dimensions
+        self.consume = consume
+        self.row_dtype = embedding_row_dtype(dimensions)
+        self._buffer = bytearray()
+        self._header_read = False
+
+    def _read_header(self) -> bool:
+        if len(self._buffer) < len(COPY_HEADER):
+            return False
+        if not self._buffer.startswith(COPY_SIGNATURE):
+            raise ValueError("Invalid binary COPY signature.")
+        (extension_length,) = struct.unpack_from(
+            "!i", self._buffer, len(COPY_SIGNATURE) + 4,
+        )
+        header_length = len(COPY_HEADER) + extension_length
+        if len(self._buffer) < header_length:
+            return False
+        del self._buffer[:header_length]
+        self._header_read = True
+        return True
+
+    def write(self, data: bytes) -> int:
+        """Buffer a chunk of COPY output and decode all complete rows in it."""
+        self._buffer += data
+        if not self._header_read and not self._read_header():
+            return len(data)
+        num_rows = len(self._buffer) // self.row_dtype.itemsize
+        if num_rows == 0:
+            return len(data)
+        rows = np.frombuffer(self._buffer, dtype=self.row_dtype, count=num_rows)
+        if (
+            (rows["field_count"] != len(EMBEDDING_READ_COLUMNS)).any()
+            or (rows["id_length"] != 16).any()  # noqa: PLR2004
+            or (rows["vector_length"] != 4 + 4 * self.dimensions).any()
+            or (rows["dimensions"] != self.dimensions).any()
+        ):
+            del rows
+            raise ValueError(
+                "Unexpected row in binary COPY output. All vectors must "
+                f"have {self.dimensions} dimensions and must not be NULL.",
+            )
+        ids = rows["id"].tobytes()
+        track_ids = [
+            uuid.UUID(bytes=ids[i : i + 16]) for i in range(0, len(ids), 16)
+        ]
+        matrix = rows["vector"].astype(np.float32)
+        del rows
+        del self._buffer[: num_rows * self.row_dtype.itemsize]
+        self.consume(track_ids, matrix)
+        return len(data)
+
+    def close(self) -> None:
+        """Check that the complete output has been decoded."""
+        if not self._header_read or bytes(self._buffer) != COPY_TRAILER:
+            raise ValueError("Incomplete binary COPY output.")
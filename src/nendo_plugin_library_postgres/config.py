@@ -1,4 +1,6 @@
 """Default settings for the Nendo Postgres Library."""
+from typing import Optional
+
 from nendo import NendoConfig, ResourceLocation
 from pydantic import Field
 
@@ -11,3 +13,24 @@ class PostgresConfig(NendoConfig):
     postgres_password: str = Field(default="nendo")
     postgres_db: str = Field(default="nendo")
     embedding_plugin: str = Field(default="nendo_plugin_embed_clap")
+    vector_index_method: str = Field(default="hnsw")
+    hnsw_m: int = Field(default=16)
+    hnsw_ef_construction: int = Field(default=64)
+    ivfflat_lists: int = Field(default=100)
+    hnsw_ef_search: Optional[int] = Field(default=None)
+    ivfflat_probes: Optional[int] = Field(default=None)
+    vector_iterative_scan: Optional[str] = Field(default=None)
+    embedding_batch_size: int = Field(default=1000)
+    vector_cache_enabled: bool = Field(default=False)
+    vector_cache_max_bytes: int = Field(default=256 * 1024 * 1024)
+    change_notifications_enabled: bool = Field(default=False)
+    change_listener_enabled: bool = Field(default=False)
+    result_cache_enabled: bool = Field(default=False)
+    result_cache_max_entries: int = Field(default=1024)
+    result_cache_ttl: Optional[float] = Field(default=300.0)
+    prefilter_max_tracks: int = Field(default=1000)
+    postfilter_overfetch: int = Field(default=4)
+    postfilter_max_window: int = Field(default=4000)
+    quantized_rerank_factor: int = Field(default=4)
+    track_neighbors_k: int = Field(default=20)
+    kmeans_max_epochs: int = Field(default=10)
@@ -0,0 +1,162 @@
+# -*- encoding: utf-8 -*-
+"""Blocked all-pairs similarity join for finding near-duplicate embeddings."""
+
+import math
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from nendo import DistanceMetric
+
+from .neighbors import MAX_BLOCK_ELEMENTS, pairwise_distances
+
+# (row indexes of the first vectors, of the second vectors, distances)
+Pairs = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class DuplicateCluster(NamedTuple):
+    """A cluster of near-duplicate tracks."""
+
+    track_ids: List[uuid.UUID]
+    # the closest pairs that connect the tracks, as (track_id, duplicate_id, distance)
+    pairs: List[Tuple[uuid.UUID, uuid.UUID, float]]
+
+
+def _join_block(
+    path: Union[str, os.PathLike],
+    start: int,
+    stop: int,
+    threshold: float,
+    distance_metric: DistanceMetric,
+    max_block_elements: int = MAX_BLOCK_ELEMENTS,
+) -> Pairs:
+    """Find the pairs of a block of rows with all later rows of a .npy matrix.
+
+    The later rows are read in blocks as well, so only two blocks of rows are
+    converted to float64 at a time.
+    """
+    matrix = np.load(path, mmap_mode="r")
+    # small distances between large vectors cancel out in float32
+    block = np.asarray(matrix[start:stop], dtype=np.float64)
+    cols_per_block = max(1, max_block_elements // len(block))
+    left, right, pair_distances = [], [], []
+    for col_start in range(start, len(matrix), cols_per_block):
+        distances = pairwise_distances(
+            block,
+            np.asarray(matrix[col_start:col_start + cols_per_block], dtype=np.float64),
+            distance_metric,
+        )
+        rows, cols = np.nonzero(distances <= threshold)
+        # each pair is found once, by the block of its first row
+        upper = col_start + cols > start + rows
+        rows, cols = rows[upper], cols[upper]
+        left.append(start + rows)
+        right.append(col_start + cols)
+        pair_distances.append(distances[rows, cols])
+    return np.concatenate(left), np.concatenate(right), np.concatenate(pair_distances)
+
+
+def similarity_join(
+    path: Union[str, os.PathLike],
+    threshold: float,
+    distance_metric: DistanceMetric,
+    processes: Optional[int] = None,
+    max_block_elements: int = MAX_BLOCK_ELEMENTS,
+) -> Pairs:
+    """Find all pairs of rows of a matrix whose distance is below a threshold.
+
+    The matrix is read from a .npy file, which each worker process maps into
+    memory, so it is never copied between processes. The distances are
+    computed in square blocks of rows against later rows, so that at most
+    `max_block_elements` distances, and the rows of two blocks, are held in
+    memory per process.
+
+    Args:
+        path (Union[str, os.PathLike]): Path of the .npy file of the float32 matrix.
+        threshold (float): The maximum distance of a pair.
+        distance_metric (DistanceMetric): The distance metric to use.
+        processes (int, optional): Number of worker processes. Defaults to the
+            number of CPUs. With 1, the blocks are processed in this process.
+        max_block_elements (int): The maximum size of a block of distances.
+
+    Returns:
+        Pairs: The row indexes of both rows of each pair and their distances.
+    """
+    num_rows = len(np.load(path, mmap_mode="r"))
+    rows_per_block = max(1, math.isqrt(max_block_elements))
+    blocks = [
+        (start, min(start + rows_per_block, num_rows))
+        for start in range(0, num_rows, rows_per_block)
+    ]
+    if processes == 1:
+        results = [
+            _join_block(
+                path, start, stop, threshold, distance_metric, max_block_elements,
+            )
+            for start, stop in blocks
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(
+                    _join_block,
+                    path,
+                    start,
+                    stop,
+                    threshold,
+                    distance_metric,
+                    max_block_elements,
+                )
+                for start, stop in blocks
+            ]
+            results = [future.result() for future in futures]
+    if len(results) == 0:
+        return np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0, np.float32)
+    left, right, distances = zip(*results)  # noqa: B905
+    return np.concatenate(left), np.concatenate(right), np.concatenate(distances)
+
+
+def cluster_pairs(
+    left: np.ndarray,
+    right: np.ndarray,
+    distances: np.ndarray,
+) -> List[Tuple[List[int], List[Tuple[int, int, float]]]]:
+    """Group pairs of items into clusters of transitively connected items.
+
+    Uses union-find over the pairs in the order of their distance, so the pairs
+    returned per cluster form its minimum spanning tree.
+
+    Args:
+        left (np.ndarray): The first item of each pair.
+        right (np.ndarray): The second item of each pair.
+        distances (np.ndarray): The distance of each pair.
+
+    Returns:
+        List[Tuple[List[int], List[Tuple[int, int, float]]]]: The sorted items
+            of each cluster and the pairs connecting them, largest clusters first.
+    """
+    parent: Dict[int, int] = {}
+
+    def find(item: int) -> int:
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            # path halving
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    edges = []
+    for i in np.argsort(distances, kind="stable"):
+        a, b = int(left[i]), int(right[i])
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+            edges.append((a, b, float(distances[i])))
+    clusters: Dict[int, Tuple[List[int], List[Tuple[int, int, float]]]] = {}
+    for item in sorted(parent):
+        clusters.setdefault(find(item), ([], []))[0].append(item)
+    for edge in edges:
+        clusters[find(edge[0])][1].append(edge)
+    return sorted(clusters.values(), key=lambda cluster: -len(cluster[0]))
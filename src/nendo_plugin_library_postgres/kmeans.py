@@ -0,0 +1,168 @@
+# -*- encoding: utf-8 -*-
+"""Mini-batch k-means over streamed embedding batches."""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from nendo import DistanceMetric
+
+from .neighbors import pairwise_distances
+
+# distance metrics whose centroids are well defined
+KMEANS_DISTANCE_METRICS = (DistanceMetric.euclidean, DistanceMetric.cosine)
+
+
+def check_kmeans_distance_metric(distance_metric: DistanceMetric) -> DistanceMetric:
+    """Validate the distance metric of a clustering.
+
+    Raises:
+        ValueError: If the distance metric is not supported by k-means.
+    """
+    distance_metric = DistanceMetric(distance_metric)
+    if distance_metric not in KMEANS_DISTANCE_METRICS:
+        raise ValueError(
+            f"Can not cluster embeddings by {distance_metric.value} distance. "
+            "Should be one of "
+            f"{', '.join([ds.value for ds in KMEANS_DISTANCE_METRICS])}.",
+        )
+    return distance_metric
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def sample_rows(
+    sample: Optional[Tuple[np.ndarray, np.ndarray]],
+    batch: np.ndarray,
+    size: int,
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Add a batch of rows to a uniform random sample of fixed size.
+
+    Every row gets a random key, and the rows with the smallest keys are kept,
+    which samples uniformly from all rows seen so far.
+
+    Args:
+        sample (Tuple[np.ndarray, np.ndarray], optional): The keys and rows of
+            the current sample, None before the first batch.
+        batch (np.ndarray): The rows to add.
+        size (int): The size of the sample.
+        rng (np.random.Generator): The random number generator.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The keys and rows of the new sample.
+    """
+    keys = rng.random(len(batch))
+    if sample is not None:
+        keys = np.concatenate([sample[0], keys])
+        batch = np.concatenate([sample[1], batch])
+    if len(keys) > size:
+        keep = np.argpartition(keys, size - 1)[:size]
+        keys, batch = keys[keep], batch[keep]
+    return keys, batch
+
+
+def kmeans_plus_plus(
+    sample: np.ndarray,
+    k: int,
+    distance_metric: DistanceMetric,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Choose initial centroids from a sample using k-means++ seeding.
+
+    Args:
+        sample (np.ndarray): The float32 sample vectors, one per row.
+        k (int): The number of centroids.
+        distance_metric (DistanceMetric): The distance metric of the clustering.
+        rng (np.random.Generator): The random number generator.
+
+    Returns:
+        np.ndarray: The k centroids.
+    """
+    if distance_metric == DistanceMetric.cosine:
+        sample = _normalize(sample)
+    centroids = np.empty((k, sample.shape[1]), np.float32)
+    centroids[0] = sample[rng.integers(len(sample))]
+    closest = pairwise_distances(sample, centroids[:1], distance_metric)[:, 0]
+    for i in range(1, k):
+        weights = np.nan_to_num(np.maximum(closest, 0) ** 2)
+        total = weights.sum()
+        # all remaining rows coincide with a centroid
+        index = (
+            rng.choice(len(sample), p=weights / total) if total > 0
+            else rng.integers(len(sample))
+        )
+        centroids[i] = sample[index]
+        closest = np.minimum(
+            closest,
+            pairwise_distances(sample, centroids[i:i + 1], distance_metric)[:, 0],
+        )
+    return centroids
+
+
+def assign_clusters(
+    vectors: np.ndarray,
+    centroids: np.ndarray,
+    distance_metric: DistanceMetric,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the nearest centroid of each vector.
+
+    Args:
+        vectors (np.ndarray): The float32 vectors, one per row.
+        centroids (np.ndarray): The centroids, one per row.
+        distance_metric (DistanceMetric): The distance metric of the clustering.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The index of the nearest centroid of
+            each vector and the distance to it.
+    """
+    distances = np.nan_to_num(
+        pairwise_distances(vectors, centroids, distance_metric),
+        nan=np.inf,
+    )
+    labels = np.argmin(distances, axis=1)
+    return labels, distances[np.arange(len(vectors)), labels]
+
+
+def minibatch_step(
+    centroids: np.ndarray,
+    counts: np.ndarray,
+    batch: np.ndarray,
+    distance_metric: DistanceMetric,
+) -> float:
+    """Update the centroids in place with one mini-batch.
+
+    Each centroid moves towards the mean of its assigned vectors, with a
+    learning rate that decays with the number of vectors it was assigned so
+    far (Sculley, "Web-scale k-means clustering", 2010).
+
+    Args:
+        centroids (np.ndarray): The centroids, updated in place.
+        counts (np.ndarray): The number of vectors assigned to each centroid
+            so far, updated in place.
+        batch (np.ndarray): The float32 vectors of the batch, one per row.
+        distance_metric (DistanceMetric): The distance metric of the clustering.
+
+    Returns:
+        float: The largest distance a centroid moved.
+    """
+    if distance_metric == DistanceMetric.cosine:
+        batch = _normalize(batch)
+    labels, _ = assign_clusters(batch, centroids, distance_metric)
+    k = len(centroids)
+    batch_counts = np.bincount(labels, minlength=k)
+    sums = np.zeros_like(centroids, dtype=np.float64)
+    np.add.at(sums, labels, batch)
+    counts += batch_counts
+    assigned = batch_counts > 0
+    previous = centroids[assigned].copy()
+    centroids[assigned] += (
+        sums[assigned] - batch_counts[assigned, None] * centroids[assigned]
+    ) / counts[assigned, None]
+    if distance_metric == DistanceMetric.cosine:
+        centroids[assigned] = _normalize(centroids[assigned])
+    if not assigned.any():
+        return 0.0
+    return float(np.linalg.norm(centroids[assigned] - previous, axis=1).max())
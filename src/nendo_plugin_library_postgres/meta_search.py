@@ -0,0 +1,106 @@
+# -*- encoding: utf-8 -*-
+"""Helpers for trigram indexes over the meta data of tracks.
+
+Substring searches over `tracks.meta`, i.e. `ILIKE '%value%'`, can only use an
+index with the `pg_trgm` extension. To search over all meta data values at
+once, the values of each track are flattened into a single text by the
+`nendo_meta_values()` function, whose result is indexed. The values of single
+keys can be indexed separately.
+
+Exact matches are checked by JSONB containment (`@>`), which can use a GIN index
+once `tracks.meta` has been migrated from `json` to `jsonb`.
+"""
+
+import hashlib
+from enum import Enum
+
+META_VALUES_FUNCTION = "nendo_meta_values"
+META_VALUES_INDEX = "ix_tracks_meta_values_trgm"
+META_CONTAINMENT_INDEX = "ix_tracks_meta_jsonb_path"
+
+
+class MetaMatch(str, Enum):
+    """Enum representing the ways in which `search_meta` values are matched.
+
+    - fuzzy: The value contains all search terms, ignoring case (`ILIKE`).
+    - exact: The value equals one of the search terms (`@>`).
+    - full_text: The value contains all words of the search terms, see
+      `text_search.py`.
+    """
+
+    fuzzy: str = "fuzzy"
+    exact: str = "exact"
+    full_text: str = "full_text"
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def create_meta_values_function_sql(jsonb: bool = False) -> str:
+    """Build the statement creating the function flattening a track's meta data.
+
+    The values are separated by newlines. Meta data that is not a JSON object
+    has no values.
+
+    Args:
+        jsonb (bool): Whether to create the variant for `jsonb` meta data
+            instead of `json`. Defaults to False.
+
+    Returns:
+        str: The `CREATE FUNCTION` statement.
+    """
+    json_type = "jsonb" if jsonb else "json"
+    return (
+        f"CREATE OR REPLACE FUNCTION {META_VALUES_FUNCTION}(meta {json_type}) "  # noqa: S608
+        "RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ "
+        f"SELECT string_agg(value, E'\\n') FROM {json_type}_each_text("
+        f"CASE WHEN {json_type}_typeof(meta) = 'object' THEN meta END) $$"
+    )
+
+
+def create_meta_values_index_sql(concurrently: bool = False) -> str:
+    """Build the DDL statement indexing the flattened meta data of all tracks."""
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"{META_VALUES_INDEX} ON tracks "
+        f"USING gin ({META_VALUES_FUNCTION}(meta) gin_trgm_ops)"
+    )
+
+
+def meta_index_name(key: str) -> str:
+    """Return the name of the trigram index over the values of a meta data key.
+
+    The key is hashed to stay below Postgres' 63 character limit for identifiers.
+    """
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]  # noqa: S324
+    return f"ix_tracks_meta_trgm_{digest}"
+
+
+def create_meta_index_sql(key: str, concurrently: bool = False) -> str:
+    """Build the DDL statement indexing the values of a meta data key.
+
+    Args:
+        key (str): The meta data key.
+        concurrently (bool): Whether to build the index without locking writes
+            to the tracks table. Defaults to False.
+
+    Returns:
+        str: The `CREATE INDEX` statement.
+    """
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"{meta_index_name(key)} ON tracks "
+        f"USING gin ((meta ->> {_quote_literal(key)}) gin_trgm_ops)"
+    )
+
+
+def create_meta_containment_index_sql(concurrently: bool = False) -> str:
+    """Build the DDL statement creating the GIN index for exact meta data matches.
+
+    Requires `tracks.meta` to be of type `jsonb`.
+    """
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"{META_CONTAINMENT_INDEX} ON tracks USING gin (meta jsonb_path_ops)"
+    )
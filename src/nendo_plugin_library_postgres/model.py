@@ -4,25 +4,230 @@
 import uuid
 
 import pgvector.sqlalchemy
-from sqlalchemy import Column, ForeignKey, String
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    DDL,
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+    UniqueConstraint,
+    event,
+    func,
+    literal_column,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import relationship
 
 from nendo.library import model
 
+from .partitions import create_default_partition_sql
+from .text_search import create_track_documents_sql
+
 Base = model.Base
 
 
 class NendoEmbeddingDB(Base):
+    """An embedding of a track in an embedding space."""
+
     __tablename__ = "embeddings"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), default=uuid.uuid4)  # noqa: A003
     track_id = Column(UUID(as_uuid=True), ForeignKey("tracks.id"))
     user_id = Column(UUID(as_uuid=True))
-    plugin_name = Column(String)
-    plugin_version = Column(String)
+    plugin_name = Column(String, nullable=False)
+    plugin_version = Column(String, nullable=False)
     text = Column(String)
     embedding = Column(pgvector.sqlalchemy.Vector())
 
     # Relationship to NendoTrack
     track = relationship("NendoTrackDB")
+
+    __table_args__ = (
+        # the partition keys have to be part of the primary key
+        PrimaryKeyConstraint("id", "plugin_name", "plugin_version"),
+        # the embedding space filter of nearest neighbor searches
+        Index("ix_embeddings_space", "user_id", "plugin_name", "plugin_version"),
+        Index("ix_embeddings_track_id", "track_id"),
+        # see `partitions.py`
+        {"postgresql_partition_by": "LIST (plugin_name)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+
+# the conflict target of `upsert_embeddings()`, where embeddings without a text
+# are keyed by the empty text, as NULLs would never conflict
+Index(
+    "uq_embeddings_track_text",
+    NendoEmbeddingDB.track_id,
+    NendoEmbeddingDB.plugin_name,
+    NendoEmbeddingDB.plugin_version,
+    func.coalesce(NendoEmbeddingDB.text, literal_column("''")),
+    unique=True,
+)
+
+# embeddings of spaces without a partition of their own
+event.listen(
+    NendoEmbeddingDB.__table__,
+    "after_create",
+    DDL(create_default_partition_sql()),
+)
+
+
+class NendoEmbeddingSpaceDB(Base):
+    """The declared dimensions and index quantization of an embedding space."""
+
+    __tablename__ = "embedding_spaces"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # noqa: A003
+    plugin_name = Column(String, nullable=False)
+    plugin_version = Column(String, nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    # the `VectorQuantization` of the space's ANN indexes, NULL for full precision
+    quantization = Column(String, nullable=True)
+
+    __table_args__ = (UniqueConstraint("plugin_name", "plugin_version"),)
+
+
+class NendoNeighborGraphDB(Base):
+    """A precomputed k nearest neighbor graph of a user's embedding space."""
+
+    __tablename__ = "neighbor_graphs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # noqa: A003
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    plugin_name = Column(String, nullable=False)
+    plugin_version = Column(String, nullable=False)
+    distance_metric = Column(String, nullable=False)
+    k = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "plugin_name", "plugin_version", "distance_metric"),
+    )
+
+
+class NendoTrackNeighborDB(Base):
+    """An edge of a neighbor graph, from a track to one of its neighbors."""
+
+    __tablename__ = "track_neighbors"
+
+    graph_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("neighbor_graphs.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    track_id = Column(UUID(as_uuid=True), nullable=False)
+    neighbor_id = Column(UUID(as_uuid=True), nullable=False)
+    distance = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # the neighbors of a track are read with a single index range scan
+        PrimaryKeyConstraint("graph_id", "track_id", "neighbor_id"),
+        # the tracks that have a removed track as their neighbor
+        Index("ix_track_neighbors_neighbor_id", "neighbor_id"),
+    )
+
+
+class NendoClusteringDB(Base):
+    """A named k-means clustering of a user's embedding space."""
+
+    __tablename__ = "clusterings"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # noqa: A003
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    plugin_name = Column(String, nullable=False)
+    plugin_version = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    distance_metric = Column(String, nullable=False)
+    k = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "plugin_name", "plugin_version", "name"),
+    )
+
+
+class NendoClusterCentroidDB(Base):
+    """The centroid of a cluster of a clustering."""
+
+    __tablename__ = "cluster_centroids"
+
+    clustering_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("clusterings.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    cluster = Column(Integer, nullable=False)
+    centroid = Column(pgvector.sqlalchemy.Vector(), nullable=False)
+
+    __table_args__ = (PrimaryKeyConstraint("clustering_id", "cluster"),)
+
+
+class NendoTrackClusterDB(Base):
+    """The assignment of a track to a cluster of a clustering."""
+
+    __tablename__ = "track_clusters"
+
+    clustering_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("clusterings.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    track_id = Column(UUID(as_uuid=True), nullable=False)
+    cluster = Column(Integer, nullable=False)
+    # the distance of the track's closest embedding to the cluster's centroid
+    distance = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # each track is assigned to a single cluster per clustering
+        PrimaryKeyConstraint("clustering_id", "track_id"),
+        # the tracks of a cluster, closest to the centroid first
+        Index("ix_track_clusters_cluster", "clustering_id", "cluster", "distance"),
+        # the clusterings of a removed track
+        Index("ix_track_clusters_track_id", "track_id"),
+    )
+
+
+class NendoTrackVectorDB(Base):
+    """The pooled vector of a track's embeddings in an embedding space."""
+
+    __tablename__ = "track_vectors"
+
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    plugin_name = Column(String, nullable=False)
+    plugin_version = Column(String, nullable=False)
+    track_id = Column(UUID(as_uuid=True), nullable=False)
+    # the mean of the track's embeddings in the embedding space
+    embedding = Column(pgvector.sqlalchemy.Vector(), nullable=False)
+    num_embeddings = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # leads with the embedding space filter of nearest neighbor searches
+        PrimaryKeyConstraint("user_id", "plugin_name", "plugin_version", "track_id"),
+        Index("ix_track_vectors_track_id", "track_id"),
+    )
+
+
+class NendoTrackDocumentDB(Base):
+    """The full text search document of a track."""
+
+    __tablename__ = "track_documents"
+
+    track_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("tracks.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # the words of the track's meta data values and embedding texts
+    document = Column(TSVECTOR, nullable=False)
+
+    __table_args__ = (
+        Index("ix_track_documents_document", "document", postgresql_using="gin"),
+    )
+
+
+# the triggers maintaining the documents, see `text_search.py`
+NendoTrackDocumentDB.__table__.add_is_dependent_on(NendoEmbeddingDB.__table__)
+for statement in create_track_documents_sql():
+    event.listen(NendoTrackDocumentDB.__table__, "after_create", DDL(statement))
@@ -0,0 +1,137 @@
+# -*- encoding: utf-8 -*-
+"""Blocked exact k-nearest-neighbor computation over embedding matrices."""
+
+from typing import Iterator, Tuple
+
+import numpy as np
+from nendo import DistanceMetric
+
+# number of distances computed per block, i.e. 128 MiB in float32 and 256 MiB
+# in float64, plus temporaries of the same size while they are computed
+MAX_BLOCK_ELEMENTS = 32 * 1024 * 1024
+
+
+def pairwise_distances(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    distance_metric: DistanceMetric,
+) -> np.ndarray:
+    """Compute the distances between all rows of two matrices.
+
+    The matrix counterpart of `vector_cache.exact_distances()`, with the
+    distances defined the same way as pgvector's distance operators.
+
+    Args:
+        queries (np.ndarray): The float32 query vectors, one per row.
+        matrix (np.ndarray): The float32 matrix of vectors, one per row.
+        distance_metric (DistanceMetric): The distance metric to use.
+
+    Raises:
+        ValueError: If the distance metric is not supported.
+
+    Returns:
+        np.ndarray: The distances, with one row per query and one column per
+            row of the matrix.
+    """
+    products = queries @ matrix.T
+    if distance_metric == DistanceMetric.euclidean:
+        # |a - b|^2 = |a|^2 - 2ab + |b|^2, clipped to counter rounding errors
+        squared = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            - 2 * products
+            + np.einsum("ij,ij->i", matrix, matrix)[None, :]
+        )
+        return np.sqrt(np.maximum(squared, 0))
+    if distance_metric == DistanceMetric.cosine:
+        norms = np.outer(
+            np.linalg.norm(queries, axis=1),
+            np.linalg.norm(matrix, axis=1),
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 1 - products / norms
+    if distance_metric == DistanceMetric.max_inner_product:
+        return -products
+    raise ValueError(
+        f"Got unexpected value for distance: {distance_metric}. "
+        f"Should be one of {', '.join([ds.value for ds in DistanceMetric])}.",
+    )
+
+
+def group_rows(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Group the rows of a matrix by a key, e.g. by their track ID.
+
+    Args:
+        keys (np.ndarray): The key of each row.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The unique keys, the order
+            that sorts the rows by key, and the index of the first sorted row
+            of each key.
+    """
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.flatnonzero(np.diff(inverse[order], prepend=-1))
+    return unique_keys, order, starts
+
+
+def group_nearest_neighbors(
+    matrix: np.ndarray,
+    starts: np.ndarray,
+    k: int,
+    distance_metric: DistanceMetric,
+    max_block_elements: int = MAX_BLOCK_ELEMENTS,
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Find the k nearest groups of every group of rows of a matrix.
+
+    The distance between two groups is the smallest distance between any of
+    their rows. A group is not its own neighbor. Distances are computed in
+    blocks of groups, so that at most `max_block_elements` distances are held
+    in memory at once.
+
+    Args:
+        matrix (np.ndarray): The float32 vectors, sorted by group.
+        starts (np.ndarray): The index of the first row of each group.
+        k (int): The number of neighbors per group.
+        distance_metric (DistanceMetric): The distance metric to use.
+        max_block_elements (int): The maximum size of a block of distances.
+
+    Yields:
+        Tuple[int, np.ndarray, np.ndarray]: The index of the first group of a
+            block, and the group indexes and distances of the neighbors of
+            each group of the block, ordered by distance. Rows are padded with
+            -1 and inf if fewer than k neighbors exist.
+    """
+    num_rows, num_groups = len(matrix), len(starts)
+    k = min(k, num_groups - 1)
+    if k <= 0:
+        return
+    grouped = num_groups < num_rows
+    rows_per_block = max(1, max_block_elements // max(num_rows, 1))
+    ends = np.append(starts[1:], num_rows)
+    first = 0
+    while first < num_groups:
+        # the block ends at the last group whose rows still fit
+        last = max(
+            first + 1,
+            int(np.searchsorted(ends, starts[first] + rows_per_block, side="right")),
+        )
+        last = min(last, num_groups)
+        block = pairwise_distances(
+            matrix[starts[first]:ends[last - 1]],
+            matrix,
+            distance_metric,
+        )
+        if grouped:
+            block = np.minimum.reduceat(block, starts, axis=1)
+            block = np.minimum.reduceat(block, starts[first:last] - starts[first], axis=0)
+        # NaN distances of zero vectors never make them neighbors
+        block[np.isnan(block)] = np.inf
+        block[np.arange(last - first), np.arange(first, last)] = np.inf
+        neighbors = np.argpartition(block, k - 1, axis=1)[:, :k]
+        distances = np.take_along_axis(block, neighbors, axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")
+        neighbors = np.take_along_axis(neighbors, order, axis=1)
+        distances = np.take_along_axis(distances, order, axis=1)
+        neighbors[np.isinf(distances)] = -1
+        yield first, neighbors, distances
+        first = last
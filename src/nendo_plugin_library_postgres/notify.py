@@ -0,0 +1,195 @@
+# -*- encoding: utf-8 -*-
+"""Change notifications between library instances via Postgres LISTEN/NOTIFY."""
+
+import json
+import logging
+import select
+import threading
+import uuid
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import Engine, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("nendo")
+
+CHANNEL = "nendo_library_changes"
+
+# seconds to wait for notifications before checking whether to stop
+POLL_TIMEOUT = 1.0
+# seconds to wait before reconnecting after the connection was lost
+RECONNECT_DELAY = 5.0
+
+
+class ChangeEntity(str, Enum):
+    """Enum representing the kinds of objects a change event can refer to."""
+
+    embedding: str = "embedding"
+    track: str = "track"
+    plugin_data: str = "plugin_data"
+    library: str = "library"
+    neighbor_graph: str = "neighbor_graph"
+    clustering: str = "clustering"
+
+
+class ChangeAction(str, Enum):
+    """Enum representing the kinds of changes."""
+
+    insert: str = "insert"
+    update: str = "update"
+    delete: str = "delete"
+    reset: str = "reset"
+    # the listener lost its connection, so events might have been missed
+    resync: str = "resync"
+
+
+def change_event(
+    origin: str,
+    entity: ChangeEntity,
+    action: ChangeAction,
+    **fields: Any,
+) -> Dict[str, Any]:
+    """Build a change event.
+
+    Args:
+        origin (str): ID of the library instance that made the change.
+        entity (ChangeEntity): The kind of object that was changed.
+        action (ChangeAction): The kind of change.
+        **fields: Identifiers of the changed objects, e.g. `track_id` or
+            `plugin_name`. Values that are None are omitted.
+
+    Returns:
+        Dict[str, Any]: The event, as it is received by listeners.
+    """
+    event = {
+        "origin": origin,
+        "entity": ChangeEntity(entity).value,
+        "action": ChangeAction(action).value,
+    }
+    event.update({k: str(v) for k, v in fields.items() if v is not None})
+    return event
+
+
+def notify(session: Session, event: Dict[str, Any]) -> None:
+    """Send a change event as part of the session's current transaction.
+
+    Postgres only delivers the notification once the transaction commits,
+    and drops it if the transaction is rolled back.
+
+    Args:
+        session (Session): The session in which the change is made.
+        event (Dict[str, Any]): The event, as returned by `change_event()`.
+    """
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": json.dumps(event)},
+    )
+
+
+class ChangeListener(threading.Thread):
+    """Daemon thread receiving change events on a dedicated database connection.
+
+    The connection is taken from the library's engine and switched to
+    autocommit mode, as notifications are only received outside of
+    transactions. If the connection is lost, the listener reconnects and
+    reports a `resync` event, as events might have been missed in between.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        callback: Callable[[Dict[str, Any]], None],
+        origin: Optional[str] = None,
+    ) -> None:
+        """Create a listener passing the events of other origins to `callback`."""
+        super().__init__(name="nendo-change-listener", daemon=True)
+        self.engine = engine
+        self.callback = callback
+        self.origin = origin
+        self._stop_event = threading.Event()
+        self._connection = None
+
+    def _listen(self) -> Any:
+        connection = self.engine.raw_connection()
+        dbapi_connection = connection.driver_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        self._connection = connection
+        return dbapi_connection
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            try:
+                # do not return a connection in autocommit mode to the pool
+                self._connection.invalidate()
+            except Exception as e:  # noqa: BLE001
+                logger.debug("Failed to close the change listener connection: %s", e)
+            self._connection = None
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed change event: %s", payload)
+            return
+        if self.origin is not None and event.get("origin") == self.origin:
+            return
+        try:
+            self.callback(event)
+        except Exception as e:  # noqa: BLE001
+            logger.error("Failed to handle change event %s: %s", event, e)
+
+    def run(self) -> None:  # noqa: D102
+        connected_before = False
+        while not self._stop_event.is_set():
+            try:
+                dbapi_connection = self._listen()
+                if connected_before:
+                    self._dispatch(
+                        json.dumps(
+                            change_event(
+                                origin="",
+                                entity=ChangeEntity.library,
+                                action=ChangeAction.resync,
+                            ),
+                        ),
+                    )
+                connected_before = True
+                while not self._stop_event.is_set():
+                    readable, _, _ = select.select(
+                        [dbapi_connection], [], [], POLL_TIMEOUT,
+                    )
+                    if len(readable) == 0:
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self._dispatch(dbapi_connection.notifies.pop(0).payload)
+            except Exception as e:  # noqa: BLE001
+                if self._stop_event.is_set():
+                    break
+                logger.warning(
+                    "Change listener lost its connection: %s. "
+                    "Reconnecting in %.0f seconds.",
+                    e,
+                    RECONNECT_DELAY,
+                )
+                self._stop_event.wait(RECONNECT_DELAY)
+            finally:
+                self._close()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop listening and wait for the thread to finish.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the thread.
+        """
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout=timeout)
+
+
+def new_origin() -> str:
+    """Return a new ID identifying a library instance as the origin of changes."""
+    return uuid.uuid4().hex
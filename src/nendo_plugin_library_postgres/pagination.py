@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+"""Opaque cursors for seek ("keyset") pagination.
+
+Instead of skipping `offset` rows, which the database has to produce and throw
+away on every page, a cursor remembers the sort key of the last row of a page,
+so the next page starts right after it. The cursors are URL-safe base64 encoded
+JSON, tagged with the kind of query they belong to.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import uuid
+from enum import Enum
+from typing import Any, Dict, Iterable, Optional
+
+# pass as the cursor to get the first page of a paginated query
+FIRST_PAGE = ""
+
+
+class CursorKind(str, Enum):
+    """Enum representing the queries a cursor can continue.
+
+    - filter: `filter_tracks_by_meta()` and `filter_related_tracks_by_meta()`,
+      seeking by the `order_by` key and track ID.
+    - nearest: `nearest_by_vector_with_score()`, seeking by the distance and
+      embedding ID.
+    """
+
+    filter: str = "filter"  # noqa: A003
+    nearest: str = "nearest"
+
+
+# the values a cursor of each kind has to carry to continue its query
+_CURSOR_KEYS = {
+    CursorKind.filter: ("order_by", "order", "value", "id"),
+    CursorKind.nearest: ("distance", "id", "depth"),
+}
+
+
+class Page(list):
+    """A page of results, with the cursor pointing to the next page.
+
+    Attributes:
+        next_cursor (str, optional): The cursor to pass to get the next page, or
+            None if this is the last page.
+    """
+
+    def __init__(self, items: Iterable[Any] = (), next_cursor: Optional[str] = None):
+        """Create a page of the given items."""
+        super().__init__(items)
+        self.next_cursor = next_cursor
+
+
+def _encode_value(value: Any) -> Any:
+    # JSON has no UUIDs and dates, so they are tagged to be restored
+    if isinstance(value, uuid.UUID):
+        return {"uuid": str(value)}
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "uuid" in value:
+            return uuid.UUID(value["uuid"])
+        if "datetime" in value:
+            return datetime.datetime.fromisoformat(value["datetime"])
+    return value
+
+
+def encode_cursor(kind: CursorKind, **key: Any) -> str:
+    """Encode the sort key of the last result of a page as a cursor.
+
+    Args:
+        kind (CursorKind): The kind of query the cursor continues.
+        **key: The values of the sort key, and any other state of the query.
+
+    Returns:
+        str: The opaque cursor.
+    """
+    payload = {"kind": CursorKind(kind).value}
+    payload.update({name: _encode_value(value) for name, value in key.items()})
+    return base64.urlsafe_b64encode(
+        json.dumps(payload, separators=(",", ":")).encode("utf-8"),
+    ).decode("ascii")
+
+
+def decode_cursor(cursor: str, kind: CursorKind) -> Optional[Dict[str, Any]]:
+    """Decode a cursor of the given kind.
+
+    Args:
+        cursor (str): The cursor, as returned in the `next_cursor` of a page.
+        kind (CursorKind): The kind of query the cursor has to continue.
+
+    Raises:
+        ValueError: If the cursor is malformed, misses a value of its kind or
+            belongs to another kind of query.
+
+    Returns:
+        Optional[Dict[str, Any]]: The values encoded in the cursor, or None for
+            the `FIRST_PAGE`.
+    """
+    if cursor == FIRST_PAGE:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(payload, dict) or payload.pop("kind", None) != kind.value:
+        raise ValueError(f"Cursor does not belong to a {kind.value} query.")
+    if any(name not in payload for name in _CURSOR_KEYS[CursorKind(kind)]):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    try:
+        return {name: _decode_value(value) for name, value in payload.items()}
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+"""Helpers for partitioning the embeddings table by embedding space.
+
+The `embeddings` table is list partitioned by `plugin_name`, and each plugin's
+partition is list partitioned by `plugin_version` in turn, as Postgres can only
+list partition by a single column. Embeddings of plugins and versions without
+a partition of their own are stored in default partitions.
+"""
+
+import hashlib
+from typing import List
+
+DEFAULT_PARTITION = "embeddings_default"
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _digest(*parts: str) -> str:
+    # hashed to stay below Postgres' 63 character limit for identifiers
+    return hashlib.sha1("@".join(parts).encode()).hexdigest()[:16]  # noqa: S324
+
+
+def plugin_partition_name(plugin_name: str) -> str:
+    """Return the name of the partition of an embedding plugin."""
+    return f"embeddings_plugin_{_digest(plugin_name)}"
+
+
+def plugin_default_partition_name(plugin_name: str) -> str:
+    """Return the name of the default partition of an embedding plugin's versions."""
+    return f"{plugin_partition_name(plugin_name)}_default"
+
+
+def space_partition_name(plugin_name: str, plugin_version: str) -> str:
+    """Return the name of the partition of an embedding space."""
+    return f"embeddings_space_{_digest(plugin_name, plugin_version)}"
+
+
+def create_default_partition_sql() -> str:
+    """Build the DDL statement creating the default partition of the embeddings."""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} "
+        "PARTITION OF embeddings DEFAULT"
+    )
+
+
+def create_space_partition_sql(
+    plugin_name: str,
+    plugin_version: str,
+    plugin_partition_exists: bool,
+) -> List[str]:
+    """Build the statements creating the partition of an embedding space.
+
+    The partition is created detached, and the existing embeddings of the
+    space are moved into it from the default partition it was stored in,
+    before it is attached. If the plugin has no partition yet, it is created
+    the same way, with the space's partition and a default partition for its
+    other versions.
+
+    Args:
+        plugin_name (str): Name of the embedding plugin.
+        plugin_version (str): Version of the embedding plugin.
+        plugin_partition_exists (bool): Whether the plugin has a partition.
+
+    Returns:
+        List[str]: The statements, to be run in a single transaction.
+    """
+    plugin_partition = plugin_partition_name(plugin_name)
+    plugin_default = plugin_default_partition_name(plugin_name)
+    space_partition = space_partition_name(plugin_name, plugin_version)
+    name, version = _quote_literal(plugin_name), _quote_literal(plugin_version)
+    if plugin_partition_exists:
+        return [
+            f"CREATE TABLE {space_partition} (LIKE embeddings INCLUDING DEFAULTS)",
+            f"WITH moved AS (DELETE FROM {plugin_default} "  # noqa: S608
+            f"WHERE plugin_version = {version} RETURNING *) "
+            f"INSERT INTO {space_partition} SELECT * FROM moved",
+            f"ALTER TABLE {plugin_partition} ATTACH PARTITION {space_partition} "
+            f"FOR VALUES IN ({version})",
+        ]
+    return [
+        f"CREATE TABLE {plugin_partition} (LIKE embeddings INCLUDING DEFAULTS) "
+        "PARTITION BY LIST (plugin_version)",
+        f"CREATE TABLE {plugin_default} PARTITION OF {plugin_partition} DEFAULT",
+        f"CREATE TABLE {space_partition} PARTITION OF {plugin_partition} "
+        f"FOR VALUES IN ({version})",
+        # routed to the space's or the plugin's default partition
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "  # noqa: S608
+        f"WHERE plugin_name = {name} RETURNING *) "
+        f"INSERT INTO {plugin_partition} SELECT * FROM moved",
+        f"ALTER TABLE embeddings ATTACH PARTITION {plugin_partition} "
+        f"FOR VALUES IN ({name})",
+    ]
+
+
+def detach_space_partition_sql(plugin_name: str, plugin_version: str) -> str:
+    """Build the DDL statement detaching the partition of an embedding space."""
+    return (
+        f"ALTER TABLE {plugin_partition_name(plugin_name)} DETACH PARTITION "
+        f"{space_partition_name(plugin_name, plugin_version)}"
+    )
@@ -1,15 +1,46 @@
 # -*- encoding: utf-8 -*-
 """Nendo Postgresql library plugin."""
 
+import collections
+import functools
+import io
+import itertools
+import json
 import logging
+import os
+import tempfile
 import uuid
 from importlib import metadata
-from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import numpy.typing as npt
-from sqlalchemy import Engine, and_, asc, create_engine, text
-from sqlalchemy.exc import IntegrityError
+import pgvector.sqlalchemy
+from sqlalchemy import (
+    Engine,
+    Integer,
+    and_,
+    asc,
+    bindparam,
+    cast,
+    column,
+    create_engine,
+    delete,
+    distinct,
+    event,
+    exists,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    text,
+    true,
+    values,
+)
+from sqlalchemy.dialects.postgresql import JSONB, REAL, REGCONFIG, array
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.orm import noload, Query, Session
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -21,6 +52,7 @@ from nendo import (
     NendoEmbeddingCreate,
     NendoEmbeddingPlugin,
     NendoLibraryVectorExtension,
+    NendoPluginData,
     NendoStorage,
     NendoStorageLocalFS,
     NendoTrack,
@@ -29,17 +61,100 @@ from nendo import (
     SqlAlchemyNendoLibrary,
 )
 from nendo.library import model
+from nendo.schema import NendoPluginDataCreate, NendoTrackBase, NendoTrackCreate
 from nendo.utils import ensure_uuid
 
+from .adapters import register_vector_type
+from .bulk import (
+    EMBEDDING_COPY_COLUMNS,
+    EMBEDDING_READ_COLUMNS,
+    EmbeddingCopyDecoder,
+    encode_embeddings_copy,
+    vectors_to_binary,
+    vectors_to_float32,
+)
 from .config import PostgresConfig
-from .model import Base, NendoEmbeddingDB
+from .duplicates import DuplicateCluster, cluster_pairs, similarity_join
+from .kmeans import (
+    assign_clusters,
+    check_kmeans_distance_metric,
+    kmeans_plus_plus,
+    minibatch_step,
+    sample_rows,
+)
+from .model import (
+    Base,
+    NendoClusterCentroidDB,
+    NendoClusteringDB,
+    NendoEmbeddingDB,
+    NendoEmbeddingSpaceDB,
+    NendoNeighborGraphDB,
+    NendoTrackClusterDB,
+    NendoTrackDocumentDB,
+    NendoTrackNeighborDB,
+    NendoTrackVectorDB,
+)
+from .meta_search import (
+    META_CONTAINMENT_INDEX,
+    META_VALUES_FUNCTION,
+    META_VALUES_INDEX,
+    MetaMatch,
+    create_meta_index_sql,
+    meta_index_name,
+)
+from .neighbors import group_nearest_neighbors, group_rows, pairwise_distances
+from .notify import (
+    ChangeAction,
+    ChangeEntity,
+    ChangeListener,
+    change_event,
+    new_origin,
+    notify,
+)
+from .pagination import CursorKind, Page, decode_cursor, encode_cursor
+from .partitions import (
+    create_space_partition_sql,
+    detach_space_partition_sql,
+    plugin_partition_name,
+    space_partition_name,
+)
+from .result_cache import ResultCache, ResultCacheInfo, ResultCacheScope, make_key
 from .storage import NendoStorageGCS  # NendoStorageGCSTranscode
+from .text_search import (
+    TEXT_SEARCH_CONFIG,
+    HybridFusion,
+    refresh_track_documents_sql,
+)
+from .vector_cache import VectorCache
+from .vector_index import (
+    DEFAULT_EF_SEARCH,
+    MAX_EF_SEARCH,
+    SearchStrategy,
+    TrackAggregation,
+    VectorIndexMethod,
+    VectorQuantization,
+    all_vector_index_names,
+    create_vector_index_sql,
+    index_distance_metrics,
+    vector_index_name,
+)
 
 plugin_package = metadata.metadata(__package__ or __name__)
 plugin_config = PostgresConfig()
 # Base = declarative_base(metadata=MetaData())
 logger = logging.getLogger("nendo")
 
+# key of the changes to apply to the result cache once a session commits
+PENDING_CHANGES = "nendo_pending_changes"
+# bytes requested per read of binary COPY output
+COPY_READ_SIZE = 1024 * 1024
+# candidates fetched per track neighbor, as tracks can have several embeddings
+NEIGHBOR_OVERFETCH = 2
+# embeddings sampled per cluster to seed the k-means centroids
+KMEANS_SAMPLE_PER_CLUSTER = 64
+# largest centroid shift per epoch at which k-means has converged
+KMEANS_TOLERANCE = 1e-4
+
 
 class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
     config: NendoConfig = None
@@ -48,6 +163,19 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
     db: Engine = None
     embedding_plugin: Optional[NendoEmbeddingPlugin] = None
     storage_driver: NendoStorage = None
+    embedding_dimensions: Dict[Tuple[str, str], Optional[int]] = None
+    embedding_quantization: Dict[Tuple[str, str], Optional[VectorQuantization]] = None
+    neighbor_graph_spaces: Dict[Tuple[uuid.UUID, str, str], bool] = None
+    clustering_spaces: Dict[Tuple[uuid.UUID, str, str], bool] = None
+    shared_spaces: Dict[Tuple[str, str], bool] = None
+    space_sizes: Dict[Tuple[Optional[uuid.UUID], str, str], Tuple[int, bool]] = None
+    meta_values_indexed: Optional[bool] = None
+    meta_jsonb: Optional[bool] = None
+    iterative_scan_supported: Optional[bool] = None
+    vector_cache: Optional[VectorCache] = None
+    result_cache: Optional[ResultCache] = None
+    origin: str = None
+    change_listener: Optional[ChangeListener] = None
 
     def __init__(
             self,
@@ -59,6 +187,22 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         super().__init__(**kwargs, embedding_plugin=plugin_config.embedding_plugin)
         self.config = config
         self.plugin_config = plugin_config
+        self.embedding_dimensions = {}
+        self.embedding_quantization = {}
+        self.neighbor_graph_spaces = {}
+        self.clustering_spaces = {}
+        self.shared_spaces = {}
+        self.space_sizes = {}
+        self.origin = new_origin()
+        if self.plugin_config.vector_cache_enabled:
+            self.vector_cache = VectorCache(
+                max_bytes=self.plugin_config.vector_cache_max_bytes,
+            )
+        if self.plugin_config.result_cache_enabled:
+            self.result_cache = ResultCache(
+                max_entries=self.plugin_config.result_cache_max_entries,
+                ttl=self.plugin_config.result_cache_ttl,
+            )
         if self.plugin_config.storage_location == ResourceLocation.gcs:
             self.logger.info("Using GCS storage backend.")
             self.storage_driver = NendoStorageGCS(  # NendoStorageGCSTranscode(
@@ -78,6 +222,8 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             )
         self._connect(db)
         self.storage_driver.init_storage_for_user(user_id=str(self.user.id))
+        if self.plugin_config.change_listener_enabled:
+            self.start_change_listener()
 
     def _connect(
             self,
@@ -93,6 +239,8 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             f"{self.plugin_config.postgres_db}"
         )
         self.db = db or create_engine(engine_string)
+        if not event.contains(self.db, "connect", register_vector_type):
+            event.listen(self.db, "connect", register_vector_type)
         try:
             Base.metadata.create_all(bind=self.db)
         except IntegrityError as e:
@@ -110,30 +258,110 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         #     self.user = self.default_user
         self.user = self.default_user
 
-    def _pg_distance(self, distance_metric: DistanceMetric) -> Any:
+    def _pg_distance(
+        self,
+        distance_metric: DistanceMetric,
+        dimensions: Optional[int] = None,
+        quantization: Optional[VectorQuantization] = None,
+        column: Optional[Any] = None,
+        exact: bool = False,
+    ) -> Any:
+        # casting to a fixed number of dimensions matches the expression
+        # of the ANN indexes created by `create_vector_index()`. Exact
+        # distances leave out the cast, so that the planner can not order
+        # them by an (approximate) index scan
+        column = column if column is not None else NendoEmbeddingDB.embedding
+        if exact:
+            dimensions = quantization = None
+        if quantization is not None:
+            return self._pg_quantized_distance(
+                distance_metric=distance_metric,
+                dimensions=dimensions,
+                quantization=quantization,
+                column=column,
+            )
+        embedding = (
+            column
+            if dimensions is None
+            else cast(column, pgvector.sqlalchemy.Vector(dimensions))
+        )
         if distance_metric == DistanceMetric.euclidean:
-            return NendoEmbeddingDB.embedding.l2_distance
+            return embedding.l2_distance
         if distance_metric == DistanceMetric.cosine:
-            return NendoEmbeddingDB.embedding.cosine_distance
+            return embedding.cosine_distance
         if distance_metric == DistanceMetric.max_inner_product:
-            return NendoEmbeddingDB.embedding.max_inner_product
+            return embedding.max_inner_product
         raise ValueError(
             f"Got unexpected value for distance: {distance_metric}. "
             f"Should be one of {', '.join([ds.value for ds in DistanceMetric])}.",
         )
 
+    def _pg_quantized_distance(
+        self,
+        distance_metric: DistanceMetric,
+        dimensions: int,
+        quantization: VectorQuantization,
+        column: Any,
+    ) -> Callable[[Any], Any]:
+        """Return the distance between quantized vectors, as used by quantized indexes.
+
+        The query vector is quantized the same way as the stored vectors.
+        Binary quantized vectors are compared by Hamming distance, regardless
+        of the distance metric.
+        """
+        if VectorQuantization(quantization) == VectorQuantization.bit:
+            embedding = cast(
+                func.binary_quantize(
+                    cast(column, pgvector.sqlalchemy.VECTOR(dimensions)),
+                ),
+                pgvector.sqlalchemy.BIT(dimensions),
+            )
+            return lambda vec: embedding.hamming_distance(
+                func.binary_quantize(cast(vec, pgvector.sqlalchemy.VECTOR(dimensions))),
+            )
+        embedding = cast(column, pgvector.sqlalchemy.HALFVEC(dimensions))
+        distance = {
+            DistanceMetric.euclidean: embedding.l2_distance,
+            DistanceMetric.cosine: embedding.cosine_distance,
+            DistanceMetric.max_inner_product: embedding.max_inner_product,
+        }[DistanceMetric(distance_metric)]
+        return lambda vec: distance(cast(vec, pgvector.sqlalchemy.HALFVEC(dimensions)))
+
     def _get_meta_filter_query(
         self,
         query: Query,
         search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
     ) -> Query:
         # apply meta data filter
         query_local = query
         if search_meta and len(search_meta) > 0:
+            meta_match = MetaMatch(meta_match)
+            json_type = "jsonb" if self._is_meta_jsonb() else "json"
             conditions = []
             for search_key, search_values in search_meta.items():
+                if meta_match == MetaMatch.exact:
+                    conditions.append(
+                        or_(
+                            *[
+                                self._get_meta_equals_condition(
+                                    search_key=search_key,
+                                    value=value,
+                                )
+                                for value in search_values
+                            ],
+                        ),
+                    )
+                elif meta_match == MetaMatch.full_text:
+                    conditions.extend(
+                        self._get_meta_full_text_condition(
+                            search_key=search_key,
+                            value=value,
+                        )
+                        for value in search_values
+                    )
                 # if specific key is given
-                if len(search_key) > 0:
+                elif len(search_key) > 0:
                     for value in search_values:
                         conditions.append(
                             model.NendoTrackDB.meta[search_key].astext.ilike(f"%{value}%"),
@@ -141,18 +369,62 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
                 # if key is empty string, search over all values
                 else:
                     for value in search_values:
-                        json_value_filter = text("""
+                        json_value_filter = text(f"""
                             EXISTS (
                                 SELECT 1
-                                FROM json_each_text(tracks.meta) AS meta
+                                FROM {json_type}_each_text(tracks.meta) AS meta
                                 WHERE meta.value ILIKE :value_like
                             )
-                        """).bindparams(value_like=f"%{value}%")
+                        """).bindparams(  # noqa: S608
+                            # several values must not share a parameter
+                            bindparam("value_like", f"%{value}%", unique=True),
+                        )
+                        if self._is_meta_values_indexed():
+                            # the trigram index finds the candidates, whose
+                            # values are then checked one by one
+                            json_value_filter = and_(
+                                getattr(func, META_VALUES_FUNCTION)(
+                                    model.NendoTrackDB.meta,
+                                ).ilike(f"%{value}%"),
+                                json_value_filter,
+                            )
                         conditions.append(json_value_filter)
             combined_condition = and_(*conditions)
             query_local = query_local.filter(combined_condition)
         return query_local
 
+    def _get_meta_equals_condition(self, search_key: str, value: Any) -> Any:
+        """Build the condition of an exact match of a meta data value."""
+        # a no-op on `jsonb` meta data, whose GIN index is used then
+        meta = cast(model.NendoTrackDB.meta, JSONB)
+        if len(search_key) > 0:
+            return meta.contains({search_key: value})
+        return text("""
+            EXISTS (
+                SELECT 1
+                FROM jsonb_each(CAST(tracks.meta AS jsonb)) AS meta
+                WHERE meta.value = CAST(:value_json AS jsonb)
+            )
+        """).bindparams(bindparam("value_json", json.dumps(value), unique=True))
+
+    def _get_meta_full_text_condition(self, search_key: str, value: str) -> Any:
+        """Build the condition of a full-text match of a meta data value."""
+        tsquery = func.websearch_to_tsquery(
+            cast(TEXT_SEARCH_CONFIG, REGCONFIG),
+            value,
+        )
+        if len(search_key) > 0:
+            # not indexed, as the documents mix the values of all keys
+            return func.to_tsvector(
+                cast(TEXT_SEARCH_CONFIG, REGCONFIG),
+                model.NendoTrackDB.meta[search_key].astext,
+            ).op("@@")(tsquery)
+        return model.NendoTrackDB.id.in_(
+            select(NendoTrackDocumentDB.track_id).where(
+                NendoTrackDocumentDB.document.op("@@")(tsquery),
+            ),
+        )
+
     @property
     def distance_metric(self) -> Any:  # noqa: D102
         return self._pg_distance(self._default_distance)
@@ -185,9 +457,25 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             session.query(model.CollectionCollectionRelationshipDB).delete()
             # delete all plugin data
             session.query(model.NendoPluginDataDB).delete()
+            # delete all neighbor graphs, including their track neighbors
+            session.query(NendoNeighborGraphDB).delete()
+            # delete all clusterings, including their centroids and track clusters
+            session.query(NendoClusteringDB).delete()
+            # delete all pooled track vectors
+            session.query(NendoTrackVectorDB).delete()
             # delete all embeddings
             session.query(NendoEmbeddingDB).delete()
+            self._notify(
+                session=session,
+                entity=ChangeEntity.library,
+                action=ChangeAction.reset,
+                user_id=user_id,
+            )
             session.commit()
+            if self.vector_cache is not None:
+                self.vector_cache.invalidate()
+            self.neighbor_graph_spaces.clear()
+            self.clustering_spaces.clear()
             # delete all collections
             session.query(model.NendoCollectionDB).delete()
             # delete all tracks
@@ -205,35 +493,180 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             remove_embeddings: bool = True,
             user_id: Optional[Union[str, uuid.UUID]] = None,
     ) -> bool:
-        embeddings = self.get_embeddings(track_id=ensure_uuid(track_id))
-        if len(embeddings) > 0:
-            if remove_embeddings:
-                with self.session_scope() as session:
-                    logger.info("Removing %d embeddings", len(embeddings))
-                    session.query(NendoEmbeddingDB).filter(
-                        NendoEmbeddingDB.track_id == track_id,
-                    ).delete()
-                    session.commit()
-            else:
-                logger.warning(
-                    "Cannot remove due to %d existing "
-                    "embedding entries. Set `remove_embeddings=True` "
-                    "to remove them.",
-                    len(embeddings),
+        track_id = ensure_uuid(track_id)
+        # count and delete through the track_id index, without loading vectors
+        with self.session_scope() as session:
+            embeddings = session.query(NendoEmbeddingDB).filter(
+                NendoEmbeddingDB.track_id == track_id,
+            )
+            num_embeddings = (
+                embeddings.delete() if remove_embeddings
+                else embeddings.count()
+            )
+            if num_embeddings > 0:
+                if not remove_embeddings:
+                    logger.warning(
+                        "Cannot remove due to %d existing "
+                        "embedding entries. Set `remove_embeddings=True` "
+                        "to remove them.",
+                        num_embeddings,
+                    )
+                    return False
+                logger.info("Removing %d embeddings", num_embeddings)
+                self._notify(
+                    session=session,
+                    entity=ChangeEntity.embedding,
+                    action=ChangeAction.delete,
+                    track_id=track_id,
                 )
-                return False
-        return super().remove_track(
+            self._remove_track_neighbors(session=session, track_id=track_id)
+            session.query(NendoTrackClusterDB).filter(
+                NendoTrackClusterDB.track_id == track_id,
+            ).delete()
+            session.query(NendoTrackVectorDB).filter(
+                NendoTrackVectorDB.track_id == track_id,
+            ).delete()
+            session.commit()
+        if num_embeddings > 0 and self.vector_cache is not None:
+            self.vector_cache.remove_track(track_id)
+        removed = super().remove_track(
             track_id=track_id,
             remove_relationships=remove_relationships,
             remove_plugin_data=remove_plugin_data,
             remove_resources=remove_resources,
             user_id=user_id,
         )
+        if removed:
+            with self.session_scope() as session:
+                self._notify(
+                    session=session,
+                    entity=ChangeEntity.track,
+                    action=ChangeAction.delete,
+                    track_id=track_id,
+                )
+        return removed
+
+    def get_tracks_by_ids(
+        self,
+        track_ids: List[Union[str, uuid.UUID]],
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> List[NendoTrack]:
+        """Get several tracks from the library by their IDs, in a single query.
+
+        Useful for hydrating the results of `nearest_track_ids_by_vector_with_score()`.
+
+        Args:
+            track_ids (List[Union[str, uuid.UUID]]): The IDs of the tracks to get.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+
+        Returns:
+            List[NendoTrack]: The tracks, in the same order as the given IDs.
+                IDs of tracks that do not exist are skipped.
+        """
+        track_ids = [ensure_uuid(track_id) for track_id in track_ids]
+        if len(track_ids) == 0:
+            return []
+        with self.session_scope() as session:
+            query = session.query(model.NendoTrackDB).filter(
+                model.NendoTrackDB.id.in_(set(track_ids)),
+            )
+            if user_id is not None:
+                user_id = self._ensure_user_uuid(user_id)
+                query = query.filter(model.NendoTrackDB.user_id == user_id)
+            tracks = {
+                track_db.id: NendoTrack.model_validate(track_db)
+                for track_db in query.all()
+            }
+        return [tracks[track_id] for track_id in track_ids if track_id in tracks]
+
+    @staticmethod
+    def _check_cursor_args(limit: Optional[int], offset: Optional[int]) -> None:
+        if not limit:
+            raise ValueError("Paginating with a cursor requires a limit.")
+        if offset:
+            raise ValueError("Paginating with a cursor excludes an offset.")
+
+    def _get_track_page(
+        self,
+        query: Query,
+        cursor: str,
+        order_by: Optional[str] = None,
+        order: Optional[str] = "asc",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        load_related_tracks: bool = False,
+    ) -> Page:
+        """Get a page of the tracks of a query, seeking past the cursor.
+
+        The tracks are ordered by the `order_by` column and their ID, so that
+        the cursor, holding both of them for the last track of the page,
+        identifies the position of the next page.
+
+        Returns:
+            Page: The tracks, with the cursor of the next page, or None if
+                fewer than `limit` tracks were left.
+        """
+        self._check_cursor_args(limit=limit, offset=offset)
+        order_by = order_by or "id"
+        order = order or "asc"
+        if order_by not in model.NendoTrackDB.__table__.columns:
+            raise ValueError(
+                f"Paginating with a cursor does not support ordering by {order_by}.",
+            )
+        column = getattr(model.NendoTrackDB, order_by)
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unknown order {order}, expected asc or desc.")
+        track_id = model.NendoTrackDB.id
+        after = decode_cursor(cursor, kind=CursorKind.filter)
+        if after is not None:
+            if after.get("order_by") != order_by or after.get("order") != order:
+                raise ValueError("Cursor belongs to a query with another order.")
+            value, last_id = after["value"], after["id"]
+            # NULLs sort last in ascending and first in descending order
+            if order == "asc":
+                query = query.filter(
+                    or_(
+                        column > value,
+                        and_(column == value, track_id > last_id),
+                        column.is_(None),
+                    ) if value is not None
+                    else and_(column.is_(None), track_id > last_id),
+                )
+            else:
+                query = query.filter(
+                    or_(column < value, and_(column == value, track_id < last_id))
+                    if value is not None
+                    else or_(
+                        column.is_not(None),
+                        and_(column.is_(None), track_id < last_id),
+                    ),
+                )
+        if order == "asc":
+            query = query.order_by(column.asc(), track_id.asc())
+        else:
+            query = query.order_by(column.desc(), track_id.desc())
+        if not load_related_tracks:
+            query = query.options(noload(model.NendoTrackDB.related_tracks))
+        tracks_db = query.limit(limit).all()
+        next_cursor = None
+        if len(tracks_db) == limit:
+            next_cursor = encode_cursor(
+                CursorKind.filter,
+                order_by=order_by,
+                order=order,
+                value=getattr(tracks_db[-1], order_by),
+                id=tracks_db[-1].id,
+            )
+        return Page(
+            [NendoTrack.model_validate(track_db) for track_db in tracks_db],
+            next_cursor=next_cursor,
+        )
 
     def filter_tracks_by_meta(
         self,
         filters: Optional[Dict[str, Any]] = None,
         search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
         track_type: Optional[Union[str, List[str]]] = None,
         user_id: Optional[Union[str, uuid.UUID]] = None,
         collection_id: Optional[Union[str, uuid.UUID]] = None,
@@ -243,6 +676,7 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         limit: Optional[int] = None,
         offset: Optional[int] = None,
         session: Optional[Session] = None,
+        cursor: Optional[str] = None,
     ) -> Union[List, Iterator]:
         """Obtain tracks from the db by filtering over plugin data and meta data.
 
@@ -254,6 +688,10 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
                 correspond to potential field names in track.meta and the values should
                 contain the string values which should be contained in the respective
                 `track.meta` field's value.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
             track_type (Union[str, List[str]], optional): Track type to filter for.
                 Can be a singular type or a list of types. Defaults to None.
             user_id (Union[str, UUID], optional): The user ID to filter for.
@@ -267,10 +705,14 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             limit (int, optional): Limit the number of returned results.
             offset (int, optional): Offset into the paginated results (requires limit).
             session (sqlalchemy.orm.Session, optional): The database session.
+            cursor (str, optional): Cursor for seek pagination (requires limit,
+                excludes offset). Pass "" for the first page, then the
+                `next_cursor` of the previous page. Defaults to None.
 
         Returns:
             Union[List, Iterator]: List or generator of tracks, depending on the
-                configuration variable stream_mode
+                configuration variable stream_mode. A `Page` of tracks if a
+                cursor is given.
         """
         user_id = self._ensure_user_uuid(user_id)
         s = session or self.session_scope()
@@ -288,7 +730,18 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             query = self._get_meta_filter_query(
                 query=query,
                 search_meta=search_meta,
+                meta_match=meta_match,
             )
+            if cursor is not None:
+                return self._get_track_page(
+                    query=query,
+                    cursor=cursor,
+                    order_by=order_by,
+                    order=order,
+                    limit=limit,
+                    offset=offset,
+                    load_related_tracks=False,
+                )
             return self.get_tracks(
                 query=query,
                 order_by=order_by,
@@ -303,6 +756,7 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         self,
         filters: Optional[Dict[str, Any]] = None,
         search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
         track_type: Optional[Union[str, List[str]]] = None,
         user_id: Optional[Union[str, uuid.UUID]] = None,
         collection_id: Optional[Union[str, uuid.UUID]] = None,
@@ -319,6 +773,10 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
                 correspond to potential field names in track.meta and the values should
                 contain the string values which should be contained in the respective
                 `track.meta` field's value.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
             track_type (Union[str, List[str]], optional): Track type to filter for.
                 Can be a singular type or a list of types. Defaults to None.
             user_id (Union[str, UUID], optional): The user ID to filter for.
@@ -347,6 +805,7 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             query = self._get_meta_filter_query(
                 query=query,
                 search_meta=search_meta,
+                meta_match=meta_match,
             )
             query = query.options(noload("*"))
             return query.count()
@@ -358,6 +817,7 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         direction: str = "to",
         filters: Optional[Dict[str, Any]] = None,
         search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
         track_type: Optional[Union[str, List[str]]] = None,
         user_id: Optional[Union[str, uuid.UUID]] = None,
         collection_id: Optional[Union[str, uuid.UUID]] = None,
@@ -366,6 +826,7 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         order: Optional[str] = "asc",
         limit: Optional[int] = None,
         offset: Optional[int] = None,
+        cursor: Optional[str] = None,
     ) -> Union[List, Iterator]:
         """Get tracks with a relationship to a track and filter the results.
 
@@ -378,6 +839,10 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
                 over the track.resource.meta field. The dictionary's values
                 should contain singular search tokens and the keys currently have no
                 effect but might in the future. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
             track_type (Union[str, List[str]], optional): Track type to filter for.
                 Can be a singular type or a list of types. Defaults to None.
             user_id (Union[str, UUID], optional): The user ID to filter for.
@@ -390,10 +855,14 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             order (str, optional): Order in which to retrieve results ("asc" or "desc").
             limit (int, optional): Limit the number of returned results.
             offset (int, optional): Offset into the paginated results (requires limit).
+            cursor (str, optional): Cursor for seek pagination (requires limit,
+                excludes offset). Pass "" for the first page, then the
+                `next_cursor` of the previous page. Defaults to None.
 
         Returns:
             Union[List, Iterator]: List or generator of tracks, depending on the
-                configuration variable stream_mode
+                configuration variable stream_mode. A `Page` of tracks if a
+                cursor is given.
         """
         user_id = self._ensure_user_uuid(user_id)
         with self.session_scope() as session:
@@ -416,7 +885,18 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             query = self._get_meta_filter_query(
                 query=query,
                 search_meta=search_meta,
+                meta_match=meta_match,
             )
+            if cursor is not None:
+                return self._get_track_page(
+                    query=query,
+                    cursor=cursor,
+                    order_by=order_by,
+                    order=order,
+                    limit=limit,
+                    offset=offset,
+                    load_related_tracks=True,
+                )
             return self.get_tracks(
                 query=query,
                 order_by=order_by,
@@ -433,6 +913,7 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         direction: str = "to",
         filters: Optional[Dict[str, Any]] = None,
         search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
         track_type: Optional[Union[str, List[str]]] = None,
         user_id: Optional[Union[str, uuid.UUID]] = None,
         collection_id: Optional[Union[str, uuid.UUID]] = None,
@@ -451,6 +932,10 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
                 correspond to potential field names in track.meta and the values should
                 contain the string values which should be contained in the respective
                 `track.meta` field's value.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
             track_type (Union[str, List[str]], optional): Track type to filter for.
                 Can be a singular type or a list of types. Defaults to None.
             user_id (Union[str, UUID], optional): The user ID to filter for.
@@ -485,10 +970,142 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             query = self._get_meta_filter_query(
                 query=query,
                 search_meta=search_meta,
+                meta_match=meta_match,
             )
             query = query.options(noload("*"))
             return query.count()
 
+    def _get_text_hits_query(
+        self,
+        session: Session,
+        query: str,
+        entities: List[Any],
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[uuid.UUID] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+    ) -> Tuple[Query, Any]:
+        """Query the tracks matching a full-text query, see `search_tracks()`.
+
+        Returns the unordered query of the entities and the rank of each track,
+        along with the rank expression.
+        """
+        tsquery = func.websearch_to_tsquery(cast(TEXT_SEARCH_CONFIG, REGCONFIG), query)
+        rank = func.ts_rank(NendoTrackDocumentDB.document, tsquery).label("rank")
+        hits = (
+            session.query(*entities, rank)
+            .select_from(model.NendoTrackDB)
+            .join(
+                NendoTrackDocumentDB,
+                NendoTrackDocumentDB.track_id == model.NendoTrackDB.id,
+            )
+            .filter(
+                model.NendoTrackDB.user_id == user_id,
+                NendoTrackDocumentDB.document.op("@@")(tsquery),
+            )
+        )
+        hits = self._get_filtered_tracks_query(
+            session=session,
+            query=hits,
+            filters=filters,
+            search_meta=[],
+            track_type=track_type,
+            user_id=user_id,
+            collection_id=collection_id,
+            plugin_names=plugin_names,
+        )
+        hits = self._get_meta_filter_query(
+            query=hits,
+            search_meta=search_meta,
+            meta_match=meta_match,
+        )
+        return hits, rank
+
+    def search_tracks(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        session: Optional[Session] = None,
+    ) -> List[Tuple[NendoTrack, float]]:
+        """Search the tracks for free text, ranking them by relevance.
+
+        The query is matched against the words of each track's meta data values
+        and embedding texts, e.g. "dark techno" finds the tracks containing both
+        words. Quoted phrases, "or" and "-" to exclude words are supported, see
+        Postgres' `websearch_to_tsquery()`. Words are matched ignoring case, but
+        without stemming. The tracks are ranked by `ts_rank()`, weighing matches
+        in the meta data higher than matches in the embedding texts.
+
+        Args:
+            query (str): The free text to search for.
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict, optional): Dictionary containing separate track.meta filters
+                which will be applied in conjunction. The keys of the dictionary should
+                correspond to potential field names in track.meta and the values should
+                contain the string values which should be contained in the respective
+                `track.meta` field's value.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            limit (int, optional): Limit the number of returned results.
+            offset (int, optional): Offset into the paginated results (requires limit).
+            session (sqlalchemy.orm.Session, optional): The database session.
+
+        Returns:
+            List[Tuple[NendoTrack, float]]: List of tuples containing a track in
+                the first position and its rank in the second position, ordered
+                by their rank in descending order.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        s = session or self.session_scope()
+        with s as session_local:
+            track_query, rank = self._get_text_hits_query(
+                session=session_local,
+                query=query,
+                entities=[model.NendoTrackDB],
+                filters=filters,
+                search_meta=search_meta,
+                meta_match=meta_match,
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=collection_id,
+                plugin_names=plugin_names,
+            )
+            # ties are broken by the track ID, for stable pages
+            track_query = track_query.order_by(rank.desc(), model.NendoTrackDB.id)
+            if limit:
+                track_query = track_query.limit(limit)
+                if offset:
+                    track_query = track_query.offset(offset)
+            track_query = track_query.options(
+                noload(model.NendoTrackDB.related_tracks),
+            )
+            return [
+                (NendoTrack.model_validate(track_db), track_rank)
+                for track_db, track_rank in track_query
+            ]
+
     def add_embedding(
             self,
             embedding: NendoEmbeddingBase,
@@ -497,11 +1114,336 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         # cast to float32 for compatibility with pgvector
         embedding_create.embedding = embedding_create.embedding.astype(np.float32)
         with self.session_scope() as session:
+            self._check_embedding_dimensions(
+                embedding=embedding_create,
+                session=session,
+            )
             embedding_dict = embedding_create.model_dump()
             embedding_db = NendoEmbeddingDB(**embedding_dict)
-            session.add(embedding_db)
+            try:
+                with session.begin_nested():
+                    session.add(embedding_db)
+                    session.flush()
+            except IntegrityError:
+                # the track already has an embedding with this text, so its
+                # vector is replaced as in `upsert_embeddings()`
+                embedding = NendoEmbedding(**embedding_dict)
+                self._upsert_embedding_rows(
+                    session=session,
+                    embeddings={self._upsert_key(embedding): embedding},
+                )
+                session.commit()
+                self._cache_embeddings([embedding])
+                return embedding
+            self._add_track_vectors(session=session, embeddings=[embedding_db])
+            self._update_track_neighbors(
+                session=session,
+                track_ids=[embedding_db.track_id],
+                user_id=embedding_db.user_id,
+                plugin_name=embedding_db.plugin_name,
+                plugin_version=embedding_db.plugin_version,
+            )
+            self._update_track_clusters(
+                session=session,
+                track_ids=[embedding_db.track_id],
+                user_id=embedding_db.user_id,
+                plugin_name=embedding_db.plugin_name,
+                plugin_version=embedding_db.plugin_version,
+            )
+            self._notify_embedding(
+                session=session,
+                embedding=embedding_db,
+                action=ChangeAction.insert,
+            )
             session.commit()
-            return NendoEmbedding.model_validate(embedding_db)
+            embedding = NendoEmbedding.model_validate(embedding_db)
+        self._cache_embeddings([embedding])
+        return embedding
+
+    def _copy_embeddings(
+        self,
+        session: Session,
+        embeddings: List[NendoEmbedding],
+    ) -> None:
+        cursor = session.connection().connection.cursor()
+        if not hasattr(cursor, "copy_expert"):
+            # drivers other than psycopg2 fall back to a multi-row INSERT
+            session.execute(
+                insert(NendoEmbeddingDB),
+                [
+                    {column: getattr(e, column) for column in EMBEDDING_COPY_COLUMNS}
+                    for e in embeddings
+                ],
+            )
+            return
+        payload = encode_embeddings_copy(
+            rows=[
+                (
+                    e.id,
+                    e.track_id,
+                    e.user_id,
+                    e.plugin_name,
+                    e.plugin_version,
+                    e.text,
+                )
+                for e in embeddings
+            ],
+            vectors=vectors_to_binary([e.embedding for e in embeddings]),
+        )
+        cursor.copy_expert(
+            f"COPY embeddings ({', '.join(EMBEDDING_COPY_COLUMNS)}) "
+            "FROM STDIN WITH (FORMAT BINARY)",
+            io.BytesIO(payload),
+        )
+
+    def add_embeddings(
+        self,
+        embeddings: Iterable[NendoEmbeddingBase],
+        batch_size: Optional[int] = None,
+        return_ids: bool = False,
+    ) -> Union[List[NendoEmbedding], List[uuid.UUID]]:
+        """Add many embeddings to the library at once.
+
+        The embeddings are streamed into the database in batches using binary
+        `COPY`, which is much faster than calling `add_embedding()` per vector.
+        Each batch is committed separately. If a track already has an
+        embedding with the same plugin name, plugin version and text, the batch
+        falls back to `upsert_embeddings()` and replaces its vector.
+
+        Args:
+            embeddings (Iterable[NendoEmbeddingBase]): The embeddings to add.
+            batch_size (int, optional): Number of embeddings per batch. Defaults
+                to the `embedding_batch_size` config.
+            return_ids (bool): If True, only the IDs of the new embeddings are
+                returned instead of the full `NendoEmbedding` objects.
+                Defaults to False.
+
+        Returns:
+            Union[List[NendoEmbedding], List[uuid.UUID]]: The added embeddings or
+                their IDs, in the order in which they were given.
+        """
+        batch_size = batch_size or self.plugin_config.embedding_batch_size
+        embeddings = iter(embeddings)
+        added = []
+        while True:
+            batch = list(itertools.islice(embeddings, batch_size))
+            if len(batch) == 0:
+                break
+            # cast to float32 for compatibility with pgvector
+            vectors = vectors_to_float32([e.embedding for e in batch])
+            batch = [
+                NendoEmbedding(
+                    track_id=e.track_id,
+                    user_id=e.user_id,
+                    plugin_name=e.plugin_name,
+                    plugin_version=e.plugin_version,
+                    text=e.text,
+                    embedding=vec,
+                )
+                for e, vec in zip(batch, vectors)  # noqa: B905
+            ]
+            with self.session_scope() as session:
+                for e in batch:
+                    self._check_embedding_dimensions(embedding=e, session=session)
+                dbapi = session.get_bind().dialect.loaded_dbapi
+                try:
+                    with session.begin_nested():
+                        self._copy_embeddings(session=session, embeddings=batch)
+                except (IntegrityError, dbapi.IntegrityError):
+                    # some tracks already have an embedding with the same text,
+                    # so the batch replaces their vectors as in
+                    # `upsert_embeddings()`
+                    rows = {self._upsert_key(e): e for e in batch}
+                    self._upsert_embedding_rows(session=session, embeddings=rows)
+                    batch = [rows[self._upsert_key(e)] for e in batch]
+                else:
+                    self._add_track_vectors(session=session, embeddings=batch)
+                    spaces = {}
+                    for e in batch:
+                        spaces.setdefault(
+                            (e.user_id, e.plugin_name, e.plugin_version), set(),
+                        ).add(e.track_id)
+                    for (
+                        user_id, plugin_name, plugin_version,
+                    ), track_ids in spaces.items():
+                        self._update_track_neighbors(
+                            session=session,
+                            track_ids=list(track_ids),
+                            user_id=user_id,
+                            plugin_name=plugin_name,
+                            plugin_version=plugin_version,
+                        )
+                        self._update_track_clusters(
+                            session=session,
+                            track_ids=list(track_ids),
+                            user_id=user_id,
+                            plugin_name=plugin_name,
+                            plugin_version=plugin_version,
+                        )
+                        self._notify(
+                            session=session,
+                            entity=ChangeEntity.embedding,
+                            action=ChangeAction.insert,
+                            user_id=user_id,
+                            plugin_name=plugin_name,
+                            plugin_version=plugin_version,
+                        )
+            self._cache_embeddings(batch)
+            if return_ids:
+                added.extend(e.id for e in batch)
+            else:
+                added.extend(batch)
+        return added
+
+    @staticmethod
+    def _upsert_key(embedding: Any) -> Union[Tuple[Any, ...], uuid.UUID]:
+        """Return the key identifying an embedding for `upsert_embeddings()`."""
+        if embedding.track_id is None:
+            # NULL values never conflict
+            return embedding.id
+        return (
+            embedding.track_id,
+            embedding.plugin_name,
+            embedding.plugin_version,
+            # see `uq_embeddings_track_text`
+            embedding.text or "",
+        )
+
+    def _upsert_embedding_rows(
+        self,
+        session: Session,
+        embeddings: Dict[Any, NendoEmbedding],
+    ) -> None:
+        """Write embeddings, replacing the vectors of existing ones.
+
+        The embeddings are keyed by their `_upsert_key()`. Existing embeddings
+        keep their ID and user, which are set on the given embeddings. The
+        pooled vectors, neighbor graphs and clusterings of the affected tracks
+        are recomputed.
+        """
+        statement = pg_insert(NendoEmbeddingDB).values(
+            [
+                {column: getattr(e, column) for column in EMBEDDING_COPY_COLUMNS}
+                for e in embeddings.values()
+            ],
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[
+                NendoEmbeddingDB.track_id,
+                NendoEmbeddingDB.plugin_name,
+                NendoEmbeddingDB.plugin_version,
+                func.coalesce(NendoEmbeddingDB.text, literal_column("''")),
+            ],
+            set_={"embedding": statement.excluded.embedding},
+        ).returning(
+            NendoEmbeddingDB.id,
+            NendoEmbeddingDB.user_id,
+            NendoEmbeddingDB.track_id,
+            NendoEmbeddingDB.plugin_name,
+            NendoEmbeddingDB.plugin_version,
+            NendoEmbeddingDB.text,
+        )
+        for row in session.execute(statement):
+            embedding = embeddings[self._upsert_key(row)]
+            embedding.id, embedding.user_id = row.id, row.user_id
+        spaces = {}
+        for e in embeddings.values():
+            spaces.setdefault(
+                (e.user_id, e.plugin_name, e.plugin_version), set(),
+            ).add(e.track_id)
+        for (user_id, plugin_name, plugin_version), track_ids in spaces.items():
+            self._pool_track_vectors(
+                session=session,
+                track_ids=list(track_ids),
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+            self._update_track_neighbors(
+                session=session,
+                track_ids=list(track_ids),
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+            self._update_track_clusters(
+                session=session,
+                track_ids=list(track_ids),
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+            self._notify(
+                session=session,
+                entity=ChangeEntity.embedding,
+                action=ChangeAction.update,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+
+    def upsert_embeddings(
+        self,
+        embeddings: Iterable[NendoEmbeddingBase],
+        batch_size: Optional[int] = None,
+        return_ids: bool = False,
+    ) -> Union[List[NendoEmbedding], List[uuid.UUID]]:
+        """Add many embeddings, replacing the vectors of existing ones.
+
+        An embedding replaces the existing embedding with the same track, plugin
+        name, plugin version and text, so re-running an embedding job is safe.
+        The embeddings are written in batches using `INSERT ... ON CONFLICT DO
+        UPDATE`, and each batch is committed separately. Existing embeddings
+        keep their ID and user. Embeddings without a text replace the one
+        without a text, or with an empty text. Embeddings without a track
+        never replace other embeddings.
+
+        Args:
+            embeddings (Iterable[NendoEmbeddingBase]): The embeddings to upsert.
+            batch_size (int, optional): Number of embeddings per batch. Defaults
+                to the `embedding_batch_size` config.
+            return_ids (bool): If True, only the IDs of the embeddings are
+                returned instead of the full `NendoEmbedding` objects.
+                Defaults to False.
+
+        Returns:
+            Union[List[NendoEmbedding], List[uuid.UUID]]: The stored embeddings or
+                their IDs, in the order in which they were given.
+        """
+        batch_size = batch_size or self.plugin_config.embedding_batch_size
+        embeddings = iter(embeddings)
+        upserted = []
+        while True:
+            batch = list(itertools.islice(embeddings, batch_size))
+            if len(batch) == 0:
+                break
+            # cast to float32 for compatibility with pgvector
+            vectors = vectors_to_float32([e.embedding for e in batch])
+            batch = [
+                NendoEmbedding(
+                    track_id=e.track_id,
+                    user_id=e.user_id,
+                    plugin_name=e.plugin_name,
+                    plugin_version=e.plugin_version,
+                    text=e.text,
+                    embedding=vec,
+                )
+                for e, vec in zip(batch, vectors)  # noqa: B905
+            ]
+            # a statement can not update the same row twice, so the last of
+            # several embeddings with the same key wins
+            keys = [self._upsert_key(e) for e in batch]
+            rows = dict(zip(keys, batch))  # noqa: B905
+            with self.session_scope() as session:
+                for e in rows.values():
+                    self._check_embedding_dimensions(embedding=e, session=session)
+                self._upsert_embedding_rows(session=session, embeddings=rows)
+            self._cache_embeddings(list(rows.values()))
+            if return_ids:
+                upserted.extend(rows[key].id for key in keys)
+            else:
+                upserted.extend(rows[key] for key in keys)
+        return upserted
 
     def get_embedding(self, embedding_id: uuid.UUID) -> Optional[NendoEmbedding]:
         with self.session_scope() as session:
@@ -540,87 +1482,4347 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
                 NendoEmbedding.model_validate(embedding_db) for embedding_db in query
             ]
 
-    def update_embedding(
-            self,
-            embedding: NendoEmbedding,
-    ) -> NendoEmbedding:
-        with self.session_scope() as session:
-            embedding_db = (
-                session.query(
-                    NendoEmbeddingDB,
-                )
-                .filter_by(
-                    id=embedding.id,
-                )
-                .one_or_none()
-            )
-            if embedding_db is None:
-                raise NoResultFound(f"No embedding found with id {embedding.id}")
-            embedding_db.user_id = embedding.user_id
-            embedding_db.plugin_name = embedding.plugin_name
-            embedding_db.plugin_version = embedding.plugin_version
-            embedding_db.text = embedding.text
-            embedding_db.embedding = embedding.embedding.astype(np.float32)
-            session.commit()
-            return NendoEmbedding.model_validate(embedding_db)
-
-    def remove_embedding(self, embedding_id: uuid.UUID) -> bool:
-        with self.session_scope() as session:
-            embedding_db = (
-                session.query(NendoEmbeddingDB).filter_by(id=embedding_id).one_or_none()
+    def _iter_embedding_batches(
+        self,
+        session: Session,
+        user_id: uuid.UUID,
+        plugin_name: str,
+        plugin_version: str,
+        batch_size: int,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # yield_per streams the rows through a server-side cursor
+        result = session.execute(
+            select(NendoEmbeddingDB.track_id, NendoEmbeddingDB.embedding)
+            .where(
+                NendoEmbeddingDB.user_id == user_id,
+                NendoEmbeddingDB.plugin_name == plugin_name,
+                NendoEmbeddingDB.plugin_version == plugin_version,
+                NendoEmbeddingDB.embedding.isnot(None),
             )
-            if embedding_db is None:
-                self.logger.warning("Embedding with id %s not found", embedding_id)
-                return False
-            session.delete(embedding_db)
-            return True
+            .execution_options(yield_per=batch_size),
+        )
+        for rows in result.partitions():
+            track_ids = np.empty(len(rows), dtype=object)
+            track_ids[:] = [row[0] for row in rows]
+            try:
+                matrix = np.stack([row[1] for row in rows]).astype(
+                    np.float32, copy=False,
+                )
+            except ValueError as e:
+                raise ValueError(
+                    f"The embeddings of {plugin_name} {plugin_version} "
+                    "have mixed dimensions.",
+                ) from e
+            yield track_ids, matrix
 
-    def _get_nearest_query(
+    def iter_embedding_batches(
         self,
-        session: Session,
-        vec: npt.ArrayLike,
-        user_id: Optional[uuid.UUID] = None,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Stream the embeddings of an embedding space as NumPy batches.
+
+        The vectors are read through a server-side cursor, so only one batch
+        is held in memory at a time, and are never converted into
+        `NendoEmbedding` objects.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults
+                to the name of the configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the configured embedding plugin.
+            batch_size (int, optional): Number of embeddings per batch. Defaults
+                to the `embedding_batch_size` config.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+
+        Raises:
+            ValueError: If the embeddings have mixed dimensions.
+
+        Yields:
+            Tuple[np.ndarray, np.ndarray]: The IDs of the embeddings' tracks, as an
+                object array of UUIDs, and the float32 matrix of the vectors,
+                one per row.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            yield from self._iter_embedding_batches(
+                session=session,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                batch_size=batch_size or self.plugin_config.embedding_batch_size,
+            )
+
+    def get_embedding_matrix(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        out: Optional[Union[str, os.PathLike]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Get all embeddings of an embedding space as a single NumPy matrix.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults
+                to the name of the configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the configured embedding plugin.
+            batch_size (int, optional): Number of embeddings read per batch.
+                Defaults to the `embedding_batch_size` config.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            out (Union[str, os.PathLike], optional): Path of a `.npy` file to write
+                the matrix to. If given, the matrix is returned as a memory map of
+                that file, and never held in memory as a whole.
+
+        Raises:
+            ValueError: If the embeddings have mixed dimensions.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The IDs of the embeddings' tracks, as an
+                object array of UUIDs, and the float32 matrix of the vectors,
+                one per row.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        space_filter = (
+            NendoEmbeddingDB.user_id == user_id,
+            NendoEmbeddingDB.plugin_name == plugin_name,
+            NendoEmbeddingDB.plugin_version == plugin_version,
+            NendoEmbeddingDB.embedding.isnot(None),
+        )
+        with self.session_scope() as session:
+            # count and read the embeddings from the same snapshot
+            session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"},
+            )
+            num_rows, min_dimensions, max_dimensions = session.query(
+                func.count(NendoEmbeddingDB.id),
+                func.min(func.vector_dims(NendoEmbeddingDB.embedding)),
+                func.max(func.vector_dims(NendoEmbeddingDB.embedding)),
+            ).filter(*space_filter).one()
+            if min_dimensions != max_dimensions:
+                raise ValueError(
+                    f"The embeddings of {plugin_name} {plugin_version} "
+                    "have mixed dimensions.",
+                )
+            shape = (num_rows, min_dimensions or 0)
+            if out is not None:
+                matrix = np.lib.format.open_memmap(
+                    out, mode="w+", dtype=np.float32, shape=shape,
+                )
+            else:
+                matrix = np.empty(shape, dtype=np.float32)
+            track_ids = np.empty(num_rows, dtype=object)
+            start = 0
+
+            def store_batch(batch_ids: List[uuid.UUID], batch: np.ndarray) -> None:
+                nonlocal start
+                end = start + len(batch_ids)
+                track_ids[start:end] = batch_ids
+                matrix[start:end] = batch
+                start = end
+
+            cursor = session.connection().connection.cursor()
+            if num_rows > 0 and hasattr(cursor, "copy_expert"):
+                # read the raw float32 values instead of parsing their text
+                decoder = EmbeddingCopyDecoder(
+                    dimensions=min_dimensions,
+                    consume=store_batch,
+                )
+                copy_query = cursor.mogrify(
+                    f"SELECT {', '.join(EMBEDDING_READ_COLUMNS)} FROM embeddings "  # noqa: S608
+                    "WHERE user_id = %s AND plugin_name = %s "
+                    "AND plugin_version = %s AND embedding IS NOT NULL",
+                    (str(user_id), plugin_name, plugin_version),
+                ).decode()
+                cursor.copy_expert(
+                    f"COPY ({copy_query}) TO STDOUT WITH (FORMAT BINARY)",
+                    decoder,
+                    size=COPY_READ_SIZE,
+                )
+                decoder.close()
+            else:
+                for batch_ids, batch in self._iter_embedding_batches(
+                    session=session,
+                    user_id=user_id,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                    batch_size=batch_size or self.plugin_config.embedding_batch_size,
+                ):
+                    store_batch(batch_ids, batch)
+        if out is not None:
+            matrix.flush()
+        return track_ids, matrix
+
+    def update_embedding(
+            self,
+            embedding: NendoEmbedding,
+    ) -> NendoEmbedding:
+        with self.session_scope() as session:
+            self._check_embedding_dimensions(embedding=embedding, session=session)
+            embedding_db = (
+                session.query(
+                    NendoEmbeddingDB,
+                )
+                .filter_by(
+                    id=embedding.id,
+                )
+                .one_or_none()
+            )
+            if embedding_db is None:
+                raise NoResultFound(f"No embedding found with id {embedding.id}")
+            previous_space = (
+                embedding_db.user_id,
+                embedding_db.plugin_name,
+                embedding_db.plugin_version,
+            )
+            embedding_db.user_id = embedding.user_id
+            embedding_db.plugin_name = embedding.plugin_name
+            embedding_db.plugin_version = embedding.plugin_version
+            embedding_db.text = embedding.text
+            embedding_db.embedding = embedding.embedding.astype(np.float32)
+            session.flush()
+            # the embedding may have moved to another embedding space
+            for user_id, plugin_name, plugin_version in {
+                previous_space,
+                (embedding.user_id, embedding.plugin_name, embedding.plugin_version),
+            }:
+                self._pool_track_vectors(
+                    session=session,
+                    track_ids=[embedding_db.track_id],
+                    user_id=user_id,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                )
+                self._update_track_neighbors(
+                    session=session,
+                    track_ids=[embedding_db.track_id],
+                    user_id=user_id,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                )
+                self._update_track_clusters(
+                    session=session,
+                    track_ids=[embedding_db.track_id],
+                    user_id=user_id,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                )
+            self._notify_embedding(
+                session=session,
+                embedding=embedding_db,
+                action=ChangeAction.update,
+            )
+            session.commit()
+            embedding = NendoEmbedding.model_validate(embedding_db)
+        self._cache_embeddings([embedding])
+        return embedding
+
+    def remove_embedding(self, embedding_id: uuid.UUID) -> bool:
+        with self.session_scope() as session:
+            embedding_db = (
+                session.query(NendoEmbeddingDB).filter_by(id=embedding_id).one_or_none()
+            )
+            if embedding_db is None:
+                self.logger.warning("Embedding with id %s not found", embedding_id)
+                return False
+            session.delete(embedding_db)
+            session.flush()
+            self._pool_track_vectors(
+                session=session,
+                track_ids=[embedding_db.track_id],
+                user_id=embedding_db.user_id,
+                plugin_name=embedding_db.plugin_name,
+                plugin_version=embedding_db.plugin_version,
+            )
+            self._update_track_neighbors(
+                session=session,
+                track_ids=[embedding_db.track_id],
+                user_id=embedding_db.user_id,
+                plugin_name=embedding_db.plugin_name,
+                plugin_version=embedding_db.plugin_version,
+            )
+            self._update_track_clusters(
+                session=session,
+                track_ids=[embedding_db.track_id],
+                user_id=embedding_db.user_id,
+                plugin_name=embedding_db.plugin_name,
+                plugin_version=embedding_db.plugin_version,
+            )
+            self._notify_embedding(
+                session=session,
+                embedding=embedding_db,
+                action=ChangeAction.delete,
+            )
+        if self.vector_cache is not None:
+            self.vector_cache.remove(embedding_id)
+        return True
+
+    # ======================
+    #
+    # VECTOR CACHE
+    #
+    # ======================
+
+    def _cache_embeddings(self, embeddings: List[NendoEmbedding]) -> None:
+        """Write the given embeddings through to the vector cache."""
+        if self.vector_cache is None:
+            return
+        for embedding in embeddings:
+            self.vector_cache.upsert(
+                key=(embedding.user_id, embedding.plugin_name, embedding.plugin_version),
+                embedding_id=embedding.id,
+                track_id=embedding.track_id,
+                vec=embedding.embedding,
+            )
+
+    def _load_cached_space(
+        self,
+        user_id: uuid.UUID,
+        plugin_name: str,
+        plugin_version: str,
+    ) -> List[Tuple[uuid.UUID, uuid.UUID, np.ndarray]]:
+        with self.session_scope() as session:
+            return (
+                session.query(
+                    NendoEmbeddingDB.id,
+                    NendoEmbeddingDB.track_id,
+                    NendoEmbeddingDB.embedding,
+                )
+                .join(
+                    model.NendoTrackDB,
+                    NendoEmbeddingDB.track_id == model.NendoTrackDB.id,
+                )
+                .filter(
+                    NendoEmbeddingDB.user_id == user_id,
+                    NendoEmbeddingDB.plugin_name == plugin_name,
+                    NendoEmbeddingDB.plugin_version == plugin_version,
+                    NendoEmbeddingDB.embedding.isnot(None),
+                )
+                .all()
+            )
+
+    def _nearest_from_cache(
+        self,
+        vec: np.ndarray,
+        limit: int,
+        offset: Optional[int],
+        user_id: uuid.UUID,
+        embedding_name: Optional[str],
+        embedding_version: Optional[str],
+        distance_metric: Optional[DistanceMetric],
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        track_type: Optional[Union[str, List[str]]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> Optional[List[Tuple[uuid.UUID, float]]]:
+        """Run an exact nearest neighbor search over the vector cache.
+
+        Returns:
+            Optional[List[Tuple[uuid.UUID, float]]]: Tuples of track ID and
+                distance, or None if the search has to be run by the database,
+                i.e. if the cache is disabled, the space can not be cached or
+                filters are applied.
+        """
+        if self.vector_cache is None:
+            return None
+        if self._has_track_filters(
+            filters=filters,
+            search_meta=search_meta,
+            track_type=track_type,
+            collection_id=collection_id,
+        ):
+            return None
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=embedding_name,
+            plugin_version=embedding_version,
+        )
+        key = (user_id, plugin_name, plugin_version)
+        matrix = self.vector_cache.get_or_load(
+            key=key,
+            load_rows=lambda: self._load_cached_space(*key),
+        )
+        if matrix is None:
+            return None
+        return self.vector_cache.search(
+            key=key,
+            vec=vec,
+            limit=limit,
+            distance_metric=(
+                distance_metric if distance_metric is not None
+                else self._default_distance
+            ),
+            offset=offset or 0,
+        )
+
+    # ======================
+    #
+    # RESULT CACHE
+    #
+    # ======================
+
+    def _cached_nearest(
+        self,
+        vec: np.ndarray,
+        limit: int,
+        offset: Optional[int],
+        user_id: uuid.UUID,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
         embedding_name: Optional[str] = None,
         embedding_version: Optional[str] = None,
         distance_metric: Optional[DistanceMetric] = None,
-        ) -> Query:
-        user_id = user_id or self.user.id
-        plugin_name = (
-            embedding_name if embedding_name is not None else
-            self.embedding_plugin.plugin_name
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+    ) -> Tuple[
+        Optional[List[Tuple[uuid.UUID, float]]],
+        Optional[Callable[[List[Tuple[uuid.UUID, float]]], None]],
+    ]:
+        """Answer a nearest neighbor search from the result or the vector cache.
+
+        Returns:
+            Tuple: The tuples of track ID and distance, or None if the search has
+                to be run by the database. And a function storing the results of
+                the search in the result cache, or None if it is disabled.
+        """
+        store_nearest = None
+        if self.result_cache is not None:
+            plugin_name, plugin_version = self._get_embedding_space(
+                plugin_name=embedding_name,
+                plugin_version=embedding_version,
+            )
+            key = make_key(
+                vec,
+                limit=limit,
+                offset=offset or 0,
+                filters={k: v for k, v in (filters or {}).items() if v is not None},
+                search_meta=search_meta or {},
+                meta_match=MetaMatch(meta_match).value,
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=(
+                    ensure_uuid(collection_id) if collection_id is not None else None
+                ),
+                plugin_names=plugin_names or [],
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                distance_metric=DistanceMetric(
+                    distance_metric if distance_metric is not None
+                    else self._default_distance,
+                ).value,
+                ef_search=ef_search or self.plugin_config.hnsw_ef_search,
+                probes=probes or self.plugin_config.ivfflat_probes,
+                iterative_scan=(
+                    iterative_scan or self.plugin_config.vector_iterative_scan
+                ),
+            )
+            store_nearest = functools.partial(
+                self.result_cache.put,
+                key,
+                scope=ResultCacheScope(user_id, plugin_name, plugin_version),
+                generation=self.result_cache.generation,
+            )
+            nearest = self.result_cache.get(key)
+            if nearest is not None:
+                return nearest, None
+        nearest = self._nearest_from_cache(
+            vec=vec,
+            limit=limit,
+            offset=offset,
+            user_id=user_id,
+            embedding_name=embedding_name,
+            embedding_version=embedding_version,
+            distance_metric=distance_metric,
+            filters=filters,
+            search_meta=search_meta,
+            track_type=track_type,
+            collection_id=collection_id,
         )
-        plugin_version = (
-            embedding_version if embedding_version is not None else
-            self.embedding_plugin.plugin_version
+        if nearest is not None and store_nearest is not None:
+            store_nearest(nearest)
+        return nearest, store_nearest
+
+    def _invalidate_results(self, change: Dict[str, Any]) -> None:
+        """Drop the cached results that are affected by a change event."""
+        entity, action = change.get("entity"), change.get("action")
+        user_id = ensure_uuid(change["user_id"]) if "user_id" in change else None
+        track_id = ensure_uuid(change["track_id"]) if "track_id" in change else None
+        if entity == ChangeEntity.library:
+            self.result_cache.invalidate()
+        elif entity == ChangeEntity.embedding:
+            if "plugin_name" in change:
+                self.result_cache.invalidate(
+                    user_id=user_id,
+                    plugin_name=change["plugin_name"],
+                    plugin_version=change.get("plugin_version"),
+                )
+            # the embedding's track might have moved out of other results
+            if track_id is not None:
+                self.result_cache.invalidate(track_id=track_id)
+        elif entity == ChangeEntity.track and action == ChangeAction.delete:
+            self.result_cache.invalidate(track_id=track_id)
+        elif entity in (ChangeEntity.neighbor_graph, ChangeEntity.clustering):
+            # neighbor graphs and clusterings are not used by the cached searches
+            return
+        else:
+            # track and plugin data changes affect the filters of all searches
+            self.result_cache.invalidate(user_id=user_id)
+
+    def nearest_cache_info(self) -> Optional[ResultCacheInfo]:
+        """Return the statistics of the nearest neighbor result cache.
+
+        Returns:
+            Optional[ResultCacheInfo]: The number of hits and misses, and the
+                maximum and current number of entries of the cache, or None if
+                the cache is disabled.
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.info()
+
+    def clear_nearest_cache(self) -> None:
+        """Drop all entries of the nearest neighbor result cache."""
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
+
+    # ======================
+    #
+    # CHANGE NOTIFICATIONS
+    #
+    # ======================
+
+    def _notify(
+        self,
+        session: Session,
+        entity: ChangeEntity,
+        action: ChangeAction,
+        **fields: Any,
+    ) -> None:
+        """Announce a change made in the session's current transaction.
+
+        The change is sent to other library instances, if change notifications
+        are enabled, and applied to the result cache once it is committed.
+        """
+        self._forget_space_sizes({"entity": entity, "action": action, **fields})
+        notifications_enabled = self.plugin_config.change_notifications_enabled
+        if not notifications_enabled and self.result_cache is None:
+            return
+        change = change_event(
+            origin=self.origin,
+            entity=entity,
+            action=action,
+            **fields,
         )
-        distance = (
-            self._pg_distance(distance_metric)
-            if distance_metric is not None
-            else self.distance_metric
+        if notifications_enabled:
+            notify(session=session, event=change)
+        if self.result_cache is not None:
+            if PENDING_CHANGES not in session.info:
+                session.info[PENDING_CHANGES] = []
+                event.listen(session, "after_commit", self._apply_pending_changes)
+                event.listen(
+                    session,
+                    "after_rollback",
+                    lambda s: s.info[PENDING_CHANGES].clear(),
+                )
+            session.info[PENDING_CHANGES].append(change)
+
+    def _apply_pending_changes(self, session: Session) -> None:
+        changes = session.info[PENDING_CHANGES]
+        while len(changes) > 0:
+            self._invalidate_results(changes.pop(0))
+
+    def _notify_embedding(
+        self,
+        session: Session,
+        embedding: NendoEmbeddingDB,
+        action: ChangeAction,
+    ) -> None:
+        self._notify(
+            session=session,
+            entity=ChangeEntity.embedding,
+            action=action,
+            embedding_id=embedding.id,
+            track_id=embedding.track_id,
+            user_id=embedding.user_id,
+            plugin_name=embedding.plugin_name,
+            plugin_version=embedding.plugin_version,
         )
-        return (
+
+    def _upsert_track_db(
+        self,
+        track: NendoTrackBase,
+        session: Session,
+    ) -> model.NendoTrackDB:
+        self._notify(
+            session=session,
+            entity=ChangeEntity.track,
+            action=(
+                ChangeAction.insert if isinstance(track, NendoTrackCreate)
+                else ChangeAction.update
+            ),
+            track_id=getattr(track, "id", None),
+            user_id=track.user_id,
+        )
+        return super()._upsert_track_db(track=track, session=session)
+
+    def _upsert_tracks_db(
+        self,
+        tracks: List[NendoTrackBase],
+        session: Session,
+    ) -> List[model.NendoTrackDB]:
+        for track in tracks:
+            self._notify(
+                session=session,
+                entity=ChangeEntity.track,
+                action=(
+                    ChangeAction.insert if isinstance(track, NendoTrackCreate)
+                    else ChangeAction.update
+                ),
+                track_id=getattr(track, "id", None),
+                user_id=track.user_id,
+            )
+        return super()._upsert_tracks_db(tracks=tracks, session=session)
+
+    def _insert_plugin_data_db(
+        self,
+        plugin_data: NendoPluginDataCreate,
+        session: Session,
+    ) -> model.NendoPluginDataDB:
+        self._notify(
+            session=session,
+            entity=ChangeEntity.plugin_data,
+            action=ChangeAction.insert,
+            track_id=plugin_data.track_id,
+            user_id=plugin_data.user_id,
+            plugin_name=plugin_data.plugin_name,
+            plugin_version=plugin_data.plugin_version,
+            key=plugin_data.key,
+        )
+        return super()._insert_plugin_data_db(
+            plugin_data=plugin_data,
+            session=session,
+        )
+
+    def _update_plugin_data_db(
+        self,
+        existing_plugin_data: model.NendoPluginDataDB,
+        plugin_data: NendoPluginData,
+        session: Session,
+    ) -> model.NendoPluginDataDB:
+        if existing_plugin_data is not None:
+            self._notify(
+                session=session,
+                entity=ChangeEntity.plugin_data,
+                action=ChangeAction.update,
+                track_id=existing_plugin_data.track_id,
+                user_id=plugin_data.user_id,
+                plugin_name=existing_plugin_data.plugin_name,
+                plugin_version=existing_plugin_data.plugin_version,
+                key=plugin_data.key,
+            )
+        return super()._update_plugin_data_db(
+            existing_plugin_data=existing_plugin_data,
+            plugin_data=plugin_data,
+            session=session,
+        )
+
+    def _handle_change_event(self, event: Dict[str, Any]) -> None:
+        """Apply a change made by another library instance to the local caches."""
+        if self.result_cache is not None:
+            self._invalidate_results(event)
+        self._forget_space_sizes(event)
+        entity, action = event.get("entity"), event.get("action")
+        if entity == ChangeEntity.library:
+            if self.vector_cache is not None:
+                self.vector_cache.invalidate()
+            self.embedding_dimensions.clear()
+            self.embedding_quantization.clear()
+            self.neighbor_graph_spaces.clear()
+            self.clustering_spaces.clear()
+            self.meta_values_indexed = None
+            self.meta_jsonb = None
+            self.iterative_scan_supported = None
+            return
+        if entity in (ChangeEntity.neighbor_graph, ChangeEntity.clustering):
+            spaces = (
+                self.neighbor_graph_spaces
+                if entity == ChangeEntity.neighbor_graph
+                else self.clustering_spaces
+            )
+            spaces.pop(
+                (
+                    ensure_uuid(event["user_id"]),
+                    event["plugin_name"],
+                    event["plugin_version"],
+                ),
+                None,
+            )
+            return
+        if entity == ChangeEntity.embedding and self.vector_cache is not None:
+            embedding_id = event.get("embedding_id")
+            if embedding_id is None:
+                if "track_id" in event:
+                    self.vector_cache.remove_track(ensure_uuid(event["track_id"]))
+                else:
+                    self.vector_cache.invalidate(
+                        key=(
+                            ensure_uuid(event["user_id"]),
+                            event.get("plugin_name"),
+                            event.get("plugin_version"),
+                        ),
+                    )
+                return
+            embedding_id = ensure_uuid(embedding_id)
+            embedding = (
+                self.get_embedding(embedding_id=embedding_id)
+                if action != ChangeAction.delete
+                else None
+            )
+            if embedding is None:
+                self.vector_cache.remove(embedding_id)
+            else:
+                self._cache_embeddings([embedding])
+        elif (
+            entity == ChangeEntity.track
+            and action == ChangeAction.delete
+            and self.vector_cache is not None
+        ):
+            self.vector_cache.remove_track(ensure_uuid(event["track_id"]))
+
+    def start_change_listener(
+        self,
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> ChangeListener:
+        """Start listening for changes made by other library instances.
+
+        The events are received on a dedicated connection by a daemon thread.
+        Events sent by this library instance itself are skipped. Requires the
+        other instances to have `change_notifications_enabled` set.
+
+        Args:
+            callback (Callable, optional): Function called with each received
+                event. Defaults to updating this library's caches.
+
+        Returns:
+            ChangeListener: The running listener thread.
+        """
+        if self.change_listener is not None and self.change_listener.is_alive():
+            return self.change_listener
+        self.change_listener = ChangeListener(
+            engine=self.db,
+            callback=callback or self._handle_change_event,
+            origin=self.origin,
+        )
+        self.change_listener.start()
+        return self.change_listener
+
+    def stop_change_listener(self) -> None:
+        """Stop listening for changes made by other library instances."""
+        if self.change_listener is not None:
+            self.change_listener.stop()
+            self.change_listener = None
+
+    def _disconnect(self):
+        self.stop_change_listener()
+        super()._disconnect()
+
+    # ======================
+    #
+    # EMBEDDING SPACES & ANN INDEXES
+    #
+    # ======================
+
+    def _get_embedding_space(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        if plugin_name is None or plugin_version is None:
+            if self.embedding_plugin is None:
+                raise ValueError(
+                    "No embedding plugin configured. Please specify the "
+                    "plugin_name and plugin_version of the embedding space.",
+                )
+            plugin_name = plugin_name or self.embedding_plugin.plugin_name
+            plugin_version = plugin_version or self.embedding_plugin.plugin_version
+        return plugin_name, plugin_version
+
+    def _load_embedding_space(
+        self,
+        plugin_name: str,
+        plugin_version: str,
+        session: Optional[Session] = None,
+    ) -> None:
+        if session is None:
+            with self.session_scope() as session_local:
+                return self._load_embedding_space(
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                    session=session_local,
+                )
+        space_db = (
             session.query(
-                NendoEmbeddingDB,
-                distance(vec).label("distance"),
+                NendoEmbeddingSpaceDB.dimensions,
+                NendoEmbeddingSpaceDB.quantization,
             )
             .filter(
-                NendoEmbeddingDB.user_id == user_id,
-                NendoEmbeddingDB.plugin_name == plugin_name,
-                NendoEmbeddingDB.plugin_version == plugin_version,
+                NendoEmbeddingSpaceDB.plugin_name == plugin_name,
+                NendoEmbeddingSpaceDB.plugin_version == plugin_version,
+            )
+            .one_or_none()
+        )
+        dimensions, quantization = space_db if space_db is not None else (None, None)
+        space = (plugin_name, plugin_version)
+        self.embedding_dimensions[space] = dimensions
+        self.embedding_quantization[space] = (
+            VectorQuantization(quantization) if quantization is not None else None
+        )
+        return None
+
+    def _get_embedding_dimensions(
+        self,
+        plugin_name: str,
+        plugin_version: str,
+        session: Optional[Session] = None,
+    ) -> Optional[int]:
+        space = (plugin_name, plugin_version)
+        if space not in self.embedding_dimensions:
+            self._load_embedding_space(plugin_name, plugin_version, session=session)
+        return self.embedding_dimensions[space]
+
+    def _get_embedding_quantization(
+        self,
+        plugin_name: str,
+        plugin_version: str,
+        session: Optional[Session] = None,
+    ) -> Optional[VectorQuantization]:
+        space = (plugin_name, plugin_version)
+        if space not in self.embedding_quantization:
+            self._load_embedding_space(plugin_name, plugin_version, session=session)
+        return self.embedding_quantization[space]
+
+    def _check_embedding_dimensions(
+        self,
+        embedding: NendoEmbeddingBase,
+        session: Optional[Session] = None,
+    ) -> None:
+        dimensions = self._get_embedding_dimensions(
+            plugin_name=embedding.plugin_name,
+            plugin_version=embedding.plugin_version,
+            session=session,
+        )
+        if dimensions is not None and len(embedding.embedding) != dimensions:
+            raise ValueError(
+                f"Expected embedding with {dimensions} dimensions for "
+                f"{embedding.plugin_name}@{embedding.plugin_version}, "
+                f"got {len(embedding.embedding)}.",
+            )
+
+    def _execute_ddl(self, statements: List[str], autocommit: bool = False) -> None:
+        # CONCURRENTLY operations can not run inside a transaction block
+        if autocommit:
+            with self.db.connect().execution_options(
+                isolation_level="AUTOCOMMIT",
+            ) as connection:
+                for statement in statements:
+                    connection.execute(text(statement))
+        else:
+            with self.session_scope() as session:
+                for statement in statements:
+                    session.execute(text(statement))
+
+    def set_embedding_space(
+        self,
+        dimensions: int,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        quantization: Optional[Union[str, VectorQuantization]] = None,
+    ) -> None:
+        """Declare the number of dimensions of an embedding space.
+
+        An embedding space is identified by the name and version of the embedding
+        plugin that produced the vectors. Declaring its dimensions is a
+        prerequisite for creating ANN indexes over it. Once declared, embeddings
+        with a different number of dimensions are rejected for that space.
+
+        The ANN indexes of a quantized space index half-precision ("halfvec") or
+        binary quantized ("bit") vectors, which makes them two or 32 times
+        smaller. The vectors themselves are stored in full precision, which is
+        used to re-rank the candidates found by the quantized indexes
+        (requires pgvector 0.7).
+
+        Args:
+            dimensions (int): Number of dimensions of the embedding vectors.
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            quantization (Union[str, VectorQuantization], optional): The
+                quantization of the space's ANN indexes, either "halfvec" or
+                "bit". Defaults to None, meaning full precision.
+
+        Raises:
+            ValueError: If the dimensions or quantization of a space with
+                vector indexes are changed.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        if quantization is not None:
+            quantization = VectorQuantization(quantization)
+        with self.session_scope() as session:
+            space_db = (
+                session.query(NendoEmbeddingSpaceDB)
+                .filter_by(plugin_name=plugin_name, plugin_version=plugin_version)
+                .one_or_none()
+            )
+            if space_db is None:
+                session.add(
+                    NendoEmbeddingSpaceDB(
+                        plugin_name=plugin_name,
+                        plugin_version=plugin_version,
+                        dimensions=dimensions,
+                        quantization=quantization and quantization.value,
+                    ),
+                )
+            elif (
+                space_db.dimensions != dimensions
+                or space_db.quantization != (quantization and quantization.value)
+            ):
+                if len(self.get_vector_indexes(plugin_name, plugin_version)) > 0:
+                    raise ValueError(
+                        "Can not change the dimensions or quantization of an "
+                        "indexed embedding space. Please drop its vector "
+                        "indexes first.",
+                    )
+                space_db.dimensions = dimensions
+                space_db.quantization = quantization and quantization.value
+        self.embedding_dimensions[(plugin_name, plugin_version)] = dimensions
+        self.embedding_quantization[(plugin_name, plugin_version)] = quantization
+
+    def remove_embedding_space(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+    ) -> bool:
+        """Remove a declared embedding space together with its vector indexes.
+
+        The embeddings belonging to the space are not removed.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+
+        Returns:
+            bool: True if the space was removed, False if it was not declared.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        self.drop_vector_index(plugin_name=plugin_name, plugin_version=plugin_version)
+        with self.session_scope() as session:
+            removed = (
+                session.query(NendoEmbeddingSpaceDB)
+                .filter_by(plugin_name=plugin_name, plugin_version=plugin_version)
+                .delete()
+            )
+        self.embedding_dimensions.pop((plugin_name, plugin_version), None)
+        self.embedding_quantization.pop((plugin_name, plugin_version), None)
+        return removed > 0
+
+    def get_vector_indexes(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+    ) -> List[str]:
+        """Get the names of all existing ANN indexes of an embedding space.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+
+        Returns:
+            List[str]: The names of the indexes.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        names = all_vector_index_names(plugin_name, plugin_version)
+        with self.session_scope() as session:
+            existing = session.execute(
+                # the indexes of the embeddings can be on the space's partition
+                text(
+                    "SELECT indexname FROM pg_indexes WHERE indexname = ANY(:names)",
+                ).bindparams(names=names),
+            ).scalars()
+            return sorted(existing)
+
+    def create_vector_index(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        method: Optional[Union[str, VectorIndexMethod]] = None,
+        distance_metrics: Optional[List[DistanceMetric]] = None,
+        concurrently: bool = False,
+        track_vectors: bool = False,
+    ) -> List[str]:
+        """Create ANN indexes over the vectors of an embedding space.
+
+        One partial index is created per distance metric, restricted to the rows of
+        the given embedding space. The dimensions of the space have to be declared
+        using `set_embedding_space()` beforehand. For binary quantized spaces, a
+        single index using the Hamming distance is created instead.
+        With `track_vectors=True`, the pooled track vectors searched by
+        `nearest_tracks_by_vector_with_score()` are indexed instead. If the
+        space has a partition of its own, see `create_embedding_partition()`,
+        only the partition is indexed.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            method (Union[str, VectorIndexMethod], optional): The index type, either
+                "hnsw" or "ivfflat". Defaults to the `vector_index_method` config.
+            distance_metrics (List[DistanceMetric], optional): Distance metrics
+                to create indexes for. Defaults to all supported distance metrics.
+                Ignored for binary quantized spaces.
+            concurrently (bool): Whether to build the indexes without locking
+                writes to the embeddings table. Defaults to False.
+            track_vectors (bool): Whether to index the pooled track vectors of
+                the space instead of its embeddings. Defaults to False.
+
+        Raises:
+            ValueError: If the dimensions of the embedding space are unknown, or
+                if the indexes should be built concurrently on the partitioned
+                embeddings table, as the space has no partition of its own.
+
+        Returns:
+            List[str]: The names of the created indexes.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        dimensions = self._get_embedding_dimensions(plugin_name, plugin_version)
+        if dimensions is None:
+            raise ValueError(
+                f"Unknown dimensions for {plugin_name}@{plugin_version}. Please "
+                "declare them using `set_embedding_space()` first.",
+            )
+        method = VectorIndexMethod(method or self.plugin_config.vector_index_method)
+        quantization = self._get_embedding_quantization(plugin_name, plugin_version)
+        if distance_metrics is None or quantization == VectorQuantization.bit:
+            distance_metrics = index_distance_metrics(quantization)
+        table = "track_vectors" if track_vectors else "embeddings"
+        partition = None
+        if not track_vectors:
+            with self.session_scope() as session:
+                partition = self._get_space_partition(
+                    session=session,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                )
+                if (
+                    concurrently and partition is None
+                    and self._is_embeddings_partitioned(session)
+                ):
+                    raise ValueError(
+                        "Can not build indexes concurrently on the partitioned "
+                        f"embeddings table. Please give {plugin_name}@"
+                        f"{plugin_version} a partition of its own using "
+                        "`create_embedding_partition()` first.",
+                    )
+        self._execute_ddl(
+            [
+                create_vector_index_sql(
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                    dimensions=dimensions,
+                    method=method,
+                    distance_metric=distance_metric,
+                    m=self.plugin_config.hnsw_m,
+                    ef_construction=self.plugin_config.hnsw_ef_construction,
+                    lists=self.plugin_config.ivfflat_lists,
+                    concurrently=concurrently,
+                    quantization=quantization,
+                    table=table,
+                    partition=partition,
+                )
+                for distance_metric in distance_metrics
+            ],
+            autocommit=concurrently,
+        )
+        return [
+            vector_index_name(
+                plugin_name, plugin_version, method, distance_metric, quantization, table,
+            )
+            for distance_metric in distance_metrics
+        ]
+
+    def rebuild_vector_index(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        concurrently: bool = False,
+    ) -> List[str]:
+        """Rebuild all existing ANN indexes of an embedding space.
+
+        Rebuilding is recommended after bulk loads, as well as for IVFFlat indexes
+        that were created before most of the data was inserted.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            concurrently (bool): Whether to rebuild the indexes without locking
+                writes to the embeddings table. Defaults to False.
+
+        Returns:
+            List[str]: The names of the rebuilt indexes.
+        """
+        index_names = self.get_vector_indexes(plugin_name, plugin_version)
+        # indexes on the partitioned embeddings table can only be rebuilt
+        # outside of a transaction block
+        self._execute_ddl(
+            [
+                f"REINDEX INDEX {'CONCURRENTLY ' if concurrently else ''}{index_name}"
+                for index_name in index_names
+            ],
+            autocommit=True,
+        )
+        return index_names
+
+    def drop_vector_index(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        concurrently: bool = False,
+    ) -> List[str]:
+        """Drop all existing ANN indexes of an embedding space.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            concurrently (bool): Whether to drop the indexes without locking
+                the embeddings table. Defaults to False.
+
+        Returns:
+            List[str]: The names of the dropped indexes.
+        """
+        index_names = self.get_vector_indexes(plugin_name, plugin_version)
+        partitioned = set()
+        if concurrently:
+            # indexes on the partitioned embeddings table can not be dropped
+            # concurrently, which only changes the catalog anyway
+            with self.session_scope() as session:
+                partitioned = set(
+                    session.execute(
+                        text(
+                            "SELECT relname FROM pg_class "
+                            "WHERE relkind = 'I' AND relname = ANY(:names)",
+                        ).bindparams(names=index_names),
+                    ).scalars(),
+                )
+        self._execute_ddl(
+            [
+                "DROP INDEX "
+                f"{'CONCURRENTLY ' if concurrently and name not in partitioned else ''}"
+                f"IF EXISTS {name}"
+                for name in index_names
+            ],
+            autocommit=concurrently,
+        )
+        return index_names
+
+    def _set_vector_search_params(
+        self,
+        session: Session,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+    ) -> None:
+        """Apply the ANN search parameters to the current transaction of a session.
+
+        Uses `set_config(..., is_local => true)`, which is equivalent to `SET LOCAL`.
+        Must be called right before executing the query, as it only affects the
+        transaction that is open at the time of the call.
+        """
+        ef_search = ef_search or self.plugin_config.hnsw_ef_search
+        probes = probes or self.plugin_config.ivfflat_probes
+        iterative_scan = iterative_scan or self.plugin_config.vector_iterative_scan
+        search_params = {"hnsw.ef_search": ef_search, "ivfflat.probes": probes}
+        if iterative_scan is not None:
+            search_params["hnsw.iterative_scan"] = iterative_scan
+            # ivfflat does not support "strict_order"
+            if iterative_scan != "strict_order":
+                search_params["ivfflat.iterative_scan"] = iterative_scan
+        set_configs, bind_params = [], {}
+        for i, (name, value) in enumerate(search_params.items()):
+            if value is None:
+                continue
+            set_configs.append(f"set_config(:name_{i}, :value_{i}, true)")
+            bind_params[f"name_{i}"] = name
+            bind_params[f"value_{i}"] = str(value)
+        if len(set_configs) > 0:
+            session.execute(text("SELECT " + ", ".join(set_configs)), bind_params)
+
+    def _get_nearest_query(
+        self,
+        session: Session,
+        vec: npt.ArrayLike,
+        user_id: Optional[uuid.UUID] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        entities: Optional[List[Any]] = None,
+        rerank_candidates: Optional[int] = None,
+        after: Optional[Tuple[float, uuid.UUID]] = None,
+        exact: bool = False,
+        ) -> Query:
+        user_id = user_id or self.user.id
+        entities = entities if entities is not None else [NendoEmbeddingDB]
+        plugin_name = (
+            embedding_name if embedding_name is not None else
+            self.embedding_plugin.plugin_name
+        )
+        plugin_version = (
+            embedding_version if embedding_version is not None else
+            self.embedding_plugin.plugin_version
+        )
+        distance_metric = (
+            distance_metric if distance_metric is not None else self._default_distance
+        )
+        dimensions = self._get_embedding_dimensions(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+            session=session,
+        )
+        distance = self._pg_distance(
+            distance_metric,
+            dimensions=dimensions,
+            exact=exact,
+        )
+        space_filter = (
+            NendoEmbeddingDB.user_id == user_id,
+            NendoEmbeddingDB.plugin_name == plugin_name,
+            NendoEmbeddingDB.plugin_version == plugin_version,
+        )
+        query = session.query(
+            *entities,
+            distance(vec).label("distance"),
+        ).select_from(NendoEmbeddingDB)
+        quantization = self._get_embedding_quantization(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+            session=session,
+        )
+        if quantization is not None and rerank_candidates is not None:
+            # find candidates using the quantized ANN index, then re-rank
+            # them by their exact distance
+            candidate_distance = self._pg_distance(
+                distance_metric,
+                dimensions=dimensions,
+                quantization=quantization,
+            )
+            candidates = (
+                session.query(NendoEmbeddingDB.id)
+                .filter(*space_filter)
+                .order_by(candidate_distance(vec))
+                .limit(rerank_candidates)
+                .subquery("rerank_candidates")
+            )
+            query = query.join(candidates, candidates.c.id == NendoEmbeddingDB.id)
+        if after is not None:
+            # seek past the last result of the previous page
+            last_distance, last_embedding_id = after
+            query = query.filter(
+                or_(
+                    distance(vec) > last_distance,
+                    and_(
+                        distance(vec) == last_distance,
+                        NendoEmbeddingDB.id > last_embedding_id,
+                    ),
+                ),
+            )
+        return query.filter(*space_filter).join(
+            model.NendoTrackDB,
+            NendoEmbeddingDB.track_id == model.NendoTrackDB.id,
+        )
+
+    def _get_filtered_nearest_query(
+        self,
+        session: Session,
+        vec: Any,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[uuid.UUID] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        entities: Optional[List[Any]] = None,
+        rerank_candidates: Optional[int] = None,
+        after: Optional[Tuple[float, uuid.UUID]] = None,
+        prefilter: bool = False,
+    ) -> Query:
+        """Query the nearest embeddings of the tracks that pass the filters.
+
+        If `prefilter` is True, the IDs of the tracks that pass the filters are
+        fetched first, and the distances of their embeddings are computed
+        exactly. Otherwise, the filters are joined to the nearest neighbor
+        query.
+        """
+        query = self._get_nearest_query(
+            session=session,
+            vec=vec,
+            user_id=user_id,
+            embedding_name=embedding_name,
+            embedding_version=embedding_version,
+            distance_metric=distance_metric,
+            entities=entities,
+            rerank_candidates=rerank_candidates,
+            after=after,
+            exact=prefilter,
+        )
+        if prefilter:
+            if not self._has_track_filters(
+                filters=filters,
+                search_meta=search_meta,
+                track_type=track_type,
+                collection_id=collection_id,
+            ):
+                # the embedding space is filtered by the user ID already
+                return query
+            return query.filter(
+                NendoEmbeddingDB.track_id.in_(
+                    self._get_prefiltered_track_ids(
+                        session=session,
+                        filters=filters,
+                        search_meta=search_meta,
+                        meta_match=meta_match,
+                        track_type=track_type,
+                        user_id=user_id,
+                        collection_id=collection_id,
+                        plugin_names=plugin_names,
+                    ),
+                ),
+            )
+        query = self._get_filtered_tracks_query(
+            session=session,
+            query=query,
+            filters=filters,
+            search_meta=[],
+            track_type=track_type,
+            user_id=user_id,
+            collection_id=collection_id,
+            plugin_names=plugin_names,
+        )
+        return self._get_meta_filter_query(
+            query=query,
+            search_meta=search_meta,
+            meta_match=meta_match,
+        )
+
+    @staticmethod
+    def _has_track_filters(
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        track_type: Optional[Union[str, List[str]]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> bool:
+        return (
+            any(v is not None for v in (filters or {}).values())
+            or bool(search_meta)
+            or track_type is not None
+            or collection_id is not None
+        )
+
+    def _get_filtered_track_ids_query(
+        self,
+        session: Session,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[uuid.UUID] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+    ) -> Query:
+        """Query the IDs of the tracks that pass the filters."""
+        query = self._get_filtered_tracks_query(
+            session=session,
+            query=session.query(model.NendoTrackDB.id).filter(
+                model.NendoTrackDB.user_id == user_id,
+            ),
+            filters=filters,
+            search_meta=[],
+            track_type=track_type,
+            user_id=user_id,
+            collection_id=collection_id,
+            plugin_names=plugin_names,
+        )
+        return self._get_meta_filter_query(
+            query=query,
+            search_meta=search_meta,
+            meta_match=meta_match,
+        )
+
+    def _get_prefiltered_track_ids(
+        self,
+        session: Session,
+        **filter_args: Any,
+    ) -> List[uuid.UUID]:
+        """Fetch the IDs of the tracks that pass the filters of a prefiltered search.
+
+        Fetching them with a query of their own lets the planner use the btree
+        indexes for the filters, before only the embeddings of these tracks are
+        scored.
+        """
+        return [
+            track_id
+            for (track_id,) in self._get_filtered_track_ids_query(
+                session=session,
+                **filter_args,
+            )
+        ]
+
+    def _count_filtered_tracks(
+        self,
+        session: Session,
+        max_count: int,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[uuid.UUID] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+    ) -> int:
+        """Count the tracks that pass the filters, but stop counting at `max_count`."""
+        query = self._get_filtered_track_ids_query(
+            session=session,
+            filters=filters,
+            search_meta=search_meta,
+            meta_match=meta_match,
+            track_type=track_type,
+            user_id=user_id,
+            collection_id=collection_id,
+            plugin_names=plugin_names,
+        )
+        return session.query(func.count()).select_from(
+            query.limit(max_count).subquery(),
+        ).scalar()
+
+    def _count_space_embeddings(
+        self,
+        session: Session,
+        max_count: int,
+        user_id: Optional[uuid.UUID],
+        plugin_name: str,
+        plugin_version: str,
+    ) -> int:
+        """Count the embeddings of a space, but stop counting at `max_count`.
+
+        Counts the embeddings of all users if `user_id` is None. The counts are
+        cached until the embeddings of the space change, see
+        `_forget_space_sizes()`. A cached count that stopped at a smaller
+        `max_count` is only a lower bound, so it is counted again.
+        """
+        key = (user_id, plugin_name, plugin_version)
+        if key in self.space_sizes:
+            count, complete = self.space_sizes[key]
+            if complete or count >= max_count:
+                return min(count, max_count)
+        query = session.query(NendoEmbeddingDB.id).filter(
+            NendoEmbeddingDB.plugin_name == plugin_name,
+            NendoEmbeddingDB.plugin_version == plugin_version,
+        )
+        if user_id is not None:
+            query = query.filter(NendoEmbeddingDB.user_id == user_id)
+        count = session.query(func.count()).select_from(
+            query.limit(max_count).subquery(),
+        ).scalar()
+        self.space_sizes[key] = (count, count < max_count)
+        return count
+
+    def _is_shared_space(
+        self,
+        session: Session,
+        plugin_name: str,
+        plugin_version: str,
+    ) -> bool:
+        """Check whether the embeddings of a space belong to several users.
+
+        The ANN indexes cover all users of a space, so the user ID filters the
+        rows found by their index scans like any other filter. The answer is
+        cached until the embeddings of the space change.
+        """
+        space = (plugin_name, plugin_version)
+        if space in self.shared_spaces:
+            return self.shared_spaces[space]
+        user_ids = session.query(NendoEmbeddingDB.user_id).filter(
+            NendoEmbeddingDB.plugin_name == plugin_name,
+            NendoEmbeddingDB.plugin_version == plugin_version,
+        )
+        # read from both ends of the (user_id, plugin_name, plugin_version)
+        # index, as there is no min() or max() of UUIDs
+        first_user_id, last_user_id = session.query(
+            user_ids.order_by(NendoEmbeddingDB.user_id.asc())
+            .limit(1)
+            .scalar_subquery(),
+            user_ids.order_by(NendoEmbeddingDB.user_id.desc())
+            .limit(1)
+            .scalar_subquery(),
+        ).one()
+        self.shared_spaces[space] = first_user_id != last_user_id
+        return self.shared_spaces[space]
+
+    def _forget_space_sizes(self, change: Dict[str, Any]) -> None:
+        """Drop the cached sizes of the embedding spaces affected by a change event.
+
+        See `_count_space_embeddings()` and `_is_shared_space()`.
+        """
+        entity, action = change.get("entity"), change.get("action")
+        if entity == ChangeEntity.embedding and "plugin_name" in change:
+            space = (change["plugin_name"], change.get("plugin_version"))
+            self.shared_spaces.pop(space, None)
+            for key in [key for key in self.space_sizes if key[1:] == space]:
+                self.space_sizes.pop(key, None)
+        elif entity in (ChangeEntity.embedding, ChangeEntity.library) or (
+            # the embeddings of deleted tracks are deleted as well
+            entity == ChangeEntity.track and action == ChangeAction.delete
+        ):
+            self.shared_spaces.clear()
+            self.space_sizes.clear()
+
+    def _get_rerank_candidates(
+        self,
+        session: Session,
+        window: int,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+    ) -> Optional[int]:
+        """Return the number of candidates to re-rank for a window of results.
+
+        Returns None if the embedding space is not quantized, in which case the
+        results are ranked by their exact distance right away.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=embedding_name,
+            plugin_version=embedding_version,
+        )
+        if self._get_embedding_quantization(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+            session=session,
+        ) is None:
+            return None
+        return window * max(self.plugin_config.quantized_rerank_factor, 1)
+
+    def _get_candidate_ef_search(
+        self,
+        num_candidates: int,
+        ef_search: Optional[int] = None,
+    ) -> int:
+        # HNSW index scans return at most `ef_search` candidates
+        return max(
+            ef_search or self.plugin_config.hnsw_ef_search or DEFAULT_EF_SEARCH,
+            min(num_candidates, MAX_EF_SEARCH),
+        )
+
+    def _get_search_strategy(
+        self,
+        session: Session,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[uuid.UUID] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+    ) -> SearchStrategy:
+        """Choose how to apply the filters of a nearest neighbor search.
+
+        If at most `prefilter_max_tracks` tracks pass the filters, their
+        distances are computed exactly. Otherwise, the filters are applied to
+        an over-fetched window of nearest neighbors. The user ID counts as a
+        filter if other users have embeddings in the same space.
+        """
+        max_prefilter_tracks = self.plugin_config.prefilter_max_tracks
+        if not self._has_track_filters(
+            filters=filters,
+            search_meta=search_meta,
+            track_type=track_type,
+            collection_id=collection_id,
+        ):
+            plugin_name, plugin_version = self._get_embedding_space(
+                plugin_name=embedding_name,
+                plugin_version=embedding_version,
+            )
+            if not self._is_shared_space(
+                session=session,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            ):
+                return SearchStrategy.unfiltered
+            num_embeddings = self._count_space_embeddings(
+                session=session,
+                max_count=max_prefilter_tracks + 1,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+            if num_embeddings <= max_prefilter_tracks:
+                return SearchStrategy.prefilter
+            return SearchStrategy.postfilter
+        num_tracks = self._count_filtered_tracks(
+            session=session,
+            max_count=max_prefilter_tracks + 1,
+            filters=filters,
+            search_meta=search_meta,
+            meta_match=meta_match,
+            track_type=track_type,
+            user_id=user_id,
+            collection_id=collection_id,
+            plugin_names=plugin_names,
+        )
+        if num_tracks <= max_prefilter_tracks:
+            return SearchStrategy.prefilter
+        return SearchStrategy.postfilter
+
+    def _supports_iterative_scan(self, session: Session) -> bool:
+        """Check whether the pgvector extension supports iterative index scans."""
+        if self.iterative_scan_supported is None:
+            self.iterative_scan_supported = bool(
+                session.execute(
+                    text(
+                        "SELECT string_to_array(extversion, '.')::int[] >= '{0,8}' "
+                        "FROM pg_extension WHERE extname = 'vector'",
+                    ),
+                ).scalar(),
+            )
+        return self.iterative_scan_supported
+
+    def _get_seek_iterative_scan(
+        self,
+        session: Session,
+        num_candidates: int,
+        iterative_scan: Optional[str],
+        plugin_name: str,
+        plugin_version: str,
+    ) -> Optional[str]:
+        """Choose the iterative scan mode of a page of seek pagination.
+
+        HNSW index scans find at most `MAX_EF_SEARCH` candidates, fewer than
+        deep pages need. Unless iterative scans are configured, these pages
+        use them in strict order (requires pgvector 0.8).
+
+        Raises:
+            ValueError: If the page needs more candidates than an HNSW index
+                of the space can find without iterative scans.
+        """
+        iterative_scan = iterative_scan or self.plugin_config.vector_iterative_scan
+        if num_candidates <= MAX_EF_SEARCH or iterative_scan not in (None, "off"):
+            return iterative_scan
+        if self._supports_iterative_scan(session):
+            return "strict_order"
+        hnsw_indexes = [
+            vector_index_name(
+                plugin_name,
+                plugin_version,
+                VectorIndexMethod.hnsw,
+                distance_metric,
+                quantization,
+            )
+            for quantization in (None, *VectorQuantization)
+            for distance_metric in index_distance_metrics(quantization)
+        ]
+        if self._count_space_embeddings(
+            session=session,
+            max_count=MAX_EF_SEARCH + 1,
+            user_id=None,
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        ) > MAX_EF_SEARCH and session.execute(
+            text(
+                "SELECT EXISTS (SELECT FROM pg_indexes WHERE indexname = ANY(:names))",
+            ).bindparams(names=hnsw_indexes),
+        ).scalar():
+            raise ValueError(
+                f"The page needs {num_candidates} candidates, but HNSW index scans "
+                f"find at most {MAX_EF_SEARCH} without iterative scans, which "
+                "require pgvector 0.8. Use smaller pages, filters, or drop the "
+                "HNSW index.",
+            )
+        return iterative_scan
+
+    def _run_nearest_query(
+        self,
+        session: Session,
+        vec: Any,
+        limit: int,
+        offset: Optional[int],
+        entities: List[Any],
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[uuid.UUID] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+        seek: bool = False,
+        after: Optional[Tuple[float, uuid.UUID]] = None,
+        depth: int = 0,
+    ) -> Tuple[List[Any], SearchStrategy]:
+        """Run a nearest neighbor query, choosing a strategy for the filters.
+
+        Unless the filters are applied first, searches in quantized embedding
+        spaces find `quantized_rerank_factor` times the requested number of
+        candidates using the quantized ANN index, and re-rank them by their
+        exact distance.
+
+        Pages of `seek` pagination are ordered by the distance and embedding
+        ID, and start `after` the distance and embedding ID of the last result
+        of the previous page, `depth` results into the search. Index scans skip
+        those results after finding them, so the candidates are sized for the
+        depth as well.
+
+        Returns:
+            Tuple[List[Any], SearchStrategy]: The rows, containing the given
+                entities followed by the distance, and the embedding ID when
+                seeking, and the strategy used.
+        """
+        offset = offset or 0
+        # the results in front of the page, which the index has to find too
+        skipped = offset + depth
+        filter_args = {
+            "filters": filters,
+            "search_meta": search_meta,
+            "meta_match": meta_match,
+            "track_type": track_type,
+            "user_id": user_id,
+            "collection_id": collection_id,
+            "plugin_names": plugin_names,
+        }
+        nearest_args = {
+            "vec": vec,
+            "user_id": user_id,
+            "embedding_name": embedding_name,
+            "embedding_version": embedding_version,
+            "distance_metric": distance_metric,
+        }
+        search_params = {
+            "ef_search": ef_search,
+            "probes": probes,
+            "iterative_scan": iterative_scan,
+        }
+        strategy = self._get_search_strategy(
+            session=session,
+            embedding_name=embedding_name,
+            embedding_version=embedding_version,
+            **filter_args,
+        )
+        if strategy == SearchStrategy.postfilter:
+            plugin_name, plugin_version = self._get_embedding_space(
+                plugin_name=embedding_name,
+                plugin_version=embedding_version,
+            )
+            overfetch = max(self.plugin_config.postfilter_overfetch, 2)
+            window = (limit + skipped) * overfetch
+            while True:
+                rerank_candidates = self._get_rerank_candidates(
+                    session=session,
+                    window=window,
+                    embedding_name=embedding_name,
+                    embedding_version=embedding_version,
+                )
+                candidates = (
+                    self._get_nearest_query(
+                        session=session,
+                        entities=[NendoEmbeddingDB.id, NendoEmbeddingDB.track_id],
+                        rerank_candidates=rerank_candidates,
+                        after=after,
+                        **nearest_args,
+                    )
+                    .order_by(asc("distance"))
+                    .limit(window)
+                    .subquery("candidates")
+                )
+                query = (
+                    session.query(*entities, candidates.c.distance)
+                    .select_from(candidates)
+                    .join(
+                        model.NendoTrackDB,
+                        model.NendoTrackDB.id == candidates.c.track_id,
+                    )
+                )
+                query = self._get_filtered_tracks_query(
+                    session=session,
+                    query=query,
+                    search_meta=[],
+                    **{
+                        k: v
+                        for k, v in filter_args.items()
+                        if k not in ("search_meta", "meta_match")
+                    },
+                )
+                query = self._get_meta_filter_query(
+                    query=query,
+                    search_meta=search_meta,
+                    meta_match=meta_match,
+                )
+                query = query.order_by(
+                    candidates.c.distance,
+                    candidates.c.id,
+                ).limit(limit)
+                if seek:
+                    query = query.add_columns(candidates.c.id)
+                if offset:
+                    query = query.offset(offset)
+                if seek:
+                    search_params["iterative_scan"] = self._get_seek_iterative_scan(
+                        session=session,
+                        num_candidates=rerank_candidates or window,
+                        iterative_scan=iterative_scan,
+                        plugin_name=plugin_name,
+                        plugin_version=plugin_version,
+                    )
+                self._set_vector_search_params(
+                    session=session,
+                    **dict(
+                        search_params,
+                        ef_search=self._get_candidate_ef_search(
+                            num_candidates=rerank_candidates or window,
+                            ef_search=ef_search,
+                        ),
+                    ),
+                )
+                rows = query.all()
+                if len(rows) >= limit or self._count_space_embeddings(
+                    session=session,
+                    # count up to the largest window, so that the cached
+                    # count answers the later iterations as well
+                    max_count=max(
+                        window, self.plugin_config.postfilter_max_window,
+                    ) + 1,
+                    # the index scans see the embeddings of all users
+                    user_id=None,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                ) <= window:
+                    return rows, strategy
+                if window >= self.plugin_config.postfilter_max_window:
+                    # the filters are too restrictive for the index after all
+                    strategy = SearchStrategy.prefilter
+                    break
+                window = min(
+                    window * overfetch,
+                    self.plugin_config.postfilter_max_window,
+                )
+        # prefiltered searches are exact anyway
+        rerank_candidates = None
+        window = limit + skipped
+        if seek and strategy == SearchStrategy.unfiltered:
+            # ANN indexes only order by the distance, so ties are broken by the
+            # embedding ID within an over-fetched window of candidates
+            window *= max(self.plugin_config.postfilter_overfetch, 2)
+        if strategy == SearchStrategy.unfiltered:
+            rerank_candidates = self._get_rerank_candidates(
+                session=session,
+                window=window,
+                embedding_name=embedding_name,
+                embedding_version=embedding_version,
+            )
+        # HNSW index scans return at most `ef_search` rows, which would cut
+        # windows larger than the default `hnsw.ef_search` of 40 short
+        search_params["ef_search"] = self._get_candidate_ef_search(
+            num_candidates=rerank_candidates or window,
+            ef_search=ef_search,
+        )
+        if seek and strategy == SearchStrategy.unfiltered:
+            plugin_name, plugin_version = self._get_embedding_space(
+                plugin_name=embedding_name,
+                plugin_version=embedding_version,
+            )
+            search_params["iterative_scan"] = self._get_seek_iterative_scan(
+                session=session,
+                num_candidates=rerank_candidates or window,
+                iterative_scan=iterative_scan,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+            candidates = (
+                self._get_nearest_query(
+                    session=session,
+                    entities=[NendoEmbeddingDB.id, NendoEmbeddingDB.track_id],
+                    rerank_candidates=rerank_candidates,
+                    after=after,
+                    **nearest_args,
+                )
+                .order_by(asc("distance"))
+                .limit(window)
+                .subquery("candidates")
+            )
+            query = (
+                session.query(*entities, candidates.c.distance)
+                .select_from(candidates)
+                .join(
+                    model.NendoTrackDB,
+                    model.NendoTrackDB.id == candidates.c.track_id,
+                )
+                .order_by(candidates.c.distance, candidates.c.id)
+                .add_columns(candidates.c.id)
+            )
+        else:
+            query = self._get_filtered_nearest_query(
+                session=session,
+                entities=entities,
+                rerank_candidates=rerank_candidates,
+                after=after,
+                prefilter=strategy == SearchStrategy.prefilter,
+                **filter_args,
+                **{k: v for k, v in nearest_args.items() if k != "user_id"},
+            )
+            query = query.order_by(asc("distance"))
+            if strategy == SearchStrategy.prefilter:
+                query = query.order_by(NendoEmbeddingDB.id)
+            if seek:
+                query = query.add_columns(NendoEmbeddingDB.id)
+        query = query.limit(limit)
+        if offset:
+            query = query.offset(offset)
+        self._set_vector_search_params(session=session, **search_params)
+        return query.all(), strategy
+
+    def _nearest_page(
+        self,
+        vec: np.ndarray,
+        limit: int,
+        offset: Optional[int],
+        cursor: str,
+        user_id: uuid.UUID,
+        **search_args: Any,
+    ) -> Tuple[Page, SearchStrategy]:
+        """Get a page of the nearest neighboring tracks, seeking past the cursor.
+
+        The cursor holds the distance and embedding ID of the last result of the
+        previous page, and the number of results returned before it. Pages are
+        not cached, as their results depend on the cursor.
+
+        Returns:
+            Tuple[Page, SearchStrategy]: The tuples of track and distance, with
+                the cursor of the next page, or None if fewer than `limit`
+                tracks were left. And the strategy used for the search.
+        """
+        self._check_cursor_args(limit=limit, offset=offset)
+        after, depth = None, 0
+        last = decode_cursor(cursor, kind=CursorKind.nearest)
+        if last is not None:
+            after, depth = (last["distance"], last["id"]), last["depth"]
+        with self.session_scope() as session:
+            rows, strategy = self._run_nearest_query(
+                session=session,
+                vec=vec,
+                limit=limit,
+                offset=None,
+                entities=[model.NendoTrackDB],
+                user_id=user_id,
+                seek=True,
+                after=after,
+                depth=depth,
+                **search_args,
+            )
+            results = [
+                (NendoTrack.model_validate(track), distance)
+                for track, distance, _ in rows
+            ]
+        next_cursor = None
+        if len(results) == limit:
+            _, distance, embedding_id = rows[-1]
+            next_cursor = encode_cursor(
+                CursorKind.nearest,
+                distance=distance,
+                id=embedding_id,
+                depth=depth + limit,
+            )
+        return Page(results, next_cursor=next_cursor), strategy
+
+    def nearest_by_vector_with_score(
+        self,
+        vec: npt.ArrayLike,
+        limit: int = 10,
+        offset: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> List[Tuple[NendoTrack, float]]:
+        """Obtain the n nearest neighboring tracks to a vector, with their distances.
+
+        If the vector cache is enabled and no filters are given, the search is
+        answered by an exact search over the cached embedding matrix. See
+        `nearest_by_vector_with_strategy()` for how filtered searches are run.
+
+        Args:
+            vec (numpy.typing.ArrayLike): The vector from which to start the neighbor search.
+            limit (int): Limit the number of returned results. Default is 10.
+            offset (Optional[int]): Offset into the paginated results (requires limit).
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict): Dictionary containing the keywords to search for
+                over the track.resource.meta field. The dictionary's values
+                should contain singular search tokens and the keys currently have no
+                effect but might in the future. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            embedding_name (str, optional): Name of the embedding plugin for which to
+                retrieve and compare the vectors. If none is given, the name of the
+                currently configured embedding plugin for the library vector extension
+                is used.
+            embedding_version (str, optional): Version of the embedding plugin for
+                which to retrieve and compare the vectors. If none is given, the
+                version of the currently configured embedding plugin for the library
+                vector extension is used.
+            distance_metric (Optional[DistanceMetric], optional): The distance metric
+                to use. Defaults to None.
+            ef_search (int, optional): Size of the candidate list of HNSW index
+                scans. Higher values increase recall at the cost of latency.
+                Defaults to the `hnsw_ef_search` config.
+            probes (int, optional): Number of lists probed by IVFFlat index scans.
+                Higher values increase recall at the cost of latency.
+                Defaults to the `ivfflat_probes` config.
+            iterative_scan (str, optional): Iterative index scan mode, one of
+                "off", "strict_order" or "relaxed_order" (requires pgvector 0.8).
+                Defaults to the `vector_iterative_scan` config.
+            cursor (str, optional): Cursor for seek pagination (excludes offset).
+                Pass "" for the first page, then the `next_cursor` of the
+                previous page. Pages deeper than `MAX_EF_SEARCH` candidates
+                use iterative HNSW index scans. Defaults to None.
+
+        Returns:
+            List[Tuple[NendoTrack, float]]: List of tuples containing a track in
+                the first position and their distance ("score") in the second
+                position, ordered by their distance in ascending order. A `Page`
+                of them if a cursor is given.
+        """
+        return self.nearest_by_vector_with_strategy(
+            vec=vec,
+            limit=limit,
+            offset=offset,
+            filters=filters,
+            search_meta=search_meta,
+            meta_match=meta_match,
+            track_type=track_type,
+            user_id=user_id,
+            collection_id=collection_id,
+            plugin_names=plugin_names,
+            embedding_name=embedding_name,
+            embedding_version=embedding_version,
+            distance_metric=distance_metric,
+            ef_search=ef_search,
+            probes=probes,
+            iterative_scan=iterative_scan,
+            cursor=cursor,
+        )[0]
+
+    def nearest_by_vector_with_strategy(
+        self,
+        vec: npt.ArrayLike,
+        limit: int = 10,
+        offset: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Tuple[NendoTrack, float]], SearchStrategy]:
+        """Obtain the n nearest neighboring tracks to a vector, and the search strategy.
+
+        Like `nearest_by_vector_with_score()`, but also reports how the search
+        was run. Searches without filters are answered from the caches, if
+        enabled, or by a plain nearest neighbor query. If filters are given and
+        match only few tracks, the distances to those tracks are computed exactly
+        ("prefilter"). Otherwise, an over-fetched window of nearest neighbors is
+        filtered, and the window is grown until `limit` tracks pass the filters
+        ("postfilter"). The user ID counts as a filter if other users have
+        embeddings in the same space, as they share its ANN indexes.
+
+        Args:
+            vec (numpy.typing.ArrayLike): The vector from which to start the neighbor search.
+            limit (int): Limit the number of returned results. Default is 10.
+            offset (Optional[int]): Offset into the paginated results (requires limit).
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict): Dictionary containing the keywords to search for
+                over the track.resource.meta field. The dictionary's values
+                should contain singular search tokens and the keys currently have no
+                effect but might in the future. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            embedding_name (str, optional): Name of the embedding plugin for which to
+                retrieve and compare the vectors. If none is given, the name of the
+                currently configured embedding plugin for the library vector extension
+                is used.
+            embedding_version (str, optional): Version of the embedding plugin for
+                which to retrieve and compare the vectors. If none is given, the
+                version of the currently configured embedding plugin for the library
+                vector extension is used.
+            distance_metric (Optional[DistanceMetric], optional): The distance metric
+                to use. Defaults to None.
+            ef_search (int, optional): Size of the candidate list of HNSW index
+                scans. Higher values increase recall at the cost of latency.
+                Defaults to the `hnsw_ef_search` config.
+            probes (int, optional): Number of lists probed by IVFFlat index scans.
+                Higher values increase recall at the cost of latency.
+                Defaults to the `ivfflat_probes` config.
+            iterative_scan (str, optional): Iterative index scan mode, one of
+                "off", "strict_order" or "relaxed_order" (requires pgvector 0.8).
+                Defaults to the `vector_iterative_scan` config.
+            cursor (str, optional): Cursor for seek pagination (excludes offset).
+                Pass "" for the first page, then the `next_cursor` of the
+                previous page. Pages deeper than `MAX_EF_SEARCH` candidates
+                use iterative HNSW index scans. Defaults to None.
+
+        Returns:
+            Tuple[List[Tuple[NendoTrack, float]], SearchStrategy]: List of tuples
+                containing a track in the first position and their distance
+                ("score") in the second position, ordered by their distance in
+                ascending order, or a `Page` of them if a cursor is given. And
+                the strategy that was used for the search.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        # cast to float32 for compatibility with pgvector
+        vec = vec.astype(np.float32)
+        if cursor is not None:
+            return self._nearest_page(
+                vec=vec,
+                limit=limit,
+                offset=offset,
+                cursor=cursor,
+                filters=filters,
+                search_meta=search_meta,
+                meta_match=meta_match,
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=collection_id,
+                plugin_names=plugin_names,
+                embedding_name=embedding_name,
+                embedding_version=embedding_version,
+                distance_metric=distance_metric,
+                ef_search=ef_search,
+                probes=probes,
+                iterative_scan=iterative_scan,
+            )
+        nearest, store_nearest = self._cached_nearest(
+            vec=vec,
+            limit=limit,
+            offset=offset,
+            filters=filters,
+            search_meta=search_meta,
+            meta_match=meta_match,
+            track_type=track_type,
+            user_id=user_id,
+            collection_id=collection_id,
+            plugin_names=plugin_names,
+            embedding_name=embedding_name,
+            embedding_version=embedding_version,
+            distance_metric=distance_metric,
+            ef_search=ef_search,
+            probes=probes,
+            iterative_scan=iterative_scan,
+        )
+        if nearest is not None:
+            tracks = {
+                track.id: track
+                for track in self.get_tracks_by_ids(
+                    track_ids=[track_id for track_id, _ in nearest],
+                )
+            }
+            return [
+                (tracks[track_id], distance)
+                for track_id, distance in nearest
+                if track_id in tracks
+            ], SearchStrategy.cache
+        with self.session_scope() as session:
+            rows, strategy = self._run_nearest_query(
+                session=session,
+                vec=vec,
+                limit=limit,
+                offset=offset,
+                entities=[model.NendoTrackDB],
+                filters=filters,
+                search_meta=search_meta,
+                meta_match=meta_match,
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=collection_id,
+                plugin_names=plugin_names,
+                embedding_name=embedding_name,
+                embedding_version=embedding_version,
+                distance_metric=distance_metric,
+                ef_search=ef_search,
+                probes=probes,
+                iterative_scan=iterative_scan,
+            )
+            # Construct list of tuples (track, score)
+            results = [
+                (NendoTrack.model_validate(track), distance)
+                for track, distance in rows
+            ]
+        if store_nearest is not None:
+            store_nearest([(track.id, distance) for track, distance in results])
+        return results, strategy
+
+    def nearest_by_vectors_with_score(
+        self,
+        vecs: List[npt.ArrayLike],
+        limit: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+    ) -> List[List[Tuple[NendoTrack, float]]]:
+        """Obtain the n nearest neighboring tracks to each of several vectors.
+
+        All vectors are searched in a single round trip, by joining the list of
+        query vectors laterally against the nearest neighbor query. Each track is
+        only hydrated once, even if it is a neighbor of several query vectors.
+        Filters are applied like in `nearest_by_vector_with_strategy()`: exactly
+        if only few tracks pass them, otherwise to a window of nearest neighbors
+        of each vector, which is grown until every vector has `limit` results.
+
+        Args:
+            vecs (List[numpy.typing.ArrayLike]): The vectors from which to start
+                the neighbor searches.
+            limit (int): Limit the number of returned results per vector.
+                Default is 10.
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict): Dictionary containing the keywords to search for
+                over the track.resource.meta field. The dictionary's values
+                should contain singular search tokens and the keys currently have no
+                effect but might in the future. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            embedding_name (str, optional): Name of the embedding plugin for which to
+                retrieve and compare the vectors. If none is given, the name of the
+                currently configured embedding plugin for the library vector extension
+                is used.
+            embedding_version (str, optional): Version of the embedding plugin for
+                which to retrieve and compare the vectors. If none is given, the
+                version of the currently configured embedding plugin for the library
+                vector extension is used.
+            distance_metric (Optional[DistanceMetric], optional): The distance metric
+                to use. Defaults to None.
+            ef_search (int, optional): Size of the candidate list of HNSW index
+                scans. Defaults to the `hnsw_ef_search` config.
+            probes (int, optional): Number of lists probed by IVFFlat index scans.
+                Defaults to the `ivfflat_probes` config.
+            iterative_scan (str, optional): Iterative index scan mode, one of
+                "off", "strict_order" or "relaxed_order" (requires pgvector 0.8).
+                Defaults to the `vector_iterative_scan` config.
+
+        Returns:
+            List[List[Tuple[NendoTrack, float]]]: One list per given vector, in the
+                same order as `vecs`, each containing tuples of a track and its
+                distance ("score") to the vector, ordered by their distance in
+                ascending order.
+        """
+        if len(vecs) == 0:
+            return []
+        user_id = self._ensure_user_uuid(user_id)
+        # cast to float32 for compatibility with pgvector
+        query_vectors = values(
+            column("idx", Integer),
+            column("vec", pgvector.sqlalchemy.Vector()),
+            name="query_vectors",
+        ).data(list(enumerate(vectors_to_float32(vecs))))
+        vec = cast(query_vectors.c.vec, pgvector.sqlalchemy.Vector())
+        filter_args = {
+            "filters": filters,
+            "search_meta": search_meta,
+            "meta_match": meta_match,
+            "track_type": track_type,
+            "user_id": user_id,
+            "collection_id": collection_id,
+            "plugin_names": plugin_names,
+        }
+        nearest_args = {
+            "embedding_name": embedding_name,
+            "embedding_version": embedding_version,
+            "distance_metric": distance_metric,
+        }
+        with self.session_scope() as session:
+            strategy = self._get_search_strategy(
+                session=session,
+                embedding_name=embedding_name,
+                embedding_version=embedding_version,
+                **filter_args,
+            )
+            overfetch = max(self.plugin_config.postfilter_overfetch, 2)
+            window = limit
+            if strategy == SearchStrategy.postfilter:
+                window *= overfetch
+            while True:
+                # prefiltered searches are exact anyway
+                rerank_candidates = None
+                if strategy != SearchStrategy.prefilter:
+                    rerank_candidates = self._get_rerank_candidates(
+                        session=session,
+                        window=window,
+                        embedding_name=embedding_name,
+                        embedding_version=embedding_version,
+                    )
+                if strategy == SearchStrategy.postfilter:
+                    candidates = (
+                        self._get_nearest_query(
+                            session=session,
+                            vec=vec,
+                            user_id=user_id,
+                            entities=[NendoEmbeddingDB.track_id],
+                            rerank_candidates=rerank_candidates,
+                            **nearest_args,
+                        )
+                        # refer to the query vectors of the outermost query
+                        .correlate(query_vectors)
+                        .order_by(asc("distance"))
+                        .limit(window)
+                        .subquery()
+                        .lateral("candidates")
+                    )
+                    query = (
+                        session.query(candidates.c.track_id, candidates.c.distance)
+                        .select_from(candidates)
+                        .join(
+                            model.NendoTrackDB,
+                            model.NendoTrackDB.id == candidates.c.track_id,
+                        )
+                    )
+                    query = self._get_filtered_tracks_query(
+                        session=session,
+                        query=query,
+                        search_meta=[],
+                        **{
+                            k: v
+                            for k, v in filter_args.items()
+                            if k not in ("search_meta", "meta_match")
+                        },
+                    )
+                    query = self._get_meta_filter_query(
+                        query=query,
+                        search_meta=search_meta,
+                        meta_match=meta_match,
+                    ).order_by(candidates.c.distance)
+                else:
+                    query = self._get_filtered_nearest_query(
+                        session=session,
+                        vec=vec,
+                        entities=[NendoEmbeddingDB.track_id],
+                        rerank_candidates=rerank_candidates,
+                        prefilter=strategy == SearchStrategy.prefilter,
+                        **filter_args,
+                        **nearest_args,
+                    ).order_by(asc("distance"))
+                nearest = query.limit(limit).subquery().lateral("nearest")
+                query = (
+                    session.query(
+                        query_vectors.c.idx,
+                        model.NendoTrackDB,
+                        nearest.c.distance,
+                    )
+                    .select_from(query_vectors)
+                    .join(nearest, true())
+                    .join(
+                        model.NendoTrackDB,
+                        model.NendoTrackDB.id == nearest.c.track_id,
+                    )
+                    .order_by(query_vectors.c.idx, nearest.c.distance)
+                )
+                self._set_vector_search_params(
+                    session=session,
+                    # HNSW index scans return at most `ef_search` rows
+                    ef_search=self._get_candidate_ef_search(
+                        num_candidates=rerank_candidates or window,
+                        ef_search=ef_search,
+                    ),
+                    probes=probes,
+                    iterative_scan=iterative_scan,
+                )
+                rows = query.all()
+                if strategy != SearchStrategy.postfilter:
+                    break
+                num_results = collections.Counter(idx for idx, _, _ in rows)
+                plugin_name, plugin_version = self._get_embedding_space(
+                    plugin_name=embedding_name,
+                    plugin_version=embedding_version,
+                )
+                if all(
+                    num_results[idx] >= limit for idx in range(len(vecs))
+                ) or self._count_space_embeddings(
+                    session=session,
+                    # count up to the largest window, so that the cached
+                    # count answers the later iterations as well
+                    max_count=max(
+                        window, self.plugin_config.postfilter_max_window,
+                    ) + 1,
+                    # the index scans see the embeddings of all users
+                    user_id=None,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                ) <= window:
+                    break
+                if window >= self.plugin_config.postfilter_max_window:
+                    # the filters are too restrictive for the index after all
+                    strategy = SearchStrategy.prefilter
+                    continue
+                window = min(
+                    window * overfetch,
+                    self.plugin_config.postfilter_max_window,
+                )
+            results = [[] for _ in vecs]
+            tracks = {}
+            for idx, track_db, distance in rows:
+                if track_db.id not in tracks:
+                    tracks[track_db.id] = NendoTrack.model_validate(track_db)
+                results[idx].append((tracks[track_db.id], distance))
+            return results
+
+
+    def nearest_track_ids_by_vector_with_score(
+        self,
+        vec: npt.ArrayLike,
+        limit: int = 10,
+        offset: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        columns: Optional[List[str]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+    ) -> List[Tuple[Any, ...]]:
+        """Obtain the IDs of the n nearest neighboring tracks to a vector.
+
+        Lightweight variant of `nearest_by_vector_with_score()` that neither loads
+        the embedding vectors nor hydrates `NendoTrack` objects. Use
+        `get_tracks_by_ids()` to hydrate the results on demand. With the default
+        columns, the vector cache is used in the same way as for
+        `nearest_by_vector_with_score()`.
+
+        Args:
+            vec (numpy.typing.ArrayLike): The vector from which to start the neighbor search.
+            limit (int): Limit the number of returned results. Default is 10.
+            offset (Optional[int]): Offset into the paginated results (requires limit).
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict): Dictionary containing the keywords to search for
+                over the track.resource.meta field. The dictionary's values
+                should contain singular search tokens and the keys currently have no
+                effect but might in the future. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            embedding_name (str, optional): Name of the embedding plugin for which to
+                retrieve and compare the vectors. If none is given, the name of the
+                currently configured embedding plugin for the library vector extension
+                is used.
+            embedding_version (str, optional): Version of the embedding plugin for
+                which to retrieve and compare the vectors. If none is given, the
+                version of the currently configured embedding plugin for the library
+                vector extension is used.
+            distance_metric (Optional[DistanceMetric], optional): The distance metric
+                to use. Defaults to None.
+            columns (List[str], optional): Names of the track columns to return,
+                e.g. `["id", "track_type", "meta"]`. Defaults to `["id"]`.
+            ef_search (int, optional): Size of the candidate list of HNSW index
+                scans. Defaults to the `hnsw_ef_search` config.
+            probes (int, optional): Number of lists probed by IVFFlat index scans.
+                Defaults to the `ivfflat_probes` config.
+            iterative_scan (str, optional): Iterative index scan mode, one of
+                "off", "strict_order" or "relaxed_order" (requires pgvector 0.8).
+                Defaults to the `vector_iterative_scan` config.
+
+        Raises:
+            ValueError: If one of the given columns does not exist.
+
+        Returns:
+            List[Tuple[Any, ...]]: List of tuples containing the values of the
+                requested columns followed by the distance ("score"), ordered by
+                their distance in ascending order. With the default columns,
+                these are `(track_id, distance)` pairs.
+        """
+        columns = columns or ["id"]
+        track_columns = model.NendoTrackDB.__table__.columns
+        for column_name in columns:
+            if column_name not in track_columns:
+                raise ValueError(
+                    f"Got unexpected track column: {column_name}. "
+                    f"Should be one of {', '.join(track_columns.keys())}.",
+                )
+        user_id = self._ensure_user_uuid(user_id)
+        # cast to float32 for compatibility with pgvector
+        vec = vec.astype(np.float32)
+        store_nearest = None
+        if columns == ["id"]:
+            nearest, store_nearest = self._cached_nearest(
+                vec=vec,
+                limit=limit,
+                offset=offset,
+                filters=filters,
+                search_meta=search_meta,
+                meta_match=meta_match,
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=collection_id,
+                plugin_names=plugin_names,
+                embedding_name=embedding_name,
+                embedding_version=embedding_version,
+                distance_metric=distance_metric,
+                ef_search=ef_search,
+                probes=probes,
+                iterative_scan=iterative_scan,
+            )
+            if nearest is not None:
+                return nearest
+        with self.session_scope() as session:
+            rows, strategy = self._run_nearest_query(
+                session=session,
+                vec=vec,
+                limit=limit,
+                offset=offset,
+                entities=[
+                    getattr(model.NendoTrackDB, column_name) for column_name in columns
+                ],
+                filters=filters,
+                search_meta=search_meta,
+                meta_match=meta_match,
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=collection_id,
+                plugin_names=plugin_names,
+                embedding_name=embedding_name,
+                embedding_version=embedding_version,
+                distance_metric=distance_metric,
+                ef_search=ef_search,
+                probes=probes,
+                iterative_scan=iterative_scan,
+            )
+            results = [tuple(row) for row in rows]
+        if store_nearest is not None:
+            store_nearest(results)
+        return results
+    
+    def count_nearest_by_track(
+        self,
+        track: NendoTrack,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        session: Optional[Session] = None,
+        max_distance: Optional[float] = None,
+    ) -> int:
+        """Count the number of tracks in the db after applying various filter criteria.
+
+        Counts the other tracks with an embedding in the track's embedding space
+        that pass the filters, each track once however many embeddings it has.
+        Distances are only computed if `max_distance` is given, and the track is
+        never embedded: if it has no embedding, all tracks of the space are
+        counted.
+
+        Args:
+            track (NendoTrack): The track from which to start the neighbor search.
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict): Dictionary containing the keywords to search for
+                over the track.resource.meta field. The dictionary's values
+                should contain singular search tokens and the keys currently have no
+                effect but might in the future. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            embedding_name (str, optional): Name of the embedding plugin for which to
+                retrieve and compare the vectors. If none is given, the name of the
+                first embedding found for that track is used. If no embedding exists,
+                the name of the currently configured embedding plugin for the library
+                vector extension is used.
+            embedding_version (str, optional): Version of the embedding plugin for
+                which to retrieve and compare the vectors. If none is given, the name
+                of the first embedding found for that track is used. If no embedding
+                exists,the version of the currently configured embedding plugin for
+                the library vector extension is used.
+            distance_metric (Optional[DistanceMetric], optional): The distance metric
+                to use. Defaults to None.
+            session (sqlalchemy.orm.Session, optional): The database session.
+            max_distance (float, optional): Only count the tracks with an embedding
+                whose distance to the track's embedding is at most this value.
+                Defaults to None.
+
+        Raises:
+            ValueError: If `max_distance` is given but the track has no embedding
+                in the embedding space.
+
+        Returns:
+            int: Number of tracks in the library that match the specified criteria.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        track_embeddings = self.get_embeddings(
+            track_id=track.id,
+            plugin_name=embedding_name,
+            plugin_version=embedding_version,
+        )
+        if len(track_embeddings) > 0:
+            track_embedding = track_embeddings[0]
+            plugin_name = track_embedding.plugin_name
+            plugin_version = track_embedding.plugin_version
+        else:
+            track_embedding = None
+            plugin_name, plugin_version = self._get_embedding_space(
+                plugin_name=embedding_name,
+                plugin_version=embedding_version,
+            )
+        if max_distance is not None and track_embedding is None:
+            raise ValueError(
+                f"Track {track.id} has no embedding for {plugin_name} "
+                f"{plugin_version}. Use `embed_track()` to embed it first.",
+            )
+        vec = (
+            track_embedding.embedding.astype(np.float32)
+            if max_distance is not None else None
+        )
+        distance_metric = (
+            distance_metric if distance_metric is not None else self._default_distance
+        )
+        key = None
+        if self.result_cache is not None:
+            key = make_key(
+                vec,
+                count=True,
+                track_id=track.id,
+                max_distance=max_distance,
+                filters={k: v for k, v in (filters or {}).items() if v is not None},
+                search_meta=search_meta or {},
+                meta_match=MetaMatch(meta_match).value,
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=(
+                    ensure_uuid(collection_id) if collection_id is not None else None
+                ),
+                plugin_names=plugin_names or [],
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                distance_metric=(
+                    DistanceMetric(distance_metric).value
+                    if max_distance is not None else None
+                ),
+            )
+            generation = self.result_cache.generation
+            count = self.result_cache.get(key)
+            if count is not None:
+                return count
+        s = session or self.session_scope()
+        with s as session_local:
+            # count each neighbor track once, however many embeddings it has,
+            # and never the track itself
+            query = session_local.query(
+                func.count(distinct(NendoEmbeddingDB.track_id)),
+            ).filter(
+                NendoEmbeddingDB.user_id == user_id,
+                NendoEmbeddingDB.plugin_name == plugin_name,
+                NendoEmbeddingDB.plugin_version == plugin_version,
+                NendoEmbeddingDB.track_id != track.id,
+            )
+            if max_distance is not None:
+                distance = self._pg_distance(
+                    distance_metric,
+                    dimensions=self._get_embedding_dimensions(
+                        plugin_name=plugin_name,
+                        plugin_version=plugin_version,
+                        session=session_local,
+                    ),
+                )
+                query = query.filter(distance(vec) <= max_distance)
+            if self._has_track_filters(
+                filters=filters,
+                search_meta=search_meta,
+                track_type=track_type,
+                collection_id=collection_id,
+            ):
+                query = query.join(
+                    model.NendoTrackDB,
+                    NendoEmbeddingDB.track_id == model.NendoTrackDB.id,
+                )
+                query = self._get_filtered_tracks_query(
+                    session=session_local,
+                    query=query,
+                    filters=filters,
+                    search_meta=[],
+                    track_type=track_type,
+                    user_id=user_id,
+                    collection_id=collection_id,
+                    plugin_names=plugin_names,
+                )
+                query = self._get_meta_filter_query(
+                    query=query,
+                    search_meta=search_meta,
+                    meta_match=meta_match,
+                )
+            count = query.scalar()
+        if key is not None:
+            self.result_cache.put(
+                key,
+                count,
+                scope=ResultCacheScope(user_id, plugin_name, plugin_version),
+                generation=generation,
+            )
+        return count
+
+    # ======================
+    #
+    # TRACK NEIGHBORS
+    #
+    # ======================
+
+    def _get_neighbor_graph(
+        self,
+        session: Session,
+        user_id: uuid.UUID,
+        plugin_name: str,
+        plugin_version: str,
+        distance_metric: DistanceMetric,
+    ) -> Optional[NendoNeighborGraphDB]:
+        return (
+            session.query(NendoNeighborGraphDB)
+            .filter(
+                NendoNeighborGraphDB.user_id == user_id,
+                NendoNeighborGraphDB.plugin_name == plugin_name,
+                NendoNeighborGraphDB.plugin_version == plugin_version,
+                NendoNeighborGraphDB.distance_metric == DistanceMetric(distance_metric).value,
+            )
+            .one_or_none()
+        )
+
+    def _find_track_neighbors(
+        self,
+        session: Session,
+        graph: NendoNeighborGraphDB,
+        track_id: uuid.UUID,
+    ) -> List[Tuple[uuid.UUID, float]]:
+        """Find the k nearest tracks of a track, using the ANN indexes if any.
+
+        The distance to a track with several embeddings is the smallest
+        distance to any of them.
+        """
+        vectors = [
+            row.embedding
+            for row in session.query(NendoEmbeddingDB.embedding).filter(
+                NendoEmbeddingDB.track_id == track_id,
+                NendoEmbeddingDB.user_id == graph.user_id,
+                NendoEmbeddingDB.plugin_name == graph.plugin_name,
+                NendoEmbeddingDB.plugin_version == graph.plugin_version,
+                NendoEmbeddingDB.embedding.isnot(None),
+            )
+        ]
+        window = graph.k * NEIGHBOR_OVERFETCH
+        rerank_candidates = self._get_rerank_candidates(
+            session=session,
+            window=window,
+            embedding_name=graph.plugin_name,
+            embedding_version=graph.plugin_version,
+        )
+        nearest = {}
+        for vec in vectors:
+            query = (
+                self._get_nearest_query(
+                    session=session,
+                    vec=vec,
+                    user_id=graph.user_id,
+                    embedding_name=graph.plugin_name,
+                    embedding_version=graph.plugin_version,
+                    distance_metric=graph.distance_metric,
+                    entities=[NendoEmbeddingDB.track_id],
+                    rerank_candidates=rerank_candidates,
+                )
+                .filter(NendoEmbeddingDB.track_id != track_id)
+                .order_by(asc("distance"))
+                .limit(window)
+            )
+            self._set_vector_search_params(
+                session=session,
+                ef_search=self._get_candidate_ef_search(
+                    num_candidates=rerank_candidates or window,
+                ),
+            )
+            for neighbor_id, distance in query.all():
+                # NaN distances of zero vectors never make them neighbors
+                if distance is None or np.isnan(distance):
+                    continue
+                if distance < nearest.get(neighbor_id, np.inf):
+                    nearest[neighbor_id] = distance
+        return sorted(nearest.items(), key=lambda item: item[1])[: graph.k]
+
+    def _store_track_neighbors(
+        self,
+        session: Session,
+        graph: NendoNeighborGraphDB,
+        track_id: uuid.UUID,
+        neighbors: List[Tuple[uuid.UUID, float]],
+    ) -> None:
+        """Replace the neighbors of a track and add it to those of its neighbors.
+
+        The track is kept as a neighbor of its neighbors only if it is closer
+        than their current k-th neighbor.
+        """
+        session.query(NendoTrackNeighborDB).filter(
+            NendoTrackNeighborDB.graph_id == graph.id,
+            NendoTrackNeighborDB.track_id == track_id,
+        ).delete()
+        if len(neighbors) == 0:
+            return
+        session.execute(
+            insert(NendoTrackNeighborDB),
+            [
+                {
+                    "graph_id": graph.id,
+                    "track_id": track_id,
+                    "neighbor_id": neighbor_id,
+                    "distance": distance,
+                }
+                for neighbor_id, distance in neighbors
+            ],
+        )
+        reverse = pg_insert(NendoTrackNeighborDB).values(
+            [
+                {
+                    "graph_id": graph.id,
+                    "track_id": neighbor_id,
+                    "neighbor_id": track_id,
+                    "distance": distance,
+                }
+                for neighbor_id, distance in neighbors
+            ],
+        )
+        session.execute(
+            reverse.on_conflict_do_update(
+                index_elements=["graph_id", "track_id", "neighbor_id"],
+                set_={"distance": reverse.excluded.distance},
+            ),
+        )
+        ranked = (
+            select(
+                NendoTrackNeighborDB.track_id,
+                NendoTrackNeighborDB.neighbor_id,
+                func.row_number().over(
+                    partition_by=NendoTrackNeighborDB.track_id,
+                    order_by=(
+                        NendoTrackNeighborDB.distance,
+                        NendoTrackNeighborDB.neighbor_id,
+                    ),
+                ).label("rank"),
+            )
+            .where(
+                NendoTrackNeighborDB.graph_id == graph.id,
+                NendoTrackNeighborDB.track_id.in_(
+                    [neighbor_id for neighbor_id, _ in neighbors],
+                ),
+            )
+            .subquery("ranked")
+        )
+        session.execute(
+            delete(NendoTrackNeighborDB)
+            .where(
+                NendoTrackNeighborDB.graph_id == graph.id,
+                NendoTrackNeighborDB.track_id == ranked.c.track_id,
+                NendoTrackNeighborDB.neighbor_id == ranked.c.neighbor_id,
+                ranked.c.rank > graph.k,
+            )
+            .execution_options(synchronize_session=False),
+        )
+
+    def _has_neighbor_graphs(
+        self,
+        session: Session,
+        user_id: Optional[uuid.UUID],
+        plugin_name: str,
+        plugin_version: str,
+    ) -> bool:
+        space = (user_id, plugin_name, plugin_version)
+        if space not in self.neighbor_graph_spaces:
+            self.neighbor_graph_spaces[space] = session.query(
+                session.query(NendoNeighborGraphDB).filter(
+                    NendoNeighborGraphDB.user_id == user_id,
+                    NendoNeighborGraphDB.plugin_name == plugin_name,
+                    NendoNeighborGraphDB.plugin_version == plugin_version,
+                ).exists(),
+            ).scalar()
+        return self.neighbor_graph_spaces[space]
+
+    def _update_track_neighbors(
+        self,
+        session: Session,
+        track_ids: List[uuid.UUID],
+        user_id: Optional[uuid.UUID],
+        plugin_name: str,
+        plugin_version: str,
+    ) -> None:
+        """Update the neighbor graphs of an embedding space for changed tracks.
+
+        Must be called after the embeddings of the tracks have been flushed,
+        added, updated or removed. The changed tracks are removed from the
+        neighbor lists of other tracks, which are refilled, before their own
+        neighbors are found and stored again. Tracks left without embeddings
+        in the space drop out of the graphs. Spaces known to have no neighbor
+        graphs are skipped without a query.
+        """
+        # embeddings without a track are no part of the graphs
+        track_ids = [track_id for track_id in track_ids if track_id is not None]
+        if len(track_ids) == 0:
+            return
+        if not self._has_neighbor_graphs(
+            session=session,
+            user_id=user_id,
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        ):
+            return
+        graphs = session.query(NendoNeighborGraphDB).filter(
+            NendoNeighborGraphDB.user_id == user_id,
+            NendoNeighborGraphDB.plugin_name == plugin_name,
+            NendoNeighborGraphDB.plugin_version == plugin_version,
+        ).all()
+        for graph in graphs:
+            # the changed tracks might not be neighbors of these tracks anymore
+            reverse_edges = session.query(NendoTrackNeighborDB).filter(
+                NendoTrackNeighborDB.graph_id == graph.id,
+                NendoTrackNeighborDB.neighbor_id.in_(track_ids),
+            )
+            affected = {row.track_id for row in reverse_edges} - set(track_ids)
+            reverse_edges.delete(synchronize_session=False)
+            for track_id in [*affected, *track_ids]:
+                self._store_track_neighbors(
+                    session=session,
+                    graph=graph,
+                    track_id=track_id,
+                    neighbors=self._find_track_neighbors(
+                        session=session,
+                        graph=graph,
+                        track_id=track_id,
+                    ),
+                )
+
+    def _remove_track_neighbors(self, session: Session, track_id: uuid.UUID) -> None:
+        """Remove a track from all neighbor graphs and refill its neighbors' lists.
+
+        Must be called after the embeddings of the track have been removed.
+        """
+        graphs = {graph.id: graph for graph in session.query(NendoNeighborGraphDB)}
+        if len(graphs) == 0:
+            return
+        affected = session.query(
+            NendoTrackNeighborDB.graph_id,
+            NendoTrackNeighborDB.track_id,
+        ).filter(NendoTrackNeighborDB.neighbor_id == track_id).all()
+        session.query(NendoTrackNeighborDB).filter(
+            NendoTrackNeighborDB.neighbor_id == track_id,
+        ).delete()
+        session.query(NendoTrackNeighborDB).filter(
+            NendoTrackNeighborDB.graph_id.in_(list(graphs)),
+            NendoTrackNeighborDB.track_id == track_id,
+        ).delete()
+        for graph_id, neighbor_id in affected:
+            self._store_track_neighbors(
+                session=session,
+                graph=graphs[graph_id],
+                track_id=neighbor_id,
+                neighbors=self._find_track_neighbors(
+                    session=session,
+                    graph=graphs[graph_id],
+                    track_id=neighbor_id,
+                ),
+            )
+
+    def build_track_neighbors(
+        self,
+        k: Optional[int] = None,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> int:
+        """Precompute the k nearest neighbors of every track of an embedding space.
+
+        The exact distances between all tracks are computed in blocks using
+        NumPy, from the embedding matrix returned by `get_embedding_matrix()`.
+        The neighbors are stored in the `track_neighbors` table, replacing the
+        previous ones in a single transaction, and read by
+        `get_track_neighbors()`. Once built, the neighbors are updated whenever
+        embeddings of the space are added, updated or removed, or tracks are
+        removed.
+        These updates use the ANN indexes of the space, so call this method
+        again from time to time to restore exact neighbors.
+
+        Args:
+            k (int, optional): Number of neighbors to store per track. Defaults
+                to the `track_neighbors_k` config.
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            distance_metric (DistanceMetric, optional): The distance metric to use.
+                Defaults to the library's default distance metric.
+            user_id (Union[str, UUID], optional): The user whose tracks to
+                process. Defaults to the library's user.
+
+        Returns:
+            int: The number of tracks for which neighbors were stored.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        distance_metric = DistanceMetric(
+            distance_metric if distance_metric is not None else self._default_distance,
+        )
+        k = k or self.plugin_config.track_neighbors_k
+        track_ids, matrix = self.get_embedding_matrix(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+            user_id=user_id,
+        )
+        unique_track_ids, order, starts = group_rows(track_ids)
+        num_tracks = 0
+        with self.session_scope() as session:
+            graph = self._get_neighbor_graph(
+                session=session,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                distance_metric=distance_metric,
+            )
+            if graph is None:
+                graph = NendoNeighborGraphDB(
+                    user_id=user_id,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                    distance_metric=distance_metric.value,
+                    k=k,
+                )
+                session.add(graph)
+                session.flush()
+            graph.k = k
+            session.query(NendoTrackNeighborDB).filter(
+                NendoTrackNeighborDB.graph_id == graph.id,
+            ).delete()
+            for first, neighbors, distances in group_nearest_neighbors(
+                matrix=matrix[order],
+                starts=starts,
+                k=k,
+                distance_metric=distance_metric,
+            ):
+                rows, cols = np.nonzero(neighbors >= 0)
+                session.execute(
+                    insert(NendoTrackNeighborDB),
+                    [
+                        {
+                            "graph_id": graph.id,
+                            "track_id": unique_track_ids[first + row],
+                            "neighbor_id": unique_track_ids[neighbor],
+                            "distance": float(distance),
+                        }
+                        for row, neighbor, distance in zip(  # noqa: B905
+                            rows,
+                            neighbors[rows, cols],
+                            distances[rows, cols],
+                        )
+                    ],
+                )
+                num_tracks += len(np.unique(rows))
+            self._notify(
+                session=session,
+                entity=ChangeEntity.neighbor_graph,
+                action=ChangeAction.update,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+        self.neighbor_graph_spaces[(user_id, plugin_name, plugin_version)] = True
+        return num_tracks
+
+    def drop_track_neighbors(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> bool:
+        """Remove the precomputed neighbors of an embedding space.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            distance_metric (DistanceMetric, optional): The distance metric of the
+                neighbors. Defaults to the library's default distance metric.
+            user_id (Union[str, UUID], optional): The user whose neighbors to
+                remove. Defaults to the library's user.
+
+        Returns:
+            bool: True if the neighbors were removed, False if none were built.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            graph = self._get_neighbor_graph(
+                session=session,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                distance_metric=(
+                    distance_metric if distance_metric is not None
+                    else self._default_distance
+                ),
+            )
+            if graph is None:
+                return False
+            # the track neighbors are removed by the cascading foreign key
+            session.delete(graph)
+            self._notify(
+                session=session,
+                entity=ChangeEntity.neighbor_graph,
+                action=ChangeAction.delete,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+        # the space might still have graphs of other distance metrics
+        self.neighbor_graph_spaces.pop((user_id, plugin_name, plugin_version), None)
+        return True
+
+    def get_track_neighbors(
+        self,
+        track_id: Union[str, uuid.UUID],
+        limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+        embedding_name: Optional[str] = None,
+        embedding_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+    ) -> List[Tuple[NendoTrack, float]]:
+        """Get the precomputed nearest neighbors of a track, with their distances.
+
+        Reads the neighbors stored by `build_track_neighbors()` with a single
+        indexed query, instead of running a nearest neighbor search. Filters are
+        applied to the stored neighbors, so fewer than the stored number of
+        neighbors may be returned.
+
+        Args:
+            track_id (Union[str, uuid.UUID]): ID of the track.
+            limit (int, optional): Limit the number of returned neighbors.
+                Defaults to all stored neighbors.
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict, optional): Dictionary containing the keywords to
+                search for over the track.resource.meta field. Defaults to None.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            embedding_name (str, optional): Name of the embedding plugin. Defaults
+                to the name of the currently configured embedding plugin.
+            embedding_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            distance_metric (DistanceMetric, optional): The distance metric of the
+                neighbors. Defaults to the library's default distance metric.
+
+        Returns:
+            List[Tuple[NendoTrack, float]]: List of tuples containing a track in
+                the first position and their distance ("score") in the second
+                position, ordered by their distance in ascending order. Empty if
+                no neighbors were built for the track.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=embedding_name,
+            plugin_version=embedding_version,
+        )
+        distance_metric = DistanceMetric(
+            distance_metric if distance_metric is not None else self._default_distance,
+        )
+        with self.session_scope() as session:
+            query = (
+                session.query(model.NendoTrackDB, NendoTrackNeighborDB.distance)
+                .select_from(NendoTrackNeighborDB)
+                .join(
+                    NendoNeighborGraphDB,
+                    NendoNeighborGraphDB.id == NendoTrackNeighborDB.graph_id,
+                )
+                .join(
+                    model.NendoTrackDB,
+                    model.NendoTrackDB.id == NendoTrackNeighborDB.neighbor_id,
+                )
+                .filter(
+                    NendoNeighborGraphDB.user_id == user_id,
+                    NendoNeighborGraphDB.plugin_name == plugin_name,
+                    NendoNeighborGraphDB.plugin_version == plugin_version,
+                    NendoNeighborGraphDB.distance_metric == distance_metric.value,
+                    NendoTrackNeighborDB.track_id == ensure_uuid(track_id),
+                )
+            )
+            if self._has_track_filters(
+                filters=filters,
+                search_meta=search_meta,
+                track_type=track_type,
+                collection_id=collection_id,
+            ):
+                query = self._get_filtered_tracks_query(
+                    session=session,
+                    query=query,
+                    filters=filters,
+                    search_meta=[],
+                    track_type=track_type,
+                    user_id=user_id,
+                    collection_id=collection_id,
+                    plugin_names=plugin_names,
+                )
+                query = self._get_meta_filter_query(
+                    query=query,
+                    search_meta=search_meta,
+                    meta_match=meta_match,
+                )
+            query = query.order_by(NendoTrackNeighborDB.distance)
+            if limit is not None:
+                query = query.limit(limit)
+            return [
+                (NendoTrack.model_validate(track_db), distance)
+                for track_db, distance in query.all()
+            ]
+
+    # ======================
+    #
+    # NEAR DUPLICATES
+    #
+    # ======================
+
+    def find_duplicate_tracks(
+        self,
+        threshold: float,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        processes: Optional[int] = None,
+        add_collections: bool = False,
+        add_relationships: bool = False,
+    ) -> List[DuplicateCluster]:
+        """Find clusters of near-duplicate tracks across the whole library.
+
+        Runs an all-pairs similarity join over the embeddings of a space,
+        instead of one nearest neighbor search per track. The embeddings are
+        exported to a temporary memory-mapped file using
+        `get_embedding_matrix()`, and the distances between them are computed
+        in blocks across a pool of processes. Tracks are clustered if they are
+        connected by a chain of pairs whose distance is at most `threshold`.
+
+        Args:
+            threshold (float): The maximum distance between two embeddings of
+                near-duplicate tracks.
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            distance_metric (DistanceMetric, optional): The distance metric to use.
+                Defaults to the library's default distance metric.
+            user_id (Union[str, UUID], optional): The user whose tracks to
+                process. Defaults to the library's user.
+            processes (int, optional): Number of worker processes. Defaults to the
+                number of CPUs.
+            add_collections (bool): Whether to add a collection of type
+                "near_duplicates" per cluster. Defaults to False.
+            add_relationships (bool): Whether to add a "near_duplicate"
+                relationship between the tracks of each pair connecting a cluster,
+                with the pair's distance as metadata. Defaults to False.
+
+        Returns:
+            List[DuplicateCluster]: The clusters, largest first, each containing
+                the track IDs and the pairs of tracks connecting them.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        distance_metric = DistanceMetric(
+            distance_metric if distance_metric is not None else self._default_distance,
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "embeddings.npy")
+            track_ids, matrix = self.get_embedding_matrix(
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                user_id=user_id,
+                out=path,
+            )
+            # close the memory map, the workers open their own
+            del matrix
+            left, right, distances = similarity_join(
+                path=path,
+                threshold=threshold,
+                distance_metric=distance_metric,
+                processes=processes,
+            )
+        unique_track_ids, tracks = np.unique(track_ids, return_inverse=True)
+        left, right = tracks[left], tracks[right]
+        # embeddings of the same track are not duplicates
+        other = left != right
+        clusters = [
+            DuplicateCluster(
+                track_ids=[unique_track_ids[item] for item in items],
+                pairs=[
+                    (unique_track_ids[a], unique_track_ids[b], distance)
+                    for a, b, distance in edges
+                ],
+            )
+            for items, edges in cluster_pairs(
+                left[other],
+                right[other],
+                distances[other],
+            )
+        ]
+        for cluster in clusters:
+            if add_collections:
+                self.add_collection(
+                    name=f"Near duplicates of {cluster.track_ids[0]}",
+                    user_id=user_id,
+                    track_ids=cluster.track_ids,
+                    collection_type="near_duplicates",
+                    meta={
+                        "plugin_name": plugin_name,
+                        "plugin_version": plugin_version,
+                        "distance_metric": distance_metric.value,
+                        "threshold": threshold,
+                    },
+                )
+            if add_relationships:
+                for track_id, duplicate_id, distance in cluster.pairs:
+                    self.add_track_relationship(
+                        track_one_id=track_id,
+                        track_two_id=duplicate_id,
+                        relationship_type="near_duplicate",
+                        meta={"distance": distance},
+                    )
+        return clusters
+
+    # ======================
+    #
+    # CLUSTERING
+    #
+    # ======================
+
+    def _get_clustering(
+        self,
+        session: Session,
+        user_id: uuid.UUID,
+        plugin_name: str,
+        plugin_version: str,
+        name: str,
+    ) -> Optional[NendoClusteringDB]:
+        return (
+            session.query(NendoClusteringDB)
+            .filter(
+                NendoClusteringDB.user_id == user_id,
+                NendoClusteringDB.plugin_name == plugin_name,
+                NendoClusteringDB.plugin_version == plugin_version,
+                NendoClusteringDB.name == name,
+            )
+            .one_or_none()
+        )
+
+    def _has_clusterings(
+        self,
+        session: Session,
+        user_id: Optional[uuid.UUID],
+        plugin_name: str,
+        plugin_version: str,
+    ) -> bool:
+        space = (user_id, plugin_name, plugin_version)
+        if space not in self.clustering_spaces:
+            self.clustering_spaces[space] = session.query(
+                session.query(NendoClusteringDB).filter(
+                    NendoClusteringDB.user_id == user_id,
+                    NendoClusteringDB.plugin_name == plugin_name,
+                    NendoClusteringDB.plugin_version == plugin_version,
+                ).exists(),
+            ).scalar()
+        return self.clustering_spaces[space]
+
+    def _update_track_clusters(
+        self,
+        session: Session,
+        track_ids: List[uuid.UUID],
+        user_id: Optional[uuid.UUID],
+        plugin_name: str,
+        plugin_version: str,
+    ) -> None:
+        """Assign changed tracks to the nearest centroid of each clustering of a space.
+
+        Must be called after the embeddings of the tracks have been flushed,
+        added, updated or removed. Tracks left without embeddings in the space
+        lose their assignments. Spaces known to have no clusterings are
+        skipped without a query.
+        """
+        # embeddings without a track are no part of the clusterings
+        track_ids = [track_id for track_id in track_ids if track_id is not None]
+        if len(track_ids) == 0:
+            return
+        if not self._has_clusterings(
+            session=session,
+            user_id=user_id,
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        ):
+            return
+        clusterings = session.query(NendoClusteringDB).filter(
+            NendoClusteringDB.user_id == user_id,
+            NendoClusteringDB.plugin_name == plugin_name,
+            NendoClusteringDB.plugin_version == plugin_version,
+        ).all()
+        space_embeddings = (
+            NendoEmbeddingDB.user_id == user_id,
+            NendoEmbeddingDB.plugin_name == plugin_name,
+            NendoEmbeddingDB.plugin_version == plugin_version,
+            NendoEmbeddingDB.embedding.isnot(None),
+        )
+        for clustering in clusterings:
+            distance = self._pg_distance(
+                distance_metric=DistanceMetric(clustering.distance_metric),
+            )(NendoClusterCentroidDB.centroid)
+            nearest = (
+                select(
+                    NendoClusterCentroidDB.clustering_id,
+                    NendoEmbeddingDB.track_id,
+                    NendoClusterCentroidDB.cluster,
+                    distance,
+                )
+                .join(
+                    NendoClusterCentroidDB,
+                    NendoClusterCentroidDB.clustering_id == clustering.id,
+                )
+                .where(*space_embeddings, NendoEmbeddingDB.track_id.in_(track_ids))
+                .distinct(NendoEmbeddingDB.track_id)
+                .order_by(NendoEmbeddingDB.track_id, distance)
+            )
+            statement = pg_insert(NendoTrackClusterDB).from_select(
+                ["clustering_id", "track_id", "cluster", "distance"],
+                nearest,
+            )
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["clustering_id", "track_id"],
+                    set_={
+                        "cluster": statement.excluded.cluster,
+                        "distance": statement.excluded.distance,
+                    },
+                ),
+            )
+            session.execute(
+                delete(NendoTrackClusterDB).where(
+                    NendoTrackClusterDB.clustering_id == clustering.id,
+                    NendoTrackClusterDB.track_id.in_(track_ids),
+                    ~exists().where(
+                        *space_embeddings,
+                        NendoEmbeddingDB.track_id == NendoTrackClusterDB.track_id,
+                    ),
+                ),
+            )
+
+    def cluster_embeddings(
+        self,
+        k: int,
+        name: str = "default",
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        distance_metric: Optional[DistanceMetric] = None,
+        batch_size: Optional[int] = None,
+        max_epochs: Optional[int] = None,
+        seed: Optional[int] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+        add_collections: bool = False,
+    ) -> np.ndarray:
+        """Cluster the embeddings of a space with mini-batch k-means.
+
+        The embeddings are streamed from the database in batches using
+        `iter_embedding_batches()`, so memory use is bounded by the batch size
+        and the sample used to seed the centroids, regardless of the size of
+        the library. The centroids are stored in the `cluster_centroids` table,
+        and every track is assigned to the centroid nearest to any of its
+        embeddings in the `track_clusters` table, replacing a previous
+        clustering of the same name. Tracks whose embeddings are added, updated
+        or removed later are assigned to the nearest stored centroid again, or
+        lose their assignment if they have no embeddings left.
+
+        Args:
+            k (int): The number of clusters.
+            name (str): The name of the clustering, to keep several clusterings
+                of the same space. Defaults to "default".
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            distance_metric (DistanceMetric, optional): The distance metric to use,
+                either euclidean or cosine. Defaults to the library's default
+                distance metric.
+            batch_size (int, optional): Number of embeddings per mini-batch.
+                Defaults to the `embedding_batch_size` config.
+            max_epochs (int, optional): The maximum number of passes over the
+                embeddings. Defaults to the `kmeans_max_epochs` config.
+            seed (int, optional): Seed of the random number generator.
+            user_id (Union[str, UUID], optional): The user whose tracks to
+                cluster. Defaults to the library's user.
+            add_collections (bool): Whether to add a collection of type "cluster"
+                with the tracks of each cluster. Defaults to False.
+
+        Raises:
+            ValueError: If the distance metric is not supported, or the space
+                has fewer than k embeddings.
+
+        Returns:
+            np.ndarray: The centroids, one per row.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        distance_metric = check_kmeans_distance_metric(
+            distance_metric if distance_metric is not None else self._default_distance,
+        )
+        batch_size = batch_size or self.plugin_config.embedding_batch_size
+        max_epochs = max_epochs or self.plugin_config.kmeans_max_epochs
+        rng = np.random.default_rng(seed)
+
+        def batches() -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+            return self.iter_embedding_batches(
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                batch_size=batch_size,
+                user_id=user_id,
+            )
+
+        sample = None
+        for _, batch in batches():
+            sample = sample_rows(
+                sample=sample,
+                batch=batch,
+                size=k * KMEANS_SAMPLE_PER_CLUSTER,
+                rng=rng,
+            )
+        num_sampled = 0 if sample is None else len(sample[1])
+        if num_sampled < k:
+            raise ValueError(
+                f"Can not find {k} clusters among {num_sampled} embeddings "
+                f"of {plugin_name} {plugin_version}.",
+            )
+        centroids = kmeans_plus_plus(
+            sample=sample[1],
+            k=k,
+            distance_metric=distance_metric,
+            rng=rng,
+        )
+        del sample
+        counts = np.zeros(k, dtype=np.int64)
+        for _ in range(max_epochs):
+            shift = 0.0
+            for _, batch in batches():
+                shift = max(
+                    shift,
+                    minibatch_step(
+                        centroids=centroids,
+                        counts=counts,
+                        batch=batch,
+                        distance_metric=distance_metric,
+                    ),
+                )
+            if shift <= KMEANS_TOLERANCE:
+                break
+
+        # the cluster of a track is the one closest to any of its embeddings
+        assignments: Dict[uuid.UUID, Tuple[int, float]] = {}
+        for track_ids, batch in batches():
+            labels, distances = assign_clusters(
+                vectors=batch,
+                centroids=centroids,
+                distance_metric=distance_metric,
+            )
+            for track_id, label, distance in zip(  # noqa: B905
+                track_ids, labels, distances,
+            ):
+                if track_id not in assignments or distance < assignments[track_id][1]:
+                    assignments[track_id] = (int(label), float(distance))
+
+        with self.session_scope() as session:
+            clustering = self._get_clustering(
+                session=session,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                name=name,
+            )
+            if clustering is not None:
+                # the centroids and track clusters are removed by the cascading
+                # foreign keys
+                session.delete(clustering)
+                session.flush()
+            clustering = NendoClusteringDB(
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                name=name,
+                distance_metric=distance_metric.value,
+                k=k,
+            )
+            session.add(clustering)
+            session.flush()
+            session.execute(
+                insert(NendoClusterCentroidDB),
+                [
+                    {
+                        "clustering_id": clustering.id,
+                        "cluster": cluster,
+                        "centroid": centroid,
+                    }
+                    for cluster, centroid in enumerate(centroids)
+                ],
+            )
+            rows = [
+                {
+                    "clustering_id": clustering.id,
+                    "track_id": track_id,
+                    "cluster": cluster,
+                    "distance": distance,
+                }
+                for track_id, (cluster, distance) in assignments.items()
+            ]
+            for start in range(0, len(rows), batch_size):
+                session.execute(
+                    insert(NendoTrackClusterDB),
+                    rows[start:start + batch_size],
+                )
+            self._notify(
+                session=session,
+                entity=ChangeEntity.clustering,
+                action=ChangeAction.update,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+        self.clustering_spaces[(user_id, plugin_name, plugin_version)] = True
+        if add_collections:
+            members: Dict[int, List[uuid.UUID]] = {}
+            for track_id, (cluster, _) in sorted(
+                assignments.items(),
+                key=lambda assignment: assignment[1][1],
+            ):
+                members.setdefault(cluster, []).append(track_id)
+            for cluster in sorted(members):
+                self.add_collection(
+                    name=f"Cluster {cluster} of {name}",
+                    user_id=user_id,
+                    track_ids=members[cluster],
+                    collection_type="cluster",
+                    meta={
+                        "plugin_name": plugin_name,
+                        "plugin_version": plugin_version,
+                        "distance_metric": distance_metric.value,
+                        "clustering": name,
+                        "cluster": cluster,
+                    },
+                )
+        return centroids
+
+    def drop_clustering(
+        self,
+        name: str = "default",
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> bool:
+        """Remove a clustering of an embedding space.
+
+        Args:
+            name (str): The name of the clustering. Defaults to "default".
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            user_id (Union[str, UUID], optional): The user whose clustering to
+                remove. Defaults to the library's user.
+
+        Returns:
+            bool: True if the clustering was removed, False if it does not exist.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            clustering = self._get_clustering(
+                session=session,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                name=name,
+            )
+            if clustering is None:
+                return False
+            session.delete(clustering)
+            self._notify(
+                session=session,
+                entity=ChangeEntity.clustering,
+                action=ChangeAction.delete,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+        # the space might still have clusterings of other names
+        self.clustering_spaces.pop((user_id, plugin_name, plugin_version), None)
+        return True
+
+    def get_cluster_centroids(
+        self,
+        name: str = "default",
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> Optional[np.ndarray]:
+        """Get the centroids of a clustering.
+
+        Args:
+            name (str): The name of the clustering. Defaults to "default".
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+
+        Returns:
+            Optional[np.ndarray]: The centroids, one row per cluster, or None
+                if the clustering does not exist.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            clustering = self._get_clustering(
+                session=session,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                name=name,
+            )
+            if clustering is None:
+                return None
+            centroids = session.scalars(
+                select(NendoClusterCentroidDB.centroid)
+                .where(NendoClusterCentroidDB.clustering_id == clustering.id)
+                .order_by(NendoClusterCentroidDB.cluster),
+            ).all()
+        return np.stack(centroids).astype(np.float32, copy=False)
+
+    def nearest_clusters(
+        self,
+        vec: npt.ArrayLike,
+        limit: int = 1,
+        name: str = "default",
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> List[Tuple[int, float]]:
+        """Find the clusters whose centroids are nearest to a vector.
+
+        Used to select coarse partitions of the library to search in, e.g. with
+        `get_cluster_tracks()`.
+
+        Args:
+            vec (npt.ArrayLike): The vector.
+            limit (int): The number of clusters to return. Defaults to 1.
+            name (str): The name of the clustering. Defaults to "default".
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+
+        Raises:
+            ValueError: If the clustering does not exist.
+
+        Returns:
+            List[Tuple[int, float]]: The clusters and the distances of their
+                centroids to the vector, nearest first.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            clustering = self._get_clustering(
+                session=session,
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                name=name,
+            )
+            if clustering is None:
+                raise ValueError(
+                    f"No clustering {name} of {plugin_name} {plugin_version}.",
+                )
+            distance_metric = DistanceMetric(clustering.distance_metric)
+            centroids = session.scalars(
+                select(NendoClusterCentroidDB.centroid)
+                .where(NendoClusterCentroidDB.clustering_id == clustering.id)
+                .order_by(NendoClusterCentroidDB.cluster),
+            ).all()
+        distances = pairwise_distances(
+            np.asarray(vec, dtype=np.float32).reshape(1, -1),
+            np.stack(centroids).astype(np.float32, copy=False),
+            distance_metric,
+        )[0]
+        clusters = np.argsort(distances, kind="stable")[:limit]
+        return [(int(cluster), float(distances[cluster])) for cluster in clusters]
+
+    def get_track_cluster(
+        self,
+        track_id: Union[str, uuid.UUID],
+        name: str = "default",
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> Optional[int]:
+        """Get the cluster a track is assigned to.
+
+        Args:
+            track_id (Union[str, uuid.UUID]): ID of the track.
+            name (str): The name of the clustering. Defaults to "default".
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+
+        Returns:
+            Optional[int]: The cluster of the track, or None if the track is
+                not part of the clustering.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            return session.scalars(
+                select(NendoTrackClusterDB.cluster)
+                .join(
+                    NendoClusteringDB,
+                    NendoClusteringDB.id == NendoTrackClusterDB.clustering_id,
+                )
+                .where(
+                    NendoClusteringDB.user_id == user_id,
+                    NendoClusteringDB.plugin_name == plugin_name,
+                    NendoClusteringDB.plugin_version == plugin_version,
+                    NendoClusteringDB.name == name,
+                    NendoTrackClusterDB.track_id == ensure_uuid(track_id),
+                ),
+            ).one_or_none()
+
+    def get_cluster_tracks(
+        self,
+        cluster: int,
+        name: str = "default",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> List[Tuple[NendoTrack, float]]:
+        """Get the tracks of a cluster, with their distances to its centroid.
+
+        Args:
+            cluster (int): The cluster.
+            name (str): The name of the clustering. Defaults to "default".
+            limit (int, optional): Limit the number of returned tracks.
+            offset (int, optional): Offset into the tracks of the cluster.
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+
+        Returns:
+            List[Tuple[NendoTrack, float]]: List of tuples containing a track in
+                the first position and its distance to the centroid in the
+                second position, ordered by distance in ascending order.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            query = (
+                session.query(model.NendoTrackDB, NendoTrackClusterDB.distance)
+                .select_from(NendoTrackClusterDB)
+                .join(
+                    NendoClusteringDB,
+                    NendoClusteringDB.id == NendoTrackClusterDB.clustering_id,
+                )
+                .join(
+                    model.NendoTrackDB,
+                    model.NendoTrackDB.id == NendoTrackClusterDB.track_id,
+                )
+                .filter(
+                    NendoClusteringDB.user_id == user_id,
+                    NendoClusteringDB.plugin_name == plugin_name,
+                    NendoClusteringDB.plugin_version == plugin_version,
+                    NendoClusteringDB.name == name,
+                    NendoTrackClusterDB.cluster == cluster,
+                )
+                .order_by(NendoTrackClusterDB.distance)
+            )
+            if limit is not None:
+                query = query.limit(limit)
+            if offset is not None:
+                query = query.offset(offset)
+            return [
+                (NendoTrack.model_validate(track_db), distance)
+                for track_db, distance in query.all()
+            ]
+
+    # ======================
+    #
+    # TRACK VECTORS
+    #
+    # ======================
+
+    def _add_track_vectors(
+        self,
+        session: Session,
+        embeddings: List[Any],
+    ) -> None:
+        """Fold newly added embeddings into the mean vectors of their tracks.
+
+        Must be called after the embeddings were inserted, in the same
+        transaction. The running mean of each track is updated with the mean
+        and count of its new embeddings, without reading its other embeddings.
+        Spaces without declared dimensions fall back to `_pool_track_vectors()`,
+        as their tracks might have embeddings of mixed dimensions.
+        """
+        groups: Dict[Tuple[Any, ...], List[np.ndarray]] = {}
+        for e in embeddings:
+            if (
+                e.user_id is None
+                or e.plugin_name is None
+                or e.plugin_version is None
+                or e.embedding is None
+            ):
+                continue
+            groups.setdefault(
+                (e.user_id, e.plugin_name, e.plugin_version, e.track_id), [],
+            ).append(e.embedding)
+        undeclared = {
+            space for space in {key[1:3] for key in groups}
+            if self._get_embedding_dimensions(*space, session=session) is None
+        }
+        for user_id, plugin_name, plugin_version in {
+            key[:3] for key in groups if key[1:3] in undeclared
+        }:
+            self._pool_track_vectors(
+                session=session,
+                track_ids=[
+                    key[3] for key in groups
+                    if key[:3] == (user_id, plugin_name, plugin_version)
+                ],
+                user_id=user_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+        rows = [
+            {
+                "user_id": user_id,
+                "plugin_name": plugin_name,
+                "plugin_version": plugin_version,
+                "track_id": track_id,
+                "embedding": np.mean(vectors, axis=0, dtype=np.float64).astype(
+                    np.float32,
+                ),
+                "num_embeddings": len(vectors),
+            }
+            for (user_id, plugin_name, plugin_version, track_id), vectors in groups.items()
+            if (plugin_name, plugin_version) not in undeclared
+        ]
+        if len(rows) == 0:
+            return
+        statement = pg_insert(NendoTrackVectorDB).values(rows)
+        total = NendoTrackVectorDB.num_embeddings + statement.excluded.num_embeddings
+
+        def scale(vec: Any, factor: Any) -> Any:
+            # pgvector has no scalar multiplication, so scale element-wise
+            return vec.op("*")(
+                cast(
+                    func.array_fill(
+                        cast(factor, REAL),
+                        array([func.vector_dims(vec)]),
+                    ),
+                    pgvector.sqlalchemy.Vector(),
+                ),
+            )
+
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["user_id", "plugin_name", "plugin_version", "track_id"],
+                set_={
+                    "embedding": scale(
+                        NendoTrackVectorDB.embedding,
+                        cast(NendoTrackVectorDB.num_embeddings, REAL) / total,
+                    ).op("+")(
+                        scale(
+                            statement.excluded.embedding,
+                            cast(statement.excluded.num_embeddings, REAL) / total,
+                        ),
+                    ),
+                    "num_embeddings": total,
+                },
+            ),
+        )
+
+    def _pool_track_vectors(
+        self,
+        session: Session,
+        track_ids: List[uuid.UUID],
+        user_id: Optional[uuid.UUID],
+        plugin_name: Optional[str],
+        plugin_version: Optional[str],
+    ) -> None:
+        """Recompute the mean vectors of tracks in an embedding space.
+
+        Must be called after the tracks' embeddings were changed, in the same
+        transaction. Tracks without embeddings in the space lose their vector.
+        """
+        if user_id is None or plugin_name is None or plugin_version is None:
+            return
+        space_embeddings = (
+            NendoEmbeddingDB.user_id == user_id,
+            NendoEmbeddingDB.plugin_name == plugin_name,
+            NendoEmbeddingDB.plugin_version == plugin_version,
+            NendoEmbeddingDB.embedding.isnot(None),
+        )
+        pooled = (
+            select(
+                NendoEmbeddingDB.user_id,
+                NendoEmbeddingDB.plugin_name,
+                NendoEmbeddingDB.plugin_version,
+                NendoEmbeddingDB.track_id,
+                func.avg(NendoEmbeddingDB.embedding),
+                func.count(),
+            )
+            .where(*space_embeddings, NendoEmbeddingDB.track_id.in_(track_ids))
+            .group_by(
+                NendoEmbeddingDB.user_id,
+                NendoEmbeddingDB.plugin_name,
+                NendoEmbeddingDB.plugin_version,
+                NendoEmbeddingDB.track_id,
+            )
+        )
+        statement = pg_insert(NendoTrackVectorDB).from_select(
+            [
+                "user_id",
+                "plugin_name",
+                "plugin_version",
+                "track_id",
+                "embedding",
+                "num_embeddings",
+            ],
+            pooled,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "plugin_name", "plugin_version", "track_id"],
+            set_={
+                "embedding": statement.excluded.embedding,
+                "num_embeddings": statement.excluded.num_embeddings,
+            },
+        )
+        track_vectors = (
+            NendoTrackVectorDB.user_id == user_id,
+            NendoTrackVectorDB.plugin_name == plugin_name,
+            NendoTrackVectorDB.plugin_version == plugin_version,
+            NendoTrackVectorDB.track_id.in_(track_ids),
+        )
+        if self._get_embedding_dimensions(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+            session=session,
+        ) is not None:
+            session.execute(statement)
+        else:
+            # without declared dimensions, a track's embeddings can not be
+            # averaged if they have mixed dimensions
+            try:
+                with session.begin_nested():
+                    session.execute(statement)
+            except DBAPIError:
+                logger.warning(
+                    "Can not pool the embeddings of tracks %s, as they have "
+                    "mixed dimensions.",
+                    track_ids,
+                )
+                session.execute(delete(NendoTrackVectorDB).where(*track_vectors))
+        session.execute(
+            delete(NendoTrackVectorDB).where(
+                *track_vectors,
+                ~exists().where(
+                    *space_embeddings,
+                    NendoEmbeddingDB.track_id == NendoTrackVectorDB.track_id,
+                ),
+            ),
+        )
+
+    def get_track_vector(
+        self,
+        track_id: Union[str, uuid.UUID],
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        user_id: Optional[Union[str, uuid.UUID]] = None,
+    ) -> Optional[np.ndarray]:
+        """Get the pooled vector of a track, i.e. the mean of its embeddings.
+
+        Args:
+            track_id (Union[str, uuid.UUID]): ID of the track.
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+
+        Returns:
+            Optional[np.ndarray]: The track vector, or None if the track has no
+                embeddings in the embedding space.
+        """
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            return session.scalars(
+                select(NendoTrackVectorDB.embedding).where(
+                    NendoTrackVectorDB.user_id == user_id,
+                    NendoTrackVectorDB.plugin_name == plugin_name,
+                    NendoTrackVectorDB.plugin_version == plugin_version,
+                    NendoTrackVectorDB.track_id == ensure_uuid(track_id),
+                ),
+            ).one_or_none()
+
+    def _get_track_hits_query(
+        self,
+        session: Session,
+        hits: Any,
+        limit: int,
+        offset: int,
+        filters: Optional[Dict[str, Any]] = None,
+        search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
+        track_type: Optional[Union[str, List[str]]] = None,
+        user_id: Optional[uuid.UUID] = None,
+        collection_id: Optional[Union[str, uuid.UUID]] = None,
+        plugin_names: Optional[List[str]] = None,
+    ) -> Query:
+        """Query the tracks of a subquery of track IDs and distances, nearest first."""
+        query = (
+            session.query(model.NendoTrackDB, hits.c.distance)
+            .select_from(hits)
+            .join(model.NendoTrackDB, model.NendoTrackDB.id == hits.c.track_id)
+        )
+        if self._has_track_filters(
+            filters=filters,
+            search_meta=search_meta,
+            track_type=track_type,
+            collection_id=collection_id,
+        ):
+            query = self._get_filtered_tracks_query(
+                session=session,
+                query=query,
+                filters=filters,
+                search_meta=[],
+                track_type=track_type,
+                user_id=user_id,
+                collection_id=collection_id,
+                plugin_names=plugin_names,
             )
-            .join(
-                model.NendoTrackDB,
-                NendoEmbeddingDB.track_id == model.NendoTrackDB.id,
+            query = self._get_meta_filter_query(
+                query=query,
+                search_meta=search_meta,
+                meta_match=meta_match,
             )
-        )
+        query = query.order_by(hits.c.distance).limit(limit)
+        if offset:
+            query = query.offset(offset)
+        return query
 
-    def nearest_by_vector_with_score(
+    def nearest_tracks_by_vector_with_score(
         self,
         vec: npt.ArrayLike,
         limit: int = 10,
         offset: Optional[int] = None,
+        aggregation: Optional[Union[str, TrackAggregation]] = None,
         filters: Optional[Dict[str, Any]] = None,
         search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
         track_type: Optional[Union[str, List[str]]] = None,
         user_id: Optional[Union[str, uuid.UUID]] = None,
         collection_id: Optional[Union[str, uuid.UUID]] = None,
@@ -628,48 +5830,395 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         embedding_name: Optional[str] = None,
         embedding_version: Optional[str] = None,
         distance_metric: Optional[DistanceMetric] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
     ) -> List[Tuple[NendoTrack, float]]:
+        """Obtain the n nearest tracks to a vector, scoring each track once.
+
+        Unlike `nearest_by_vector_with_score()`, which scores every embedding
+        and thus returns a track once per matching embedding, e.g. per segment,
+        the hits are grouped per track in SQL:
+
+        - mean: Scores the pooled track vectors, the mean of each track's
+          embeddings, which are maintained whenever embeddings change. The
+          search is a single lookup, which uses the ANN indexes created with
+          `create_vector_index(track_vectors=True)`.
+        - max: Scores each track by its nearest embedding (max-sim). A window
+          of nearest embeddings is fetched from the ANN indexes of the space,
+          and enlarged until it contains enough distinct tracks.
+
+        If filters are given and at most `prefilter_max_tracks` tracks pass
+        them, the distances are computed exactly for these tracks instead.
+
+        Args:
+            vec (numpy.typing.ArrayLike): The vector from which to start the neighbor search.
+            limit (int): Limit the number of returned results. Default is 10.
+            offset (Optional[int]): Offset into the paginated results (requires limit).
+            aggregation (Union[str, TrackAggregation], optional): How to score
+                tracks with several embeddings, either "mean" or "max".
+                Defaults to "mean".
+            filters (Optional[dict]): Dictionary containing the filters to apply.
+                Defaults to None.
+            search_meta (dict): Dictionary containing the keywords to search for
+                over the track.resource.meta field. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
+            track_type (Union[str, List[str]], optional): Track type to filter for.
+                Can be a singular type or a list of types. Defaults to None.
+            user_id (Union[str, UUID], optional): The user ID to filter for.
+            collection_id (Union[str, uuid.UUID], optional): Collection id to
+                which the filtered tracks must have a relationship. Defaults to None.
+            plugin_names (list, optional): List used for applying the filter only to
+                data of certain plugins. If None, all plugin data related to the track
+                is used for filtering.
+            embedding_name (str, optional): Name of the embedding plugin. Defaults
+                to the name of the currently configured embedding plugin.
+            embedding_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            distance_metric (Optional[DistanceMetric], optional): The distance metric
+                to use. Defaults to None.
+            ef_search (int, optional): Size of the candidate list of HNSW index
+                scans. Defaults to the `hnsw_ef_search` config.
+            probes (int, optional): Number of lists probed by IVFFlat index scans.
+                Defaults to the `ivfflat_probes` config.
+            iterative_scan (str, optional): Iterative index scan mode, one of
+                "off", "strict_order" or "relaxed_order" (requires pgvector 0.8).
+                Defaults to the `vector_iterative_scan` config.
+
+        Returns:
+            List[Tuple[NendoTrack, float]]: List of tuples containing a track in
+                the first position and their distance ("score") in the second
+                position, ordered by their distance in ascending order.
+        """
         user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=embedding_name,
+            plugin_version=embedding_version,
+        )
+        aggregation = TrackAggregation(aggregation or TrackAggregation.mean)
+        distance_metric = DistanceMetric(
+            distance_metric if distance_metric is not None else self._default_distance,
+        )
         # cast to float32 for compatibility with pgvector
-        vec = vec.astype(np.float32)
+        vec = np.asarray(vec).astype(np.float32)
+        offset = offset or 0
+        filter_args = {
+            "filters": filters,
+            "search_meta": search_meta,
+            "meta_match": meta_match,
+            "track_type": track_type,
+            "user_id": user_id,
+            "collection_id": collection_id,
+            "plugin_names": plugin_names,
+        }
+        search_params = {
+            "ef_search": ef_search,
+            "probes": probes,
+            "iterative_scan": iterative_scan,
+        }
         with self.session_scope() as session:
-            query = self._get_nearest_query(
+            dimensions = self._get_embedding_dimensions(
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
                 session=session,
-                vec=vec,
-                user_id=user_id,
-                embedding_name=embedding_name,
-                embedding_version=embedding_version,
-                distance_metric=distance_metric,
             )
-            query = self._get_filtered_tracks_query(
-                session=session,
-                query=query,
+            prefilter = self._has_track_filters(
                 filters=filters,
-                search_meta=[],
+                search_meta=search_meta,
                 track_type=track_type,
-                user_id=user_id,
                 collection_id=collection_id,
-                plugin_names=plugin_names,
-            )
-            query = self._get_meta_filter_query(
-                query=query,
-                search_meta=search_meta,
-            )
-            query = query.order_by(asc("distance")).limit(limit)
-            if offset:
-                query = query.offset(offset)
-            query = query.all()
-            # Construct list of tuples (track, score)
+            ) and self._count_filtered_tracks(
+                session=session,
+                max_count=self.plugin_config.prefilter_max_tracks + 1,
+                **filter_args,
+            ) <= self.plugin_config.prefilter_max_tracks
+            if aggregation == TrackAggregation.mean:
+                rows = self._nearest_track_vectors(
+                    session=session,
+                    vec=vec,
+                    limit=limit,
+                    offset=offset,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                    distance_metric=distance_metric,
+                    dimensions=dimensions,
+                    prefilter=prefilter,
+                    filter_args=filter_args,
+                    search_params=search_params,
+                )
+            else:
+                rows = self._nearest_track_embeddings(
+                    session=session,
+                    vec=vec,
+                    limit=limit,
+                    offset=offset,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                    distance_metric=distance_metric,
+                    dimensions=dimensions,
+                    prefilter=prefilter,
+                    filter_args=filter_args,
+                    search_params=search_params,
+                )
             return [
-                (NendoTrack.model_validate(embedding.track), distance)
-                for embedding, distance in query
+                (NendoTrack.model_validate(track_db), distance)
+                for track_db, distance in rows
             ]
-    
-    def count_nearest_by_track(
+
+    def _get_track_vector_hits(
         self,
-        track: NendoTrack,
+        session: Session,
+        vec: np.ndarray,
+        window: int,
+        plugin_name: str,
+        plugin_version: str,
+        distance_metric: DistanceMetric,
+        dimensions: Optional[int],
+        prefilter: bool,
+        filter_args: Dict[str, Any],
+        search_params: Dict[str, Any],
+    ) -> Tuple[Query, Dict[str, Any]]:
+        """Query the distances of the pooled track vectors to a vector.
+
+        Returns the unordered query of track IDs and distances, along with the
+        search parameters to apply. The tracks are only filtered if `prefilter`
+        is True.
+        """
+        user_id = filter_args["user_id"]
+        space_filter = (
+            NendoTrackVectorDB.user_id == user_id,
+            NendoTrackVectorDB.plugin_name == plugin_name,
+            NendoTrackVectorDB.plugin_version == plugin_version,
+        )
+        distance = self._pg_distance(
+            distance_metric,
+            dimensions=dimensions,
+            column=NendoTrackVectorDB.embedding,
+            exact=prefilter,
+        )
+        hits = session.query(
+            NendoTrackVectorDB.track_id,
+            distance(vec).label("distance"),
+        ).filter(*space_filter)
+        if prefilter:
+            hits = hits.filter(
+                NendoTrackVectorDB.track_id.in_(
+                    self._get_prefiltered_track_ids(session=session, **filter_args),
+                ),
+            )
+        else:
+            rerank_candidates = self._get_rerank_candidates(
+                session=session,
+                window=window,
+                embedding_name=plugin_name,
+                embedding_version=plugin_version,
+            )
+            if rerank_candidates is not None:
+                # find candidates using the quantized ANN index, then re-rank
+                # them by their exact distance
+                candidate_distance = self._pg_distance(
+                    distance_metric,
+                    dimensions=dimensions,
+                    quantization=self._get_embedding_quantization(
+                        plugin_name=plugin_name,
+                        plugin_version=plugin_version,
+                        session=session,
+                    ),
+                    column=NendoTrackVectorDB.embedding,
+                )
+                candidates = (
+                    session.query(NendoTrackVectorDB.track_id)
+                    .filter(*space_filter)
+                    .order_by(candidate_distance(vec))
+                    .limit(rerank_candidates)
+                    .subquery("rerank_candidates")
+                )
+                hits = hits.join(
+                    candidates,
+                    candidates.c.track_id == NendoTrackVectorDB.track_id,
+                )
+            search_params = dict(
+                search_params,
+                ef_search=self._get_candidate_ef_search(
+                    num_candidates=rerank_candidates or window,
+                    ef_search=search_params["ef_search"],
+                ),
+            )
+        return hits, search_params
+
+    def _nearest_track_vectors(
+        self,
+        session: Session,
+        vec: np.ndarray,
+        limit: int,
+        offset: int,
+        plugin_name: str,
+        plugin_version: str,
+        distance_metric: DistanceMetric,
+        dimensions: Optional[int],
+        prefilter: bool,
+        filter_args: Dict[str, Any],
+        search_params: Dict[str, Any],
+    ) -> List[Any]:
+        """Find the nearest pooled track vectors, see `nearest_tracks_by_vector_with_score()`."""
+        hits, search_params = self._get_track_vector_hits(
+            session=session,
+            vec=vec,
+            window=limit + offset,
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+            distance_metric=distance_metric,
+            dimensions=dimensions,
+            prefilter=prefilter,
+            filter_args=filter_args,
+            search_params=search_params,
+        )
+        query = self._get_track_hits_query(
+            session=session,
+            hits=hits.subquery("track_hits"),
+            limit=limit,
+            offset=offset,
+            **({} if prefilter else filter_args),
+        )
+        self._set_vector_search_params(session=session, **search_params)
+        return query.all()
+
+    def _nearest_track_embeddings(
+        self,
+        session: Session,
+        vec: np.ndarray,
+        limit: int,
+        offset: int,
+        plugin_name: str,
+        plugin_version: str,
+        distance_metric: DistanceMetric,
+        dimensions: Optional[int],
+        prefilter: bool,
+        filter_args: Dict[str, Any],
+        search_params: Dict[str, Any],
+    ) -> List[Any]:
+        """Find the tracks with the nearest embeddings, see `nearest_tracks_by_vector_with_score()`."""
+        user_id = filter_args["user_id"]
+        if not prefilter:
+            overfetch = max(self.plugin_config.postfilter_overfetch, 2)
+            window = (limit + offset) * overfetch
+            while True:
+                rerank_candidates = self._get_rerank_candidates(
+                    session=session,
+                    window=window,
+                    embedding_name=plugin_name,
+                    embedding_version=plugin_version,
+                )
+                candidates = (
+                    self._get_nearest_query(
+                        session=session,
+                        vec=vec,
+                        user_id=user_id,
+                        embedding_name=plugin_name,
+                        embedding_version=plugin_version,
+                        distance_metric=distance_metric,
+                        entities=[NendoEmbeddingDB.track_id],
+                        rerank_candidates=rerank_candidates,
+                    )
+                    .order_by(asc("distance"))
+                    .limit(window)
+                    .subquery("candidates")
+                )
+                # deduplicate the window by the nearest embedding of each track
+                hits = (
+                    session.query(
+                        candidates.c.track_id,
+                        func.min(candidates.c.distance).label("distance"),
+                    )
+                    .group_by(candidates.c.track_id)
+                    .subquery("track_hits")
+                )
+                query = self._get_track_hits_query(
+                    session=session,
+                    hits=hits,
+                    limit=limit,
+                    offset=offset,
+                    **filter_args,
+                )
+                self._set_vector_search_params(
+                    session=session,
+                    **dict(
+                        search_params,
+                        ef_search=self._get_candidate_ef_search(
+                            num_candidates=rerank_candidates or window,
+                            ef_search=search_params["ef_search"],
+                        ),
+                    ),
+                )
+                rows = query.all()
+                if len(rows) >= limit or self._count_space_embeddings(
+                    session=session,
+                    # count up to the largest window, so that the cached
+                    # count answers the later iterations as well
+                    max_count=max(
+                        window, self.plugin_config.postfilter_max_window,
+                    ) + 1,
+                    # the index scans see the embeddings of all users
+                    user_id=None,
+                    plugin_name=plugin_name,
+                    plugin_version=plugin_version,
+                ) <= window:
+                    return rows
+                if window >= self.plugin_config.postfilter_max_window:
+                    break
+                window = min(
+                    window * overfetch,
+                    self.plugin_config.postfilter_max_window,
+                )
+        # score all embeddings of the tracks that pass the filters
+        distance = self._pg_distance(
+            distance_metric,
+            dimensions=dimensions,
+            exact=True,
+        )
+        if prefilter:
+            track_ids = self._get_prefiltered_track_ids(session=session, **filter_args)
+        else:
+            # too many tracks to fetch their IDs up front
+            track_ids = self._get_filtered_track_ids_query(
+                session=session,
+                **filter_args,
+            ).statement
+        hits = session.query(
+            NendoEmbeddingDB.track_id,
+            func.min(distance(vec)).label("distance"),
+        ).filter(
+            NendoEmbeddingDB.user_id == user_id,
+            NendoEmbeddingDB.plugin_name == plugin_name,
+            NendoEmbeddingDB.plugin_version == plugin_version,
+            NendoEmbeddingDB.embedding.isnot(None),
+            NendoEmbeddingDB.track_id.in_(track_ids),
+        ).group_by(NendoEmbeddingDB.track_id)
+        query = self._get_track_hits_query(
+            session=session,
+            hits=hits.subquery("track_hits"),
+            limit=limit,
+            offset=offset,
+        )
+        self._set_vector_search_params(session=session, **search_params)
+        return query.all()
+
+    def hybrid_search(
+        self,
+        query: str,
+        vec: npt.ArrayLike,
+        limit: int = 10,
+        offset: Optional[int] = None,
+        fusion: Union[str, HybridFusion] = HybridFusion.rrf,
+        vector_weight: float = 0.5,
+        rrf_k: int = 60,
+        num_candidates: Optional[int] = None,
         filters: Optional[Dict[str, Any]] = None,
         search_meta: Optional[Dict[str, List[str]]] = None,
+        meta_match: Union[str, MetaMatch] = MetaMatch.fuzzy,
         track_type: Optional[Union[str, List[str]]] = None,
         user_id: Optional[Union[str, uuid.UUID]] = None,
         collection_id: Optional[Union[str, uuid.UUID]] = None,
@@ -677,18 +6226,40 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
         embedding_name: Optional[str] = None,
         embedding_version: Optional[str] = None,
         distance_metric: Optional[DistanceMetric] = None,
-        session: Optional[Session] = None,
-    ) -> int:
-        """Count the number of tracks in the db after applying various filter criteria.
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+    ) -> List[Tuple[NendoTrack, float]]:
+        """Search the tracks for free text and a vector at once.
+
+        Two lists of candidates are ranked in a single query: the tracks
+        matching the text, ranked as by `search_tracks()`, and the tracks
+        nearest to the vector, ranked by the distance of their pooled track
+        vector as by `nearest_tracks_by_vector_with_score()`. The lists are
+        fused into a single score, and only the requested page of tracks is
+        loaded. A track can score by either list, e.g. by its meta data alone.
 
         Args:
-            track (NendoTrack): The track from which to start the neighbor search.
+            query (str): The free text to search for.
+            vec (numpy.typing.ArrayLike): The vector from which to start the neighbor search.
+            limit (int): Limit the number of returned results. Default is 10.
+            offset (Optional[int]): Offset into the paginated results (requires limit).
+            fusion (Union[str, HybridFusion]): How to fuse the lists, either
+                "rrf" (reciprocal rank fusion) or "weighted". Defaults to "rrf".
+            vector_weight (float): Weight of the vector list, between 0 and 1.
+                The text list is weighted by `1 - vector_weight`. Defaults to 0.5.
+            rrf_k (int): Constant added to the ranks by reciprocal rank fusion,
+                dampening the lead of the top ranks. Defaults to 60.
+            num_candidates (int, optional): Length of each list of candidates.
+                Defaults to `postfilter_overfetch` times `limit + offset`.
             filters (Optional[dict]): Dictionary containing the filters to apply.
                 Defaults to None.
             search_meta (dict): Dictionary containing the keywords to search for
-                over the track.resource.meta field. The dictionary's values
-                should contain singular search tokens and the keys currently have no
-                effect but might in the future. Defaults to {}.
+                over the track.resource.meta field. Defaults to {}.
+            meta_match (Union[str, MetaMatch]): How the `search_meta` values are
+                matched. "fuzzy" matches values containing them, ignoring case.
+                "exact" matches values equal to one of them. "full_text" matches
+                values containing all of their words. Defaults to "fuzzy".
             track_type (Union[str, List[str]], optional): Track type to filter for.
                 Can be a singular type or a list of types. Defaults to None.
             user_id (Union[str, UUID], optional): The user ID to filter for.
@@ -697,75 +6268,487 @@ class PostgresDBLibrary(SqlAlchemyNendoLibrary, NendoLibraryVectorExtension):
             plugin_names (list, optional): List used for applying the filter only to
                 data of certain plugins. If None, all plugin data related to the track
                 is used for filtering.
-            embedding_name (str, optional): Name of the embedding plugin for which to
-                retrieve and compare the vectors. If none is given, the name of the
-                first embedding found for that track is used. If no embedding exists,
-                the name of the currently configured embedding plugin for the library
-                vector extension is used.
-            embedding_version (str, optional): Version of the embedding plugin for
-                which to retrieve and compare the vectors. If none is given, the name
-                of the first embedding found for that track is used. If no embedding
-                exists,the version of the currently configured embedding plugin for
-                the library vector extension is used.
-            session (sqlalchemy.orm.Session, optional): The database session.
+            embedding_name (str, optional): Name of the embedding plugin. Defaults
+                to the name of the currently configured embedding plugin.
+            embedding_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            distance_metric (Optional[DistanceMetric], optional): The distance metric
+                to use. Defaults to None.
+            ef_search (int, optional): Size of the candidate list of HNSW index
+                scans. Defaults to the `hnsw_ef_search` config.
+            probes (int, optional): Number of lists probed by IVFFlat index scans.
+                Defaults to the `ivfflat_probes` config.
+            iterative_scan (str, optional): Iterative index scan mode, one of
+                "off", "strict_order" or "relaxed_order" (requires pgvector 0.8).
+                Defaults to the `vector_iterative_scan` config.
 
         Returns:
-            int: Number of tracks in the library that match the specified criteria.
+            List[Tuple[NendoTrack, float]]: List of tuples containing a track in
+                the first position and its fused score in the second position,
+                ordered by their score in descending order.
         """
-        user_id = self._ensure_user_uuid(user_id)
-        plugin_name = (
-            embedding_name
-            if embedding_name is not None
-            else (
-                self.embedding_plugin.plugin_name
-                if self.embedding_plugin is not None
-                else None
+        if not 0 <= vector_weight <= 1:
+            raise ValueError(
+                f"The vector weight must be between 0 and 1, got {vector_weight}.",
             )
+        user_id = self._ensure_user_uuid(user_id)
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=embedding_name,
+            plugin_version=embedding_version,
         )
-        plugin_version = (
-            embedding_version
-            if embedding_version is not None
-            else (
-                self.embedding_plugin.plugin_version
-                if self.embedding_plugin is not None
-                else None
-            )
+        fusion = HybridFusion(fusion)
+        distance_metric = DistanceMetric(
+            distance_metric if distance_metric is not None else self._default_distance,
         )
-        track_embeddings = self.get_embeddings(
-            track_id=track.id,
-            plugin_name=plugin_name,
-            plugin_version=plugin_version,
+        # cast to float32 for compatibility with pgvector
+        vec = np.asarray(vec).astype(np.float32)
+        offset = offset or 0
+        window = max(
+            num_candidates
+            or (limit + offset) * max(self.plugin_config.postfilter_overfetch, 2),
+            limit + offset,
         )
-        if len(track_embeddings) < 1:
-            track_embedding = self.embed_track(track)
-        else:
-            track_embedding = track_embeddings[0]
-            plugin_name = track_embedding.plugin_name
-            plugin_version = track_embedding.plugin_version
-        vec = track_embedding.embedding.astype(np.float32)
+        filter_args = {
+            "filters": filters,
+            "search_meta": search_meta,
+            "meta_match": meta_match,
+            "track_type": track_type,
+            "user_id": user_id,
+            "collection_id": collection_id,
+            "plugin_names": plugin_names,
+        }
+        search_params = {
+            "ef_search": ef_search,
+            "probes": probes,
+            "iterative_scan": iterative_scan,
+        }
         with self.session_scope() as session:
-            query = self._get_nearest_query(
+            dimensions = self._get_embedding_dimensions(
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
                 session=session,
-                vec=vec,
-                user_id=user_id,
-                embedding_name=plugin_name,
-                embedding_version=plugin_version,
-                distance_metric=distance_metric,
             )
-            query = self._get_filtered_tracks_query(
-                session=session,
-                query=query,
+            has_filters = self._has_track_filters(
                 filters=filters,
-                search_meta=[],
+                search_meta=search_meta,
                 track_type=track_type,
-                user_id=user_id,
                 collection_id=collection_id,
-                plugin_names=plugin_names,
             )
-            query = self._get_meta_filter_query(
+            prefilter = has_filters and self._count_filtered_tracks(
+                session=session,
+                max_count=self.plugin_config.prefilter_max_tracks + 1,
+                **filter_args,
+            ) <= self.plugin_config.prefilter_max_tracks
+
+            text_hits, rank = self._get_text_hits_query(
+                session=session,
                 query=query,
-                search_meta=search_meta,
+                entities=[NendoTrackDocumentDB.track_id],
+                **filter_args,
             )
-            query = query.order_by(asc("distance"))
-            count = query.count()
-            return count - 1 # -1 because the track itself will also be returned
+            text_hits = (
+                text_hits.order_by(rank.desc(), NendoTrackDocumentDB.track_id)
+                .limit(window)
+                .subquery("text_hits")
+            )
+            text_list = session.query(
+                text_hits.c.track_id,
+                func.row_number().over(
+                    order_by=(text_hits.c.rank.desc(), text_hits.c.track_id),
+                ).label("position"),
+                # min-max normalized, 1 if all ranks are equal
+                func.coalesce(
+                    (text_hits.c.rank - func.min(text_hits.c.rank).over())
+                    / func.nullif(
+                        func.max(text_hits.c.rank).over()
+                        - func.min(text_hits.c.rank).over(),
+                        0,
+                    ),
+                    1.0,
+                ).label("normalized"),
+            ).cte("text_list")
+
+            vector_hits, search_params = self._get_track_vector_hits(
+                session=session,
+                vec=vec,
+                window=window,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                distance_metric=distance_metric,
+                dimensions=dimensions,
+                prefilter=prefilter,
+                filter_args=filter_args,
+                search_params=search_params,
+            )
+            if has_filters and not prefilter:
+                # filter the candidates before cutting the list to the window,
+                # so that filtered out tracks don't take the places of others
+                vector_hits = vector_hits.filter(
+                    NendoTrackVectorDB.track_id.in_(
+                        self._get_filtered_track_ids_query(
+                            session=session,
+                            **filter_args,
+                        ).statement,
+                    ),
+                )
+            vector_hits = vector_hits.subquery("vector_candidates")
+            vector_hits = (
+                session.query(vector_hits)
+                .order_by(vector_hits.c.distance)
+                .limit(window)
+                .subquery("vector_hits")
+            )
+            vector_list = session.query(
+                vector_hits.c.track_id,
+                func.row_number().over(
+                    order_by=(vector_hits.c.distance, vector_hits.c.track_id),
+                ).label("position"),
+                # min-max normalized similarity, 1 if all distances are equal
+                func.coalesce(
+                    (func.max(vector_hits.c.distance).over() - vector_hits.c.distance)
+                    / func.nullif(
+                        func.max(vector_hits.c.distance).over()
+                        - func.min(vector_hits.c.distance).over(),
+                        0,
+                    ),
+                    1.0,
+                ).label("normalized"),
+            ).cte("vector_list")
+
+            if fusion == HybridFusion.rrf:
+                text_score = 1.0 / (rrf_k + text_list.c.position)
+                vector_score = 1.0 / (rrf_k + vector_list.c.position)
+            else:
+                text_score = text_list.c.normalized
+                vector_score = vector_list.c.normalized
+            fused = (
+                session.query(
+                    func.coalesce(
+                        text_list.c.track_id,
+                        vector_list.c.track_id,
+                    ).label("track_id"),
+                    (
+                        (1 - vector_weight) * func.coalesce(text_score, 0.0)
+                        + vector_weight * func.coalesce(vector_score, 0.0)
+                    ).label("score"),
+                )
+                .select_from(text_list)
+                .join(
+                    vector_list,
+                    vector_list.c.track_id == text_list.c.track_id,
+                    full=True,
+                )
+                .subquery("fused")
+            )
+            # both lists of candidates are filtered already
+            track_query = (
+                session.query(model.NendoTrackDB, fused.c.score)
+                .select_from(fused)
+                .join(model.NendoTrackDB, model.NendoTrackDB.id == fused.c.track_id)
+                .order_by(fused.c.score.desc(), fused.c.track_id)
+                .limit(limit)
+                .offset(offset)
+                .options(noload(model.NendoTrackDB.related_tracks))
+            )
+            self._set_vector_search_params(session=session, **search_params)
+            return [
+                # the fused scores are numeric
+                (NendoTrack.model_validate(track_db), float(score))
+                for track_db, score in track_query
+            ]
+
+    # ======================
+    #
+    # EMBEDDING PARTITIONS
+    #
+    # ======================
+
+    def _get_space_partition(
+        self,
+        session: Session,
+        plugin_name: str,
+        plugin_version: str,
+    ) -> Optional[str]:
+        """Return the name of an embedding space's partition, if it has one."""
+        return session.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "WHERE parent.relname = :parent AND child.relname = :child",
+            ).bindparams(
+                parent=plugin_partition_name(plugin_name),
+                child=space_partition_name(plugin_name, plugin_version),
+            ),
+        ).scalar_one_or_none()
+
+    def _is_embeddings_partitioned(self, session: Session) -> bool:
+        return session.execute(
+            text("SELECT relkind = 'p' FROM pg_class WHERE relname = 'embeddings'"),
+        ).scalar_one()
+
+    def get_embedding_partition(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+    ) -> Optional[str]:
+        """Get the name of the partition of the embeddings table of an embedding space.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+
+        Returns:
+            Optional[str]: The name of the partition, or None if the space's
+                embeddings are stored in a default partition.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            return self._get_space_partition(
+                session=session,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+
+    def create_embedding_partition(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+    ) -> str:
+        """Give an embedding space a partition of the embeddings table of its own.
+
+        The embeddings table is list partitioned by plugin name and version.
+        Searches filter by both, so Postgres only scans the space's partition,
+        and its ANN indexes created by `create_vector_index()` only cover the
+        partition. The space's existing embeddings are moved into the new
+        partition, which locks them until the partition is attached, so
+        create the partition before embedding a library with a new plugin
+        version. Its embeddings can later be removed all at once using
+        `drop_embedding_partition()`.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+
+        Raises:
+            ValueError: If the embeddings table is not partitioned.
+
+        Returns:
+            str: The name of the partition.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            if not self._is_embeddings_partitioned(session):
+                raise ValueError(
+                    "The embeddings table is not partitioned. Please run the "
+                    "database migrations first.",
+                )
+            partition = self._get_space_partition(
+                session=session,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+            if partition is not None:
+                return partition
+            plugin_partition_exists = session.execute(
+                text("SELECT to_regclass(:name) IS NOT NULL").bindparams(
+                    name=plugin_partition_name(plugin_name),
+                ),
+            ).scalar_one()
+            for statement in create_space_partition_sql(
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                plugin_partition_exists=plugin_partition_exists,
+            ):
+                session.execute(text(statement))
+        return space_partition_name(plugin_name, plugin_version)
+
+    def drop_embedding_partition(
+        self,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        detach_only: bool = False,
+    ) -> bool:
+        """Remove all embeddings of an embedding space by dropping its partition.
+
+        Detaching and dropping the partition of the space, e.g. of an old plugin
+        version, only changes the catalog, instead of deleting each embedding.
+        The embeddings are removed for all users, along with the space's track
+        vectors, track neighbors and clusterings.
+
+        Args:
+            plugin_name (str, optional): Name of the embedding plugin. Defaults to
+                the name of the currently configured embedding plugin.
+            plugin_version (str, optional): Version of the embedding plugin.
+                Defaults to the version of the currently configured embedding plugin.
+            detach_only (bool): Whether to keep the detached partition as a
+                regular table, e.g. to archive it, without its ANN indexes.
+                Defaults to False.
+
+        Returns:
+            bool: True if the partition was removed, False if the space has
+                no partition.
+        """
+        plugin_name, plugin_version = self._get_embedding_space(
+            plugin_name=plugin_name,
+            plugin_version=plugin_version,
+        )
+        with self.session_scope() as session:
+            partition = self._get_space_partition(
+                session=session,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+            if partition is None:
+                return False
+            session.execute(
+                text(detach_space_partition_sql(plugin_name, plugin_version)),
+            )
+            # the triggers maintaining the track documents do not fire for
+            # detached embeddings
+            session.execute(
+                text(refresh_track_documents_sql(table=partition, column="track_id")),
+            )
+            if detach_only:
+                # frees the index names for the space's future embeddings
+                for index_name in session.execute(
+                    text(
+                        "SELECT indexname FROM pg_indexes WHERE tablename = :table "
+                        "AND indexname LIKE 'ix\\_embeddings\\_%'",
+                    ).bindparams(table=partition),
+                ).scalars():
+                    session.execute(text(f"DROP INDEX {index_name}"))
+            else:
+                session.execute(text(f"DROP TABLE {partition}"))
+            for derived in (NendoTrackVectorDB, NendoNeighborGraphDB, NendoClusteringDB):
+                session.query(derived).filter(
+                    derived.plugin_name == plugin_name,
+                    derived.plugin_version == plugin_version,
+                ).delete()
+            self._notify(
+                session=session,
+                entity=ChangeEntity.library,
+                action=ChangeAction.delete,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+            )
+        # the space's graphs and clusterings are gone for all users
+        for spaces in (self.neighbor_graph_spaces, self.clustering_spaces):
+            for space in [
+                space for space in spaces if space[1:] == (plugin_name, plugin_version)
+            ]:
+                spaces.pop(space, None)
+        if self.vector_cache is not None:
+            self.vector_cache.invalidate()
+        return True
+
+    # ======================
+    #
+    # META DATA INDEXES
+    #
+    # ======================
+
+    def _is_meta_values_indexed(self) -> bool:
+        """Check whether the flattened meta data values of the tracks are indexed.
+
+        The index is created by the database migrations if the `pg_trgm`
+        extension is available.
+        """
+        if self.meta_values_indexed is None:
+            with self.session_scope() as session:
+                self.meta_values_indexed = session.execute(
+                    text("SELECT to_regclass(:name) IS NOT NULL").bindparams(
+                        name=META_VALUES_INDEX,
+                    ),
+                ).scalar_one()
+        return self.meta_values_indexed
+
+    def _is_meta_jsonb(self) -> bool:
+        """Check whether the meta data of the tracks was migrated to `jsonb`."""
+        if self.meta_jsonb is None:
+            with self.session_scope() as session:
+                self.meta_jsonb = session.execute(
+                    text(
+                        "SELECT atttypid = 'jsonb'::regtype FROM pg_attribute "
+                        "WHERE attrelid = 'tracks'::regclass AND attname = 'meta'",
+                    ),
+                ).scalar_one()
+        return self.meta_jsonb
+
+    def get_meta_indexes(self) -> List[str]:
+        """Get the names of the indexes over the meta data of the tracks.
+
+        Returns:
+            List[str]: The sorted index names.
+        """
+        with self.session_scope() as session:
+            return session.execute(
+                text(
+                    "SELECT indexname FROM pg_indexes WHERE tablename = 'tracks' "
+                    "AND (indexname LIKE 'ix\\_tracks\\_meta\\_trgm\\_%' "
+                    "OR indexname = ANY(:names)) ORDER BY indexname",
+                ).bindparams(names=[META_VALUES_INDEX, META_CONTAINMENT_INDEX]),
+            ).scalars().all()
+
+    def create_meta_index(self, key: str, concurrently: bool = False) -> str:
+        """Create a trigram index over the values of a meta data key.
+
+        The index speeds up searches for substrings of the key's values, i.e.
+        `search_meta={key: [...]}`, for values of at least three characters.
+        Searches over all values, i.e. `search_meta={"": [...]}`, use the index
+        over the flattened values created by the database migrations instead.
+
+        Args:
+            key (str): The meta data key.
+            concurrently (bool): Whether to build the index without locking
+                writes to the tracks table. Defaults to False.
+
+        Raises:
+            ValueError: If the `pg_trgm` extension is not installed.
+
+        Returns:
+            str: The name of the index.
+        """
+        with self.session_scope() as session:
+            if session.execute(
+                text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'"),
+            ).scalar_one() == 0:
+                raise ValueError(
+                    "Can not create trigram indexes without the pg_trgm extension. "
+                    "Please run the database migrations first.",
+                )
+        self._execute_ddl(
+            [create_meta_index_sql(key=key, concurrently=concurrently)],
+            autocommit=concurrently,
+        )
+        return meta_index_name(key)
+
+    def drop_meta_index(self, key: str, concurrently: bool = False) -> bool:
+        """Drop the trigram index over the values of a meta data key.
+
+        Args:
+            key (str): The meta data key.
+            concurrently (bool): Whether to drop the index without locking
+                the tracks table. Defaults to False.
+
+        Returns:
+            bool: True if the index was dropped, False if it did not exist.
+        """
+        index_name = meta_index_name(key)
+        if index_name not in self.get_meta_indexes():
+            return False
+        self._execute_ddl(
+            [f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {index_name}"],
+            autocommit=concurrently,
+        )
+        return True
@@ -0,0 +1,173 @@
+# -*- encoding: utf-8 -*-
+"""LRU/TTL cache for the results and counts of nearest neighbor searches."""
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+NearestResults = List[Tuple[uuid.UUID, float]]
+# the results of a search, or the number of its results
+CachedResults = Union[NearestResults, int]
+
+
+class ResultCacheInfo(NamedTuple):
+    """Statistics of a `ResultCache`, similar to `functools.lru_cache`'s."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class ResultCacheScope(NamedTuple):
+    """The data a cached result depends on, used for invalidating it."""
+
+    user_id: Optional[uuid.UUID]
+    plugin_name: str
+    plugin_version: str
+
+
+def _normalize(value: Any) -> Any:
+    # tuples (ranges) and lists (multiselect) mean different things in filters
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted((str(k), _normalize(v)) for k, v in value.items())))
+    if isinstance(value, tuple):
+        return ("tuple", tuple(_normalize(v) for v in value))
+    if isinstance(value, (list, set)):
+        return ("list", tuple(_normalize(v) for v in value))
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def make_key(vec: Optional[np.ndarray], **params: Any) -> str:
+    """Compute the cache key of a nearest neighbor search.
+
+    Args:
+        vec (np.ndarray, optional): The query vector. It is hashed as float32
+            bytes. None for searches that do not depend on a vector.
+        **params: The other arguments of the search.
+
+    Returns:
+        str: The hex digest identifying the search.
+    """
+    digest = hashlib.sha256(
+        np.ascontiguousarray(vec, dtype=np.float32).tobytes()
+        if vec is not None else b"",
+    )
+    digest.update(repr(_normalize(params)).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU cache of nearest neighbor results with expiry.
+
+    Every invalidation increments the cache's generation. Results computed
+    while an invalidation happened are not stored, as they might be stale.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None) -> None:
+        """Create an empty cache of at most `max_entries` results."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries: "OrderedDict[str, Tuple[float, ResultCacheScope, CachedResults]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResults]:
+        """Get the cached results of a search and mark them as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            results = entry[2]
+            return list(results) if isinstance(results, list) else results
+
+    def put(
+        self,
+        key: str,
+        results: CachedResults,
+        scope: ResultCacheScope,
+        generation: int,
+    ) -> None:
+        """Store the results of a search.
+
+        Args:
+            key (str): The key of the search, as returned by `make_key()`.
+            results (CachedResults): Tuples of track ID and distance, or the
+                number of results of a count.
+            scope (ResultCacheScope): The data the results depend on.
+            generation (int): The cache's generation from before the search was run.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            expires_at = (
+                time.monotonic() + self.ttl if self.ttl else float("inf")
+            )
+            if isinstance(results, list):
+                results = list(results)
+            self._entries[key] = (expires_at, scope, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(
+        self,
+        user_id: Optional[uuid.UUID] = None,
+        plugin_name: Optional[str] = None,
+        plugin_version: Optional[str] = None,
+        track_id: Optional[uuid.UUID] = None,
+    ) -> None:
+        """Drop the cached results that might be affected by a change.
+
+        The given arguments select the entries to drop: the entries of a user, of
+        an embedding space, or those containing a track. Cached counts do not
+        know their tracks, so they are dropped by any track. Arguments that are
+        None match all entries. Without arguments, the whole cache is cleared.
+        """
+        with self._lock:
+            self.generation += 1
+            if user_id is plugin_name is plugin_version is track_id is None:
+                self._entries.clear()
+                return
+            for key, (_, scope, results) in list(self._entries.items()):
+                if (
+                    (user_id is None or scope.user_id == user_id)
+                    and (plugin_name is None or scope.plugin_name == plugin_name)
+                    and (
+                        plugin_version is None
+                        or scope.plugin_version == plugin_version
+                    )
+                    and (
+                        track_id is None
+                        or not isinstance(results, list)
+                        or any(tid == track_id for tid, _ in results)
+                    )
+                ):
+                    del self._entries[key]
+
+    def info(self) -> ResultCacheInfo:
+        """Return the hit and miss counters and the size of the cache."""
+        with self._lock:
+            return ResultCacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                maxsize=self.max_entries,
+                currsize=len(self._entries),
+            )
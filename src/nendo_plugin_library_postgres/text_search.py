@@ -0,0 +1,163 @@
+# -*- encoding: utf-8 -*-
+"""Helpers for the full-text search over tracks.
+
+The words of each track's meta data values and of the `text` of its embeddings
+are kept as a `tsvector` in the `track_documents` table, whose GIN index is
+used by `search_tracks()`. The documents are maintained by statement-level
+triggers on the `tracks` and `embeddings` tables, which recompute the documents
+of the tracks changed by each statement.
+"""
+
+from enum import Enum
+from typing import List
+
+# no stemming or stop words, as meta data is mostly names, in any language
+TEXT_SEARCH_CONFIG = "simple"
+REFRESH_FUNCTION = "nendo_refresh_track_documents"
+TRACKS_TRIGGER_FUNCTION = "nendo_track_documents_tracks"
+EMBEDDINGS_TRIGGER_FUNCTION = "nendo_track_documents_embeddings"
+TRIGGERS = {
+    "tracks": (
+        TRACKS_TRIGGER_FUNCTION,
+        ("INSERT", "UPDATE"),
+    ),
+    "embeddings": (
+        EMBEDDINGS_TRIGGER_FUNCTION,
+        ("INSERT", "UPDATE", "DELETE"),
+    ),
+}
+
+
+class HybridFusion(str, Enum):
+    """Enum representing the ways in which `hybrid_search()` fuses its candidates.
+
+    - rrf: Reciprocal rank fusion, scores each track by `1 / (rrf_k + rank)`
+      in each list of candidates.
+    - weighted: Scores each track by its text rank and vector distance,
+      min-max normalized within each list of candidates.
+    """
+
+    rrf: str = "rrf"
+    weighted: str = "weighted"
+
+
+def _trigger_name(table: str, event: str) -> str:
+    return f"track_documents_{table}_{event.lower()}"
+
+
+def _transition_tables(event: str) -> str:
+    # transition tables can only be declared for triggers of a single event
+    tables = {
+        "INSERT": "NEW TABLE AS new_rows",
+        "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        "DELETE": "OLD TABLE AS old_rows",
+    }
+    return tables[event]
+
+
+def create_track_documents_sql() -> List[str]:
+    """Build the statements creating the functions and triggers maintaining the documents.
+
+    Requires the `tracks`, `embeddings` and `track_documents` tables.
+
+    Returns:
+        List[str]: The `CREATE FUNCTION` and `CREATE TRIGGER` statements.
+    """
+    config = f"'{TEXT_SEARCH_CONFIG}'"
+    statements = [
+        # PL/pgSQL, to resolve `to_tsvector()` for the type of `tracks.meta`,
+        # which is either `json` or `jsonb`, when called
+        f"CREATE OR REPLACE FUNCTION {REFRESH_FUNCTION}(track_ids uuid[]) "  # noqa: S608
+        "RETURNS void LANGUAGE plpgsql AS $$ BEGIN "
+        "INSERT INTO track_documents (track_id, document) "
+        "SELECT tracks.id, "
+        f"coalesce(setweight(to_tsvector({config}, tracks.meta), 'A'), '') "
+        f"|| setweight(to_tsvector({config}, coalesce(texts.text, '')), 'B') "
+        "FROM unnest(track_ids) AS ids (id) "
+        "JOIN tracks ON tracks.id = ids.id "
+        "CROSS JOIN LATERAL ("
+        "SELECT string_agg(DISTINCT embeddings.text, ' ') AS text "
+        "FROM embeddings WHERE embeddings.track_id = tracks.id"
+        ") AS texts "
+        "ON CONFLICT (track_id) DO UPDATE SET document = excluded.document; "
+        "END $$",
+        f"CREATE OR REPLACE FUNCTION {TRACKS_TRIGGER_FUNCTION}() "  # noqa: S608
+        "RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "IF TG_OP = 'INSERT' THEN "
+        f"PERFORM {REFRESH_FUNCTION}(ARRAY(SELECT id FROM new_rows)); "
+        "ELSE "
+        f"PERFORM {REFRESH_FUNCTION}(ARRAY("
+        "SELECT new_rows.id FROM new_rows JOIN old_rows USING (id) "
+        "WHERE new_rows.meta::text IS DISTINCT FROM old_rows.meta::text"
+        ")); "
+        "END IF; "
+        "RETURN NULL; "
+        "END $$",
+        # embeddings without a text, e.g. re-embedded ones, leave the
+        # documents unchanged
+        f"CREATE OR REPLACE FUNCTION {EMBEDDINGS_TRIGGER_FUNCTION}() "  # noqa: S608
+        "RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "IF TG_OP = 'INSERT' THEN "
+        f"PERFORM {REFRESH_FUNCTION}(ARRAY("
+        "SELECT DISTINCT track_id FROM new_rows WHERE text IS NOT NULL"
+        ")); "
+        "ELSIF TG_OP = 'DELETE' THEN "
+        f"PERFORM {REFRESH_FUNCTION}(ARRAY("
+        "SELECT DISTINCT track_id FROM old_rows WHERE text IS NOT NULL"
+        ")); "
+        "ELSE "
+        f"PERFORM {REFRESH_FUNCTION}(ARRAY("
+        "SELECT DISTINCT unnest(ARRAY[new_rows.track_id, old_rows.track_id]) "
+        "FROM new_rows JOIN old_rows USING (id) "
+        "WHERE new_rows.text IS DISTINCT FROM old_rows.text "
+        "OR new_rows.track_id IS DISTINCT FROM old_rows.track_id"
+        ")); "
+        "END IF; "
+        "RETURN NULL; "
+        "END $$",
+    ]
+    for table, (function, events) in TRIGGERS.items():
+        statements.extend(
+            f"CREATE TRIGGER {_trigger_name(table, event)} AFTER {event} ON {table} "
+            f"REFERENCING {_transition_tables(event)} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+            for event in events
+        )
+    return statements
+
+
+def drop_track_documents_sql() -> List[str]:
+    """Build the statements dropping the triggers and functions maintaining the documents.
+
+    Returns:
+        List[str]: The `DROP TRIGGER` and `DROP FUNCTION` statements.
+    """
+    statements = [
+        f"DROP TRIGGER IF EXISTS {_trigger_name(table, event)} ON {table}"
+        for table, (_, events) in TRIGGERS.items()
+        for event in events
+    ]
+    statements.extend(
+        f"DROP FUNCTION IF EXISTS {function}()"
+        for function in (TRACKS_TRIGGER_FUNCTION, EMBEDDINGS_TRIGGER_FUNCTION)
+    )
+    statements.append(f"DROP FUNCTION IF EXISTS {REFRESH_FUNCTION}(uuid[])")
+    return statements
+
+
+def refresh_track_documents_sql(table: str = "tracks", column: str = "id") -> str:
+    """Build the statement recomputing the documents of the tracks referenced by a table.
+
+    Args:
+        table (str): The table referencing the tracks. Defaults to "tracks",
+            i.e. all tracks.
+        column (str): The column of `table` holding the track IDs.
+            Defaults to "id".
+
+    Returns:
+        str: The `SELECT` statement.
+    """
+    return (
+        f"SELECT {REFRESH_FUNCTION}(ARRAY("  # noqa: S608
+        f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL))"
+    )
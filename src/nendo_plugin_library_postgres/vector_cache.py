@@ -0,0 +1,494 @@
+# -*- encoding: utf-8 -*-
+"""In-process cache of embedding matrices for exact nearest neighbor search."""
+
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from nendo import DistanceMetric
+
+# (user_id, plugin_name, plugin_version)
+SpaceKey = Tuple[uuid.UUID, str, str]
+
+# initial number of rows allocated for a matrix
+MIN_CAPACITY = 64
+
+
+def exact_distances(
+    matrix: np.ndarray,
+    vec: np.ndarray,
+    distance_metric: DistanceMetric,
+) -> np.ndarray:
+    """Compute the distances between a vector and all rows of a matrix.
+
+    The distances are defined the same way as pgvector's distance operators,
+    i.e. the inner product distance is the negative inner product.
+
+    Args:
+        matrix (np.ndarray): The float32 matrix of vectors, one per row.
+        vec (np.ndarray): The float32 query vector.
+        distance_metric (DistanceMetric): The distance metric to use.
+
+    Raises:
+        ValueError: If the distance metric is not supported.
+
+    Returns:
+        np.ndarray: The distances, one per row of the matrix.
+    """
+    if distance_metric == DistanceMetric.euclidean:
+        # |a - b|^2 = |a|^2 - 2ab + |b|^2, clipped to counter rounding errors
+        squared = (
+            np.einsum("ij,ij->i", matrix, matrix)
+            - 2 * (matrix @ vec)
+            + vec @ vec
+        )
+        return np.sqrt(np.maximum(squared, 0))
+    if distance_metric == DistanceMetric.cosine:
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vec)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 1 - (matrix @ vec) / norms
+    if distance_metric == DistanceMetric.max_inner_product:
+        return -(matrix @ vec)
+    raise ValueError(
+        f"Got unexpected value for distance: {distance_metric}. "
+        f"Should be one of {', '.join([ds.value for ds in DistanceMetric])}.",
+    )
+
+
+def nearest_rows(
+    vectors: np.ndarray,
+    track_ids: List[uuid.UUID],
+    vec: npt.ArrayLike,
+    limit: int,
+    distance_metric: DistanceMetric,
+    offset: int = 0,
+) -> List[Tuple[uuid.UUID, float]]:
+    """Run an exact nearest neighbor search over the rows of a matrix.
+
+    Args:
+        vectors (np.ndarray): The float32 matrix of vectors, one per row.
+        track_ids (List[uuid.UUID]): The track IDs of the rows, at least one
+            per row.
+        vec (npt.ArrayLike): The query vector.
+        limit (int): The number of results to return.
+        distance_metric (DistanceMetric): The distance metric to use.
+        offset (int): The number of nearest results to skip.
+
+    Returns:
+        List[Tuple[uuid.UUID, float]]: Tuples of track ID and distance,
+            ordered by their distance in ascending order.
+    """
+    size = vectors.shape[0]
+    k = min(limit + offset, size)
+    if k <= 0:
+        return []
+    distances = exact_distances(
+        vectors,
+        np.asarray(vec, dtype=np.float32),
+        distance_metric,
+    )
+    # like Postgres, sort undefined distances last
+    keys = np.where(np.isnan(distances), np.inf, distances)
+    if k < size:
+        nearest = np.argpartition(keys, k - 1)[:k]
+        nearest = nearest[np.argsort(keys[nearest], kind="stable")]
+    else:
+        nearest = np.argsort(keys, kind="stable")
+    return [(track_ids[row], float(distances[row])) for row in nearest[offset:]]
+
+
+class EmbeddingMatrix:
+    """Growable float32 matrix holding the embeddings of one embedding space.
+
+    Rows are appended into preallocated capacity, which is doubled when full,
+    and removed by moving the last row into the freed slot. Rows are only
+    changed in place once the arrays were copied, if a snapshot of them was
+    taken, see `snapshot()`.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = MIN_CAPACITY) -> None:
+        """Allocate an empty matrix for vectors of the given dimensions."""
+        self.dimensions = dimensions
+        self.size = 0
+        self.vectors = np.empty((max(capacity, MIN_CAPACITY), dimensions), np.float32)
+        self.embedding_ids: List[uuid.UUID] = []
+        self.track_ids: List[uuid.UUID] = []
+        self.rows: Dict[uuid.UUID, int] = {}
+        # whether a snapshot refers to the current arrays
+        self._shared = False
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint of the matrix, in bytes."""
+        # the per-row overhead covers the ids and the row index
+        return self.vectors.nbytes + len(self.embedding_ids) * 200
+
+    def _grow(self) -> None:
+        vectors = np.empty(
+            (self.vectors.shape[0] * 2, self.dimensions),
+            dtype=np.float32,
+        )
+        vectors[: self.size] = self.vectors[: self.size]
+        self.vectors = vectors
+
+    def _unshare(self) -> None:
+        """Copy the arrays before changing rows in place, if a snapshot refers to them."""
+        if self._shared:
+            self.vectors = self.vectors.copy()
+            self.track_ids = list(self.track_ids)
+            self._shared = False
+
+    def snapshot(self) -> Tuple[np.ndarray, List[uuid.UUID]]:
+        """Return the vectors and track IDs of the rows, to be read without a lock.
+
+        Appending rows leaves the rows of the snapshot as they are, and other
+        writes copy the arrays first, so the snapshot stays consistent.
+        """
+        self._shared = True
+        return self.vectors[: self.size], self.track_ids
+
+    def upsert(
+        self,
+        embedding_id: uuid.UUID,
+        track_id: uuid.UUID,
+        vec: npt.ArrayLike,
+    ) -> bool:
+        """Add an embedding to the matrix, or replace it if it already exists.
+
+        Returns:
+            bool: False if the vector does not have the matrix' dimensions.
+        """
+        vec = np.asarray(vec, dtype=np.float32)
+        if vec.shape != (self.dimensions,):
+            return False
+        row = self.rows.get(embedding_id)
+        if row is None:
+            if self.size == self.vectors.shape[0]:
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.rows[embedding_id] = row
+            self.embedding_ids.append(embedding_id)
+            self.track_ids.append(track_id)
+        else:
+            self._unshare()
+        self.track_ids[row] = track_id
+        self.vectors[row] = vec
+        return True
+
+    def remove(self, embedding_id: uuid.UUID) -> bool:
+        """Remove an embedding from the matrix.
+
+        Returns:
+            bool: True if the embedding was part of the matrix.
+        """
+        row = self.rows.pop(embedding_id, None)
+        if row is None:
+            return False
+        self._unshare()
+        last = self.size - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.embedding_ids[row] = self.embedding_ids[last]
+            self.track_ids[row] = self.track_ids[last]
+            self.rows[self.embedding_ids[row]] = row
+        self.embedding_ids.pop()
+        self.track_ids.pop()
+        self.size = last
+        return True
+
+    def remove_track(self, track_id: uuid.UUID) -> int:
+        """Remove all embeddings of a track from the matrix.
+
+        Returns:
+            int: The number of removed embeddings.
+        """
+        embedding_ids = [
+            embedding_id
+            for embedding_id, tid in zip(self.embedding_ids, self.track_ids)  # noqa: B905
+            if tid == track_id
+        ]
+        for embedding_id in embedding_ids:
+            self.remove(embedding_id)
+        return len(embedding_ids)
+
+    def search(
+        self,
+        vec: npt.ArrayLike,
+        limit: int,
+        distance_metric: DistanceMetric,
+        offset: int = 0,
+    ) -> List[Tuple[uuid.UUID, float]]:
+        """Run an exact nearest neighbor search over the matrix.
+
+        Args:
+            vec (npt.ArrayLike): The query vector.
+            limit (int): The number of results to return.
+            distance_metric (DistanceMetric): The distance metric to use.
+            offset (int): The number of nearest results to skip.
+
+        Returns:
+            List[Tuple[uuid.UUID, float]]: Tuples of track ID and distance,
+                ordered by their distance in ascending order.
+        """
+        return nearest_rows(
+            self.vectors[: self.size],
+            self.track_ids,
+            vec,
+            limit,
+            distance_metric,
+            offset=offset,
+        )
+
+
+def build_matrix(
+    rows: Iterable[Tuple[uuid.UUID, uuid.UUID, npt.ArrayLike]],
+) -> Optional[EmbeddingMatrix]:
+    """Build the matrix of a space from tuples of (embedding_id, track_id, vector).
+
+    Returns:
+        Optional[EmbeddingMatrix]: The matrix, or None if the vectors have mixed
+            dimensions.
+    """
+    rows = list(rows)
+    dimensions = {len(vec) for _, _, vec in rows}
+    if len(dimensions) > 1:
+        return None
+    matrix = EmbeddingMatrix(
+        dimensions=dimensions.pop() if len(dimensions) > 0 else 0,
+        capacity=len(rows),
+    )
+    for embedding_id, track_id, vec in rows:
+        matrix.upsert(embedding_id, track_id, vec)
+    return matrix
+
+
+class SpaceLoad:
+    """A space that is being loaded into the cache, see `VectorCache.get_or_load()`.
+
+    The writes to the space that happen while its rows are loaded are recorded,
+    and replayed on the loaded matrix.
+    """
+
+    def __init__(self) -> None:
+        """Start loading a space."""
+        self.done = threading.Event()
+        self.writes: List[Tuple[str, Any]] = []
+        # set if the space is invalidated while it is loaded
+        self.invalidated = False
+
+    def replay(self, matrix: EmbeddingMatrix) -> Optional[EmbeddingMatrix]:
+        """Apply the recorded writes to the loaded matrix.
+
+        Returns:
+            Optional[EmbeddingMatrix]: The matrix with the writes applied, or
+                None if a vector does not have the matrix' dimensions.
+        """
+        for method, args in self.writes:
+            if method != "upsert":
+                getattr(matrix, method)(*args)
+                continue
+            if matrix.size == 0:
+                # the dimensions of an empty space are set by its first vector
+                matrix = EmbeddingMatrix(dimensions=len(args[2]))
+            if not matrix.upsert(*args):
+                return None
+        return matrix
+
+
+class VectorCache:
+    """Thread-safe LRU cache of embedding matrices, bounded by memory."""
+
+    def __init__(self, max_bytes: int) -> None:
+        """Create an empty cache holding at most about `max_bytes` of matrices."""
+        self.max_bytes = max_bytes
+        self._spaces: "OrderedDict[SpaceKey, EmbeddingMatrix]" = OrderedDict()
+        # spaces that can not be cached, e.g. because of mixed dimensions
+        self._uncacheable: set = set()
+        # spaces whose rows are being loaded
+        self._loading: Dict[SpaceKey, SpaceLoad] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint of all cached matrices, in bytes."""
+        with self._lock:
+            return sum(matrix.nbytes for matrix in self._spaces.values())
+
+    def __contains__(self, key: SpaceKey) -> bool:
+        with self._lock:
+            return key in self._spaces
+
+    def _evict(self, keep: Optional[SpaceKey] = None) -> None:
+        total = sum(matrix.nbytes for matrix in self._spaces.values())
+        for key in list(self._spaces.keys()):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._spaces.pop(key).nbytes
+        if keep in self._spaces and total > self.max_bytes:
+            # a single space that exceeds the cap is not cached at all
+            self._spaces.pop(keep)
+            self._uncacheable.add(keep)
+
+    def get_or_load(
+        self,
+        key: SpaceKey,
+        load_rows: Callable[[], Iterable[Tuple[uuid.UUID, uuid.UUID, npt.ArrayLike]]],
+    ) -> Optional[EmbeddingMatrix]:
+        """Get the cached matrix of a space, loading it if it is not cached yet.
+
+        The rows are loaded without holding the cache lock, so that searches and
+        writes in other spaces are not blocked meanwhile. Other threads that ask
+        for the same space wait for the load instead of loading it again. Writes
+        to the space that happen during the load are applied after it.
+
+        Args:
+            key (SpaceKey): The (user_id, plugin_name, plugin_version) of the space.
+            load_rows (Callable): Function returning tuples of
+                (embedding_id, track_id, vector) for all embeddings of the space.
+
+        Returns:
+            Optional[EmbeddingMatrix]: The cached matrix, or None if the space
+                can not be cached, or was invalidated while it was loaded.
+        """
+        while True:
+            with self._lock:
+                matrix = self.get(key)
+                if matrix is not None or key in self._uncacheable:
+                    return matrix
+                load = self._loading.get(key)
+                if load is None:
+                    load = self._loading[key] = SpaceLoad()
+                    break
+            load.done.wait()
+            if load.invalidated:
+                return None
+        try:
+            matrix = build_matrix(load_rows())
+        except BaseException:
+            with self._lock:
+                self._loading.pop(key, None)
+                load.done.set()
+            raise
+        with self._lock:
+            self._loading.pop(key, None)
+            load.done.set()
+            if load.invalidated:
+                return None
+            if matrix is not None:
+                matrix = load.replay(matrix)
+            if matrix is None:
+                # mixed dimensions, fall back to the database for this space
+                self._uncacheable.add(key)
+                return None
+            self._spaces[key] = matrix
+            self._evict(keep=key)
+            return self._spaces.get(key)
+
+    def get(self, key: SpaceKey) -> Optional[EmbeddingMatrix]:
+        """Get the cached matrix of a space and mark it as recently used."""
+        with self._lock:
+            matrix = self._spaces.get(key)
+            if matrix is not None:
+                self._spaces.move_to_end(key)
+            return matrix
+
+    def search(
+        self,
+        key: SpaceKey,
+        vec: npt.ArrayLike,
+        limit: int,
+        distance_metric: DistanceMetric,
+        offset: int = 0,
+    ) -> Optional[List[Tuple[uuid.UUID, float]]]:
+        """Run an exact nearest neighbor search over a cached space.
+
+        Returns:
+            Optional[List[Tuple[uuid.UUID, float]]]: Tuples of track ID and
+                distance, or None if the space is not cached or the query vector
+                does not match its dimensions.
+        """
+        with self._lock:
+            matrix = self.get(key)
+            if matrix is None:
+                return None
+            if matrix.size > 0 and len(vec) != matrix.dimensions:
+                return None
+            vectors, track_ids = matrix.snapshot()
+        # the distances are computed without blocking writes
+        return nearest_rows(
+            vectors,
+            track_ids,
+            vec,
+            limit,
+            distance_metric,
+            offset=offset,
+        )
+
+    def upsert(
+        self,
+        key: SpaceKey,
+        embedding_id: uuid.UUID,
+        track_id: uuid.UUID,
+        vec: npt.ArrayLike,
+    ) -> None:
+        """Add or replace an embedding in its space, if the space is cached."""
+        if vec is None:
+            self.remove(embedding_id)
+            return
+        with self._lock:
+            # the embedding may have moved to another space
+            for other_key, matrix in list(self._spaces.items()):
+                if other_key != key:
+                    matrix.remove(embedding_id)
+            for other_key, load in self._loading.items():
+                if other_key != key:
+                    load.writes.append(("remove", (embedding_id,)))
+                else:
+                    load.writes.append(("upsert", (embedding_id, track_id, vec)))
+            matrix = self._spaces.get(key)
+            if matrix is None:
+                return
+            if matrix.size == 0:
+                matrix = self._spaces[key] = EmbeddingMatrix(dimensions=len(vec))
+            if not matrix.upsert(embedding_id, track_id, vec):
+                # mixed dimensions, fall back to the database for this space
+                self._spaces.pop(key)
+                self._uncacheable.add(key)
+                return
+            self._evict(keep=key)
+
+    def remove(self, embedding_id: uuid.UUID) -> None:
+        """Remove an embedding from all cached spaces."""
+        with self._lock:
+            for matrix in self._spaces.values():
+                matrix.remove(embedding_id)
+            for load in self._loading.values():
+                load.writes.append(("remove", (embedding_id,)))
+
+    def remove_track(self, track_id: uuid.UUID) -> None:
+        """Remove all embeddings of a track from all cached spaces."""
+        with self._lock:
+            for matrix in self._spaces.values():
+                matrix.remove_track(track_id)
+            for load in self._loading.values():
+                load.writes.append(("remove_track", (track_id,)))
+
+    def invalidate(self, key: Optional[SpaceKey] = None) -> None:
+        """Drop a cached space, or all cached spaces if no key is given."""
+        with self._lock:
+            if key is None:
+                self._spaces.clear()
+                self._uncacheable.clear()
+                for load in self._loading.values():
+                    load.invalidated = True
+            else:
+                self._spaces.pop(key, None)
+                self._uncacheable.discard(key)
+                if key in self._loading:
+                    self._loading[key].invalidated = True
@@ -0,0 +1,260 @@
+# -*- encoding: utf-8 -*-
+"""Helpers for managing pgvector ANN indexes on the embeddings and track vectors tables."""
+
+import hashlib
+from enum import Enum
+from typing import List, Optional
+
+from nendo import DistanceMetric
+
+
+class VectorIndexMethod(str, Enum):
+    """Enum representing the ANN index types supported by pgvector."""
+
+    hnsw: str = "hnsw"
+    ivfflat: str = "ivfflat"
+
+
+class VectorQuantization(str, Enum):
+    """Enum representing the compressed representations used for indexing vectors.
+
+    - halfvec: Half-precision floats, using half the space of `vector`.
+    - bit: One bit per dimension (`binary_quantize()`), compared by Hamming
+      distance.
+    """
+
+    halfvec: str = "halfvec"
+    bit: str = "bit"
+
+
+# pgvector operator classes, one per `DistanceMetric`
+OPERATOR_CLASSES = {
+    DistanceMetric.euclidean: "vector_l2_ops",
+    DistanceMetric.cosine: "vector_cosine_ops",
+    DistanceMetric.max_inner_product: "vector_ip_ops",
+}
+HALFVEC_OPERATOR_CLASSES = {
+    DistanceMetric.euclidean: "halfvec_l2_ops",
+    DistanceMetric.cosine: "halfvec_cosine_ops",
+    DistanceMetric.max_inner_product: "halfvec_ip_ops",
+}
+BIT_OPERATOR_CLASS = "bit_hamming_ops"
+
+# pgvector can not index vectors with more dimensions than this
+MAX_INDEX_DIMENSIONS = 2000
+MAX_QUANTIZED_INDEX_DIMENSIONS = {
+    VectorQuantization.halfvec: 4000,
+    VectorQuantization.bit: 64000,
+}
+
+# the tables whose `embedding` column can be indexed per embedding space
+VECTOR_INDEX_TABLES = ("embeddings", "track_vectors")
+
+# pgvector's default and maximum `hnsw.ef_search`
+DEFAULT_EF_SEARCH = 40
+MAX_EF_SEARCH = 1000
+
+
+class SearchStrategy(str, Enum):
+    """Enum representing the ways in which a nearest neighbor search can be run.
+
+    - cache: Answered from the result cache or the vector cache.
+    - unfiltered: A plain nearest neighbor query, which can use the ANN index.
+    - prefilter: Exact distances to the tracks that pass the filters.
+    - postfilter: A window of nearest neighbors from the ANN index, filtered
+      afterwards.
+    """
+
+    cache: str = "cache"
+    unfiltered: str = "unfiltered"
+    prefilter: str = "prefilter"
+    postfilter: str = "postfilter"
+
+
+class TrackAggregation(str, Enum):
+    """Enum representing the ways in which the embeddings of a track are scored.
+
+    - mean: The distance to the mean of the track's embeddings, i.e. its
+      pooled track vector.
+    - max: The distance to the track's closest embedding (max-sim).
+    """
+
+    mean: str = "mean"
+    max: str = "max"  # noqa: A003
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def index_distance_metrics(
+    quantization: Optional[VectorQuantization] = None,
+) -> List[Optional[DistanceMetric]]:
+    """Return the distance metrics for which an embedding space can be indexed.
+
+    Binary quantized vectors are always compared by Hamming distance, so they
+    have a single index, which is represented by None.
+    """
+    if quantization is not None and (
+        VectorQuantization(quantization) == VectorQuantization.bit
+    ):
+        return [None]
+    return list(OPERATOR_CLASSES)
+
+
+def vector_index_name(
+    plugin_name: str,
+    plugin_version: str,
+    method: VectorIndexMethod,
+    distance_metric: Optional[DistanceMetric],
+    quantization: Optional[VectorQuantization] = None,
+    table: str = "embeddings",
+) -> str:
+    """Return the name of the ANN index for the given embedding space.
+
+    The plugin name and version are hashed to stay below Postgres'
+    63 character limit for identifiers.
+
+    Args:
+        plugin_name (str): Name of the embedding plugin.
+        plugin_version (str): Version of the embedding plugin.
+        method (VectorIndexMethod): The index type.
+        distance_metric (DistanceMetric, optional): The distance metric of the
+            index. None for binary quantized indexes.
+        quantization (VectorQuantization, optional): The quantization of the
+            indexed vectors. Defaults to None.
+        table (str): The indexed table. Defaults to "embeddings".
+
+    Returns:
+        str: The index name.
+    """
+    digest = hashlib.sha1(  # noqa: S324
+        f"{plugin_name}@{plugin_version}".encode(),
+    ).hexdigest()[:16]
+    if quantization is None:
+        kind = DistanceMetric(distance_metric).value
+    elif VectorQuantization(quantization) == VectorQuantization.halfvec:
+        kind = f"half_{DistanceMetric(distance_metric).value}"
+    else:
+        kind = "bit_hamming"
+    return f"ix_{table}_{VectorIndexMethod(method).value}_{kind}_{digest}"
+
+
+def all_vector_index_names(plugin_name: str, plugin_version: str) -> List[str]:
+    """Return the names of all ANN indexes that an embedding space can have."""
+    return [
+        vector_index_name(
+            plugin_name, plugin_version, method, distance_metric, quantization, table,
+        )
+        for table in VECTOR_INDEX_TABLES
+        for method in VectorIndexMethod
+        for quantization in (None, *VectorQuantization)
+        for distance_metric in index_distance_metrics(quantization)
+    ]
+
+
+def indexed_expression_sql(
+    dimensions: int,
+    quantization: Optional[VectorQuantization] = None,
+) -> str:
+    """Return the SQL expression of the `embedding` column that ANN indexes cover.
+
+    Args:
+        dimensions (int): Dimensions of the embedding space.
+        quantization (VectorQuantization, optional): The quantization of the
+            indexed vectors. Defaults to None.
+
+    Returns:
+        str: The expression.
+    """
+    dimensions = int(dimensions)
+    if quantization is None:
+        return f"embedding::vector({dimensions})"
+    if VectorQuantization(quantization) == VectorQuantization.halfvec:
+        return f"embedding::halfvec({dimensions})"
+    return f"binary_quantize(embedding::vector({dimensions}))::bit({dimensions})"
+
+
+def create_vector_index_sql(
+    plugin_name: str,
+    plugin_version: str,
+    dimensions: int,
+    method: VectorIndexMethod,
+    distance_metric: DistanceMetric,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+    concurrently: bool = False,
+    quantization: Optional[VectorQuantization] = None,
+    table: str = "embeddings",
+    partition: Optional[str] = None,
+) -> str:
+    """Build the DDL statement creating a partial ANN index for an embedding space.
+
+    The indexed expression casts the untyped `embedding` column to a vector of
+    fixed dimensions, which is what allows pgvector to build the index. The
+    partial index predicate restricts it to the rows of one embedding space,
+    of all users, so searches filter the user after the index scan.
+    Quantized indexes cover the `halfvec` or `binary_quantize()` representation
+    of the vectors instead, which makes them two or 32 times smaller.
+
+    Args:
+        plugin_name (str): Name of the embedding plugin.
+        plugin_version (str): Version of the embedding plugin.
+        dimensions (int): Dimensions of the embedding space.
+        method (VectorIndexMethod): The index type.
+        distance_metric (DistanceMetric): The distance metric of the index.
+        m (int, optional): HNSW `m` parameter.
+        ef_construction (int, optional): HNSW `ef_construction` parameter.
+        lists (int, optional): IVFFlat `lists` parameter.
+        concurrently (bool): Whether to build the index without locking writes.
+        quantization (VectorQuantization, optional): The quantization of the
+            indexed vectors. Defaults to None.
+        table (str): The table to index, one of `VECTOR_INDEX_TABLES`.
+            Defaults to "embeddings".
+        partition (str, optional): The partition of the table holding the
+            embedding space, to index it instead of the whole table.
+
+    Raises:
+        ValueError: If the embedding space can not be indexed.
+
+    Returns:
+        str: The `CREATE INDEX` statement.
+    """
+    method = VectorIndexMethod(method)
+    if table not in VECTOR_INDEX_TABLES:
+        raise ValueError(
+            f"Can not index table {table}. Should be one of "
+            f"{', '.join(VECTOR_INDEX_TABLES)}.",
+        )
+    if quantization is None:
+        max_dimensions = MAX_INDEX_DIMENSIONS
+        operator_class = OPERATOR_CLASSES[DistanceMetric(distance_metric)]
+    else:
+        quantization = VectorQuantization(quantization)
+        max_dimensions = MAX_QUANTIZED_INDEX_DIMENSIONS[quantization]
+        operator_class = (
+            HALFVEC_OPERATOR_CLASSES[DistanceMetric(distance_metric)]
+            if quantization == VectorQuantization.halfvec
+            else BIT_OPERATOR_CLASS
+        )
+    if dimensions > max_dimensions:
+        raise ValueError(
+            f"Can not index vectors with {dimensions} dimensions. pgvector "
+            f"supports at most {max_dimensions} dimensions"
+            f"{f' for {quantization.value} indexes' if quantization else ''}.",
+        )
+    if method == VectorIndexMethod.hnsw:
+        options = {"m": m, "ef_construction": ef_construction}
+    else:
+        options = {"lists": lists}
+    with_clause = ", ".join(f"{k} = {int(v)}" for k, v in options.items() if v)
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"{vector_index_name(plugin_name, plugin_version, method, distance_metric, quantization, table)} "
+        f"ON {partition or table} USING {method.value} "
+        f"(({indexed_expression_sql(dimensions, quantization)}) {operator_class})"
+        f"{f' WITH ({with_clause})' if with_clause else ''} "
+        f"WHERE plugin_name = {_quote_literal(plugin_name)} "
+        f"AND plugin_version = {_quote_literal(plugin_version)}"
+    )
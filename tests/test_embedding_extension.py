@@ -1,15 +1,34 @@
 # -*- encoding: utf-8 -*-
 """Tests for the Nendo framework."""
 from nendo import (
+    DistanceMetric,
     Nendo,
     NendoConfig,
     NendoEmbeddingCreate,
+    NendoEmbeddingPlugin,
 )
 
+import logging
 import numpy as np
+import os
+import queue
+import tempfile
 import unittest
 import uuid
 
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+from nendo_plugin_library_postgres.duplicates import similarity_join
+from nendo_plugin_library_postgres.meta_search import (
+    create_meta_values_function_sql,
+    create_meta_values_index_sql,
+)
+from nendo_plugin_library_postgres.notify import ChangeListener
+from nendo_plugin_library_postgres.pagination import CursorKind, encode_cursor
+from nendo_plugin_library_postgres.result_cache import ResultCache
+from nendo_plugin_library_postgres.vector_cache import VectorCache
+
 nd = Nendo(
     config=NendoConfig(
         log_level="WARNING",
@@ -23,6 +42,31 @@ nd = Nendo(
     ),
 )
 
+
+
+def pgvector_version():
+    with nd.library.session_scope() as session:
+        version = session.execute(
+            text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"),
+        ).scalar()
+    return tuple(int(part) for part in version.split("."))
+
+
+def pg_trgm_available():
+    with nd.library.session_scope() as session:
+        return session.execute(
+            text("SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'"),
+        ).scalar() > 0
+
+
+class ConstantEmbeddingPlugin(NendoEmbeddingPlugin):
+    vector: list
+
+    @NendoEmbeddingPlugin.run_text
+    def embed_text(self, text, **kwargs):  # noqa: ARG002
+        return text, np.array(self.vector, dtype=np.float32)
+
+
 class EmbeddingExtensionTests(unittest.TestCase):
 
     # def test_init_with_no_embedding_plugin_auto_detects_clap(self):
@@ -256,8 +300,12 @@ class EmbeddingExtensionTests(unittest.TestCase):
             embedding=np.array([1,1,1]),
         )
         nd.library.add_embedding(embedding=test_embedding_1)
+        other_tracks = [
+            nd.library.add_track_from_signal(signal=np.zeros((2, 1000)), sr=44100)
+            for _ in range(2)
+        ]
         test_embedding_2 = NendoEmbeddingCreate(
-            track_id = track.id,
+            track_id = other_tracks[0].id,
             user_id=nd.library.user.id,
             plugin_name="nendo_plugin_embed_clap",
             plugin_version="0.1.0",
@@ -266,7 +314,7 @@ class EmbeddingExtensionTests(unittest.TestCase):
         )
         nd.library.add_embedding(embedding=test_embedding_2)
         test_embedding_3 = NendoEmbeddingCreate(
-            track_id = track.id,
+            track_id = other_tracks[1].id,
             user_id=nd.library.user.id,
             plugin_name="nendo_plugin_embed_clap",
             plugin_version="0.1.0",
@@ -279,6 +327,1683 @@ class EmbeddingExtensionTests(unittest.TestCase):
             embedding_name="nendo_plugin_embed_clap",
         )
         self.assertEqual(num_nearest_by_track, 2)
+        # tracks are counted once, however many embeddings they have
+        for track_id in (track.id, other_tracks[1].id):
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track_id,
+                    user_id=nd.library.user.id,
+                    plugin_name="nendo_plugin_embed_clap",
+                    plugin_version="0.1.0",
+                    text="Test4",
+                    embedding=np.array([0, 1, 0]),
+                ),
+            )
+        num_nearest_by_track = nd.library.count_nearest_by_track(
+            track=track,
+            embedding_name="nendo_plugin_embed_clap",
+        )
+        self.assertEqual(num_nearest_by_track, 2)
+
+    def test_count_nearest_by_track_with_max_distance(self):
+        nd.library.reset(force=True)
+        nd.library.result_cache = ResultCache(max_entries=10)
+        try:
+            track = nd.library.add_track(file_path="tests/assets/test.mp3")
+            for i, vec in enumerate(([1, 0, 0], [1, 0, 0.1], [0, 1, 0])):
+                embedded_track = track if i == 0 else nd.library.add_track_from_signal(
+                    signal=np.zeros((2, 1000)),
+                    sr=44100,
+                )
+                nd.library.add_embedding(
+                    embedding=NendoEmbeddingCreate(
+                        track_id=embedded_track.id,
+                        user_id=nd.library.user.id,
+                        plugin_name="nendo_plugin_embed_clap",
+                        plugin_version="0.1.0",
+                        text=str(vec),
+                        embedding=np.array(vec),
+                    ),
+                )
+            count = nd.library.count_nearest_by_track(
+                track=track,
+                embedding_name="nendo_plugin_embed_clap",
+                embedding_version="0.1.0",
+                distance_metric="l2",
+                max_distance=0.5,
+            )
+            self.assertEqual(count, 1)
+            # identical counts are answered by the result cache
+            count = nd.library.count_nearest_by_track(
+                track=track,
+                embedding_name="nendo_plugin_embed_clap",
+                embedding_version="0.1.0",
+                distance_metric="l2",
+                max_distance=0.5,
+            )
+            self.assertEqual(count, 1)
+            self.assertEqual(nd.library.nearest_cache_info().hits, 1)
+            # tracks without embeddings are not embedded
+            other_track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            count = nd.library.count_nearest_by_track(
+                track=other_track,
+                embedding_name="nendo_plugin_embed_clap",
+                embedding_version="0.1.0",
+            )
+            self.assertEqual(count, 3)
+            with self.assertRaises(ValueError):
+                nd.library.count_nearest_by_track(
+                    track=other_track,
+                    embedding_name="nendo_plugin_embed_clap",
+                    embedding_version="0.1.0",
+                    max_distance=0.5,
+                )
+        finally:
+            nd.library.result_cache = None
+
+
+    def test_create_vector_index_creates_and_drops_indexes(self):
+        nd.library.reset(force=True)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        nd.library.set_embedding_space(
+            dimensions=3,
+            plugin_name="test_plugin_index",
+            plugin_version="0.1.0",
+        )
+        for vec in ([1, 1, 1], [1, 1, 0], [1, 0, 0]):
+            embedding = nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="test_plugin_index",
+                    plugin_version="0.1.0",
+                    text=str(vec),
+                    embedding=np.array(vec),
+                ),
+            )
+        with self.assertRaises(ValueError):
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="test_plugin_index",
+                    plugin_version="0.1.0",
+                    text="Wrong dimensions",
+                    embedding=np.zeros(10),
+                ),
+            )
+        embedding.embedding = np.zeros(10)
+        with self.assertRaises(ValueError):
+            nd.library.update_embedding(embedding=embedding)
+        index_names = nd.library.create_vector_index(
+            plugin_name="test_plugin_index",
+            plugin_version="0.1.0",
+        )
+        self.assertEqual(len(index_names), 3)
+        self.assertEqual(
+            nd.library.get_vector_indexes(
+                plugin_name="test_plugin_index",
+                plugin_version="0.1.0",
+            ),
+            sorted(index_names),
+        )
+        rebuilt_index_names = nd.library.rebuild_vector_index(
+            plugin_name="test_plugin_index",
+            plugin_version="0.1.0",
+        )
+        self.assertEqual(rebuilt_index_names, sorted(index_names))
+        retrieved_tracks_with_scores = nd.library.nearest_by_vector_with_score(
+            vec=np.array([1, 1, 1]),
+            limit=3,
+            embedding_name="test_plugin_index",
+            embedding_version="0.1.0",
+        )
+        self.assertEqual(len(retrieved_tracks_with_scores), 3)
+        self.assertAlmostEqual(retrieved_tracks_with_scores[0][1], 0.0)
+        self.assertTrue(
+            nd.library.remove_embedding_space(
+                plugin_name="test_plugin_index",
+                plugin_version="0.1.0",
+            ),
+        )
+        self.assertEqual(
+            nd.library.get_vector_indexes(
+                plugin_name="test_plugin_index",
+                plugin_version="0.1.0",
+            ),
+            [],
+        )
+
+
+    def test_set_embedding_space_with_quantization(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_quantized", "plugin_version": "0.1.0"}
+        nd.library.set_embedding_space(dimensions=3, **space)
+        nd.library.create_vector_index(**space)
+        with self.assertRaises(ValueError):
+            nd.library.set_embedding_space(
+                dimensions=3,
+                quantization="halfvec",
+                **space,
+            )
+        nd.library.drop_vector_index(**space)
+        nd.library.set_embedding_space(dimensions=3, quantization="bit", **space)
+        # the space is loaded from the database after a change event
+        nd.library.embedding_quantization.clear()
+        self.assertEqual(
+            nd.library._get_embedding_quantization(**space),
+            "bit",
+        )
+        with self.assertRaises(ValueError):
+            nd.library.set_embedding_space(
+                dimensions=3,
+                quantization="float16",
+                **space,
+            )
+        self.assertTrue(nd.library.remove_embedding_space(**space))
+
+    @unittest.skipIf(
+        pgvector_version() < (0, 7),
+        "quantized indexes require pgvector 0.7",
+    )
+    def test_nearest_by_vector_with_score_reranks_quantized_candidates(self):
+        nd.library.reset(force=True)
+        tracks = []
+        for i in range(20):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            for plugin_name in ("test_plugin_halfvec", "test_plugin_bit"):
+                nd.library.add_embedding(
+                    embedding=NendoEmbeddingCreate(
+                        track_id=track.id,
+                        user_id=nd.library.user.id,
+                        plugin_name=plugin_name,
+                        plugin_version="0.1.0",
+                        text=str(i),
+                        embedding=np.array([1, i, -i]),
+                    ),
+                )
+            tracks.append(track)
+        for quantization, num_indexes in (("halfvec", 3), ("bit", 1)):
+            space = {
+                "plugin_name": f"test_plugin_{quantization}",
+                "plugin_version": "0.1.0",
+            }
+            nd.library.set_embedding_space(
+                dimensions=3,
+                quantization=quantization,
+                **space,
+            )
+            index_names = nd.library.create_vector_index(**space)
+            self.assertEqual(len(index_names), num_indexes)
+            self.assertEqual(
+                nd.library.get_vector_indexes(**space),
+                sorted(index_names),
+            )
+            # most binary codes are equal, so re-rank all embeddings
+            rerank_factor = nd.library.plugin_config.quantized_rerank_factor
+            nd.library.plugin_config.quantized_rerank_factor = 10
+            try:
+                results = nd.library.nearest_by_vector_with_score(
+                    vec=np.array([1, 19, -19]),
+                    limit=3,
+                    embedding_name=space["plugin_name"],
+                    embedding_version=space["plugin_version"],
+                    distance_metric="l2",
+                )
+            finally:
+                nd.library.plugin_config.quantized_rerank_factor = rerank_factor
+            # the exact distances of the re-ranked candidates are returned
+            self.assertEqual(
+                [t.id for t, _ in results],
+                [tracks[19].id, tracks[18].id, tracks[17].id],
+            )
+            np.testing.assert_allclose(
+                [d for _, d in results],
+                [0.0, np.sqrt(2), np.sqrt(8)],
+            )
+
+    def test_track_neighbors_are_built_and_maintained(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_neighbors", "plugin_version": "0.1.0"}
+        lookup = {
+            "embedding_name": space["plugin_name"],
+            "embedding_version": space["plugin_version"],
+            "distance_metric": "l2",
+        }
+
+        def add_track(position):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    text=str(position),
+                    embedding=np.array([1, position]),
+                    **space,
+                ),
+            )
+            return track
+
+        tracks = [add_track(i * i) for i in range(10)]
+        # spaces without neighbor graphs are remembered and skipped
+        graph_space = (nd.library.user.id, space["plugin_name"], space["plugin_version"])
+        self.assertFalse(nd.library.neighbor_graph_spaces[graph_space])
+        nd.library.add_plugin_data(
+            track_id=tracks[6].id,
+            plugin_name="test_plugin",
+            plugin_version="1.0",
+            key="match",
+            value="yes",
+        )
+        num_tracks = nd.library.build_track_neighbors(
+            k=3,
+            distance_metric="l2",
+            **space,
+        )
+        self.assertEqual(num_tracks, 10)
+        self.assertTrue(nd.library.neighbor_graph_spaces[graph_space])
+        neighbors = nd.library.get_track_neighbors(track_id=tracks[5].id, **lookup)
+        self.assertEqual(
+            [(t.id, d) for t, d in neighbors],
+            [(tracks[4].id, 9.0), (tracks[6].id, 11.0), (tracks[3].id, 16.0)],
+        )
+        neighbors = nd.library.get_track_neighbors(
+            track_id=tracks[5].id,
+            filters={"match": "yes"},
+            **lookup,
+        )
+        self.assertEqual([t.id for t, _ in neighbors], [tracks[6].id])
+        # the new track replaces the farthest neighbor of its neighbors
+        new_track = add_track(27)
+        self.assertEqual(
+            [t.id for t, _ in nd.library.get_track_neighbors(new_track.id, **lookup)],
+            [tracks[5].id, tracks[6].id, tracks[4].id],
+        )
+        self.assertEqual(
+            [t.id for t, _ in nd.library.get_track_neighbors(tracks[5].id, **lookup)],
+            [new_track.id, tracks[4].id, tracks[6].id],
+        )
+        # removing it refills the neighbors of its neighbors
+        nd.library.remove_track(new_track.id)
+        self.assertEqual(nd.library.get_track_neighbors(new_track.id, **lookup), [])
+        self.assertEqual(
+            [t.id for t, _ in nd.library.get_track_neighbors(tracks[5].id, **lookup)],
+            [tracks[4].id, tracks[6].id, tracks[3].id],
+        )
+        # moving a track removes it from the neighbors of its old neighbors
+        moved_track = add_track(27)
+        (embedding,) = nd.library.get_embeddings(track_id=moved_track.id, **space)
+        embedding.embedding = np.array([1, 90])
+        nd.library.update_embedding(embedding)
+        self.assertEqual(
+            [t.id for t, _ in nd.library.get_track_neighbors(tracks[5].id, **lookup)],
+            [tracks[4].id, tracks[6].id, tracks[3].id],
+        )
+        self.assertEqual(
+            [t.id for t, _ in nd.library.get_track_neighbors(tracks[9].id, **lookup)],
+            [moved_track.id, tracks[8].id, tracks[7].id],
+        )
+        # so does removing its embedding
+        nd.library.remove_embedding(embedding.id)
+        self.assertEqual(nd.library.get_track_neighbors(moved_track.id, **lookup), [])
+        self.assertEqual(
+            [t.id for t, _ in nd.library.get_track_neighbors(tracks[9].id, **lookup)],
+            [tracks[8].id, tracks[7].id, tracks[6].id],
+        )
+        self.assertTrue(
+            nd.library.drop_track_neighbors(distance_metric="l2", **space),
+        )
+        self.assertNotIn(graph_space, nd.library.neighbor_graph_spaces)
+        self.assertEqual(nd.library.get_track_neighbors(tracks[5].id, **lookup), [])
+
+    def test_find_duplicate_tracks_clusters_near_duplicates(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_duplicates", "plugin_version": "0.1.0"}
+        vectors = [
+            [[1, 0]],
+            [[1, 0.001]],
+            [[1, 0.002]],
+            [[0, 1]],
+            # embeddings of the same track are not duplicates
+            [[5, 5], [5, 5]],
+            [[5, 5.001]],
+        ]
+        tracks = []
+        for track_vectors in vectors:
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            for segment, vec in enumerate(track_vectors):
+                nd.library.add_embedding(
+                    embedding=NendoEmbeddingCreate(
+                        track_id=track.id,
+                        user_id=nd.library.user.id,
+                        text=f"segment {segment}",
+                        embedding=np.array(vec),
+                        **space,
+                    ),
+                )
+            tracks.append(track)
+        clusters = nd.library.find_duplicate_tracks(
+            threshold=0.0015,
+            distance_metric="l2",
+            processes=2,
+            add_collections=True,
+            add_relationships=True,
+            **space,
+        )
+        self.assertEqual(
+            [set(cluster.track_ids) for cluster in clusters],
+            [{t.id for t in tracks[:3]}, {tracks[4].id, tracks[5].id}],
+        )
+        # the chain A-B-C is connected by its two closest pairs
+        self.assertEqual(len(clusters[0].pairs), 2)
+        collections = nd.library.get_collections()
+        self.assertEqual(len(collections), 2)
+        self.assertEqual(
+            {c.collection_type for c in collections},
+            {"near_duplicates"},
+        )
+        self.assertEqual(
+            len(nd.library.get_related_tracks(track_id=tracks[5].id)),
+            1,
+        )
+        # blocks of rows and columns find the same pairs as a single block
+        matrix = np.random.default_rng(0).normal(size=(50, 4)).astype(np.float32)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "matrix.npy")
+            np.save(path, matrix)
+            pairs = [
+                sorted(zip(*similarity_join(  # noqa: B905
+                    path,
+                    threshold=1.0,
+                    distance_metric=DistanceMetric.euclidean,
+                    processes=1,
+                    max_block_elements=max_block_elements,
+                )[:2]))
+                for max_block_elements in (10, 50 * 50)
+            ]
+        self.assertGreater(len(pairs[1]), 0)
+        self.assertEqual(pairs[0], pairs[1])
+
+    def test_cluster_embeddings_assigns_tracks_to_centroids(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_clusters", "plugin_version": "0.1.0"}
+        vectors = [[0, 0], [0, 1], [1, 0], [10, 10], [10, 11], [11, 10]]
+        tracks = []
+        for vec in vectors:
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    text=str(vec),
+                    embedding=np.array(vec),
+                    **space,
+                ),
+            )
+            tracks.append(track)
+        cluster_space = (
+            nd.library.user.id, space["plugin_name"], space["plugin_version"],
+        )
+        self.assertFalse(nd.library.clustering_spaces[cluster_space])
+        centroids = nd.library.cluster_embeddings(
+            k=2,
+            distance_metric="l2",
+            batch_size=4,
+            seed=0,
+            add_collections=True,
+            **space,
+        )
+        np.testing.assert_allclose(
+            sorted(centroids.tolist()),
+            [[1 / 3, 1 / 3], [31 / 3, 31 / 3]],
+            atol=0.2,
+        )
+        np.testing.assert_allclose(
+            nd.library.get_cluster_centroids(**space),
+            centroids,
+            rtol=1e-6,
+        )
+        low = nd.library.get_track_cluster(track_id=tracks[0].id, **space)
+        high = nd.library.get_track_cluster(track_id=tracks[3].id, **space)
+        self.assertNotEqual(low, high)
+        self.assertEqual(
+            {t.id for t, _ in nd.library.get_cluster_tracks(low, **space)},
+            {t.id for t in tracks[:3]},
+        )
+        self.assertEqual(
+            nd.library.nearest_clusters(np.array([9, 9]), **space)[0][0],
+            high,
+        )
+        self.assertEqual(len(nd.library.get_collections()), 2)
+        # new tracks are assigned to the nearest stored centroid
+        new_track = nd.library.add_track_from_signal(
+            signal=np.zeros((2, 1000)),
+            sr=44100,
+        )
+        nd.library.add_embedding(
+            embedding=NendoEmbeddingCreate(
+                track_id=new_track.id,
+                user_id=nd.library.user.id,
+                text="new",
+                embedding=np.array([12, 12]),
+                **space,
+            ),
+        )
+        self.assertEqual(
+            nd.library.get_track_cluster(track_id=new_track.id, **space),
+            high,
+        )
+        # updated tracks are assigned again, and removed ones unassigned
+        (embedding,) = nd.library.get_embeddings(track_id=new_track.id, **space)
+        embedding.embedding = np.array([0, 0])
+        nd.library.update_embedding(embedding)
+        self.assertEqual(
+            nd.library.get_track_cluster(track_id=new_track.id, **space),
+            low,
+        )
+        nd.library.remove_embedding(embedding.id)
+        self.assertIsNone(
+            nd.library.get_track_cluster(track_id=new_track.id, **space),
+        )
+        self.assertEqual(len(nd.library.get_cluster_tracks(low, **space)), 3)
+        nd.library.remove_track(new_track.id, remove_embeddings=True)
+        self.assertEqual(len(nd.library.get_cluster_tracks(high, **space)), 3)
+        with self.assertRaises(ValueError):
+            nd.library.cluster_embeddings(k=7, **space)
+        with self.assertRaises(ValueError):
+            nd.library.cluster_embeddings(k=2, distance_metric="inner", **space)
+        self.assertTrue(nd.library.drop_clustering(**space))
+        self.assertNotIn(cluster_space, nd.library.clustering_spaces)
+        self.assertIsNone(nd.library.get_cluster_centroids(**space))
+
+    def test_nearest_tracks_by_vector_with_score_aggregates_embeddings(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_segments", "plugin_version": "0.1.0"}
+        nd.library.set_embedding_space(dimensions=2, **space)
+        vectors = [[[1, 0], [-1, 0]], [[0.9, 0]], [[0, 5]]]
+        tracks, embeddings = [], []
+        for i, track_vectors in enumerate(vectors):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            nd.library.add_plugin_data(
+                track_id=track.id,
+                plugin_name="test_plugin",
+                plugin_version="1.0",
+                key="match",
+                value="yes" if i == 2 else "no",  # noqa: PLR2004
+            )
+            for vec in track_vectors:
+                embeddings.append(
+                    nd.library.add_embedding(
+                        embedding=NendoEmbeddingCreate(
+                            track_id=track.id,
+                            user_id=nd.library.user.id,
+                            text=str(vec),
+                            embedding=np.array(vec),
+                            **space,
+                        ),
+                    ),
+                )
+            tracks.append(track)
+        index_names = nd.library.create_vector_index(track_vectors=True, **space)
+        self.assertTrue(all(n.startswith("ix_track_vectors_") for n in index_names))
+        self.assertEqual(nd.library.get_vector_indexes(**space), sorted(index_names))
+        np.testing.assert_allclose(
+            nd.library.get_track_vector(tracks[0].id, **space),
+            [0, 0],
+        )
+        # added embeddings are folded into the running mean
+        nd.library.add_embeddings(
+            [
+                NendoEmbeddingCreate(
+                    track_id=tracks[2].id,
+                    user_id=nd.library.user.id,
+                    text=str(vec),
+                    embedding=np.array(vec),
+                    **space,
+                )
+                for vec in ([2, 1], [4, 3])
+            ],
+        )
+        np.testing.assert_allclose(
+            nd.library.get_track_vector(tracks[2].id, **space),
+            [2, 3],
+            rtol=1e-6,
+        )
+        search_args = {
+            "vec": np.array([1, 0]),
+            "embedding_name": space["plugin_name"],
+            "embedding_version": space["plugin_version"],
+            "distance_metric": "l2",
+        }
+        # each track is returned once, scored by its nearest embedding
+        results = nd.library.nearest_tracks_by_vector_with_score(
+            aggregation="max",
+            **search_args,
+        )
+        self.assertEqual([t.id for t, _ in results], [t.id for t in tracks])
+        self.assertAlmostEqual(results[1][1], 0.1, places=5)
+        # or by the mean of its embeddings
+        results = nd.library.nearest_tracks_by_vector_with_score(**search_args)
+        self.assertEqual(
+            [t.id for t, _ in results],
+            [tracks[1].id, tracks[0].id, tracks[2].id],
+        )
+        self.assertAlmostEqual(results[1][1], 1.0, places=5)
+        for aggregation in ("mean", "max"):
+            results = nd.library.nearest_tracks_by_vector_with_score(
+                aggregation=aggregation,
+                filters={"match": "yes"},
+                **search_args,
+            )
+            self.assertEqual([t.id for t, _ in results], [tracks[2].id])
+        # the track vectors follow changes to the embeddings
+        nd.library.remove_embedding(embeddings[1].id)
+        np.testing.assert_allclose(
+            nd.library.get_track_vector(tracks[0].id, **space),
+            [1, 0],
+        )
+        results = nd.library.nearest_tracks_by_vector_with_score(
+            limit=1,
+            **search_args,
+        )
+        self.assertEqual([t.id for t, _ in results], [tracks[0].id])
+        nd.library.remove_track(tracks[1].id, remove_embeddings=True)
+        self.assertIsNone(nd.library.get_track_vector(tracks[1].id, **space))
+        self.assertTrue(nd.library.remove_embedding_space(**space))
+        self.assertEqual(nd.library.get_vector_indexes(**space), [])
+
+    def test_embedding_partition_is_created_searched_and_dropped(self):
+        nd.library.reset(force=True)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        spaces = [
+            {"plugin_name": "test_plugin_partition", "plugin_version": version}
+            for version in ("0.1.0", "0.2.0")
+        ]
+        for space in spaces:
+            nd.library.drop_embedding_partition(**space)
+            nd.library.set_embedding_space(dimensions=3, **space)
+            for vec in ([1, 1, 1], [1, 1, 0], [1, 0, 0]):
+                nd.library.add_embedding(
+                    embedding=NendoEmbeddingCreate(
+                        track_id=track.id,
+                        user_id=nd.library.user.id,
+                        text=str(vec),
+                        embedding=np.array(vec),
+                        **space,
+                    ),
+                )
+        self.assertIsNone(nd.library.get_embedding_partition(**spaces[0]))
+        # the existing embeddings are moved into the new partitions
+        partitions = [nd.library.create_embedding_partition(**s) for s in spaces]
+        self.assertEqual(nd.library.create_embedding_partition(**spaces[0]), partitions[0])
+        self.assertEqual(nd.library.get_embedding_partition(**spaces[1]), partitions[1])
+        index_names = nd.library.create_vector_index(**spaces[0])
+        self.assertEqual(nd.library.get_vector_indexes(**spaces[0]), sorted(index_names))
+        search_args = {
+            "vec": np.array([1, 1, 1]),
+            "embedding_name": spaces[0]["plugin_name"],
+            "distance_metric": "l2",
+        }
+        for space in spaces:
+            results = nd.library.nearest_by_vector_with_score(
+                embedding_version=space["plugin_version"],
+                **search_args,
+            )
+            self.assertEqual(len(results), 3)
+            self.assertAlmostEqual(results[0][1], 0.0)
+        nd.library.build_track_neighbors(k=1, **spaces[0])
+        nd.library.cluster_embeddings(k=1, seed=0, **spaces[0])
+        self.assertTrue(nd.library.drop_embedding_partition(**spaces[0]))
+        self.assertFalse(nd.library.drop_embedding_partition(**spaces[0]))
+        # the dropped graphs and clusterings are forgotten
+        space_key = (spaces[0]["plugin_name"], spaces[0]["plugin_version"])
+        for cached_spaces in (
+            nd.library.neighbor_graph_spaces,
+            nd.library.clustering_spaces,
+        ):
+            self.assertNotIn(space_key, [key[1:] for key in cached_spaces])
+        self.assertEqual(nd.library.get_vector_indexes(**spaces[0]), [])
+        self.assertEqual(
+            nd.library.nearest_by_vector_with_score(
+                embedding_version=spaces[0]["plugin_version"],
+                **search_args,
+            ),
+            [],
+        )
+        self.assertEqual(
+            len(nd.library.get_embeddings(track_id=track.id, **spaces[1])),
+            3,
+        )
+        self.assertTrue(nd.library.drop_embedding_partition(**spaces[1]))
+
+    @unittest.skipIf(not pg_trgm_available(), "requires the pg_trgm extension")
+    def test_search_meta_uses_trigram_indexes(self):
+        nd.library.reset(force=True)
+        # as done by the database migrations
+        with nd.library.session_scope() as session:
+            session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            session.execute(text(create_meta_values_function_sql()))
+            session.execute(text(create_meta_values_index_sql()))
+        nd.library.meta_values_indexed = None
+        tracks = [
+            nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+                meta=meta,
+            )
+            for meta in (
+                {"title": "Rainy Afternoon", "artist": "Nimbus"},
+                {"title": "Sunny Day", "artist": "Rainmaker"},
+            )
+        ]
+        index_name = nd.library.create_meta_index("title")
+        self.assertIn(index_name, nd.library.get_meta_indexes())
+        self.assertTrue(nd.library._is_meta_values_indexed())
+        for search_meta, expected in (
+            ({"title": ["rain"]}, [tracks[0]]),
+            ({"": ["rain"]}, tracks),
+            ({"": ["rain", "sunny"]}, [tracks[1]]),
+            # values are matched one by one
+            ({"": ["noon nimbus"]}, []),
+        ):
+            results = nd.library.filter_tracks_by_meta(search_meta=search_meta)
+            self.assertEqual(
+                sorted(t.id for t in results),
+                sorted(t.id for t in expected),
+            )
+        self.assertTrue(nd.library.drop_meta_index("title"))
+        self.assertFalse(nd.library.drop_meta_index("title"))
+
+    def test_search_meta_matches_exact_values(self):
+        nd.library.reset(force=True)
+        tracks = [
+            nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+                meta=meta,
+            )
+            for meta in (
+                {"genre": "Rock", "year": 1990},
+                {"genre": "Rockabilly", "year": 1956},
+            )
+        ]
+        for search_meta, expected in (
+            ({"genre": ["Rock"]}, [tracks[0]]),
+            ({"genre": ["rock"]}, []),
+            ({"genre": ["Rock", "Rockabilly"]}, tracks),
+            ({"genre": ["Rock"], "year": [1956]}, []),
+            ({"": [1956]}, [tracks[1]]),
+        ):
+            results = nd.library.filter_tracks_by_meta(
+                search_meta=search_meta,
+                meta_match="exact",
+            )
+            self.assertEqual(
+                sorted(t.id for t in results),
+                sorted(t.id for t in expected),
+            )
+        self.assertEqual(
+            nd.library.count_filtered_tracks_by_meta(search_meta={"genre": ["rock"]}),
+            2,
+        )
+
+    def test_search_tracks_ranks_tracks_by_their_words(self):
+        nd.library.reset(force=True)
+        tracks = [
+            nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+                meta=meta,
+            )
+            for meta in (
+                {"title": "Dark Techno Night", "artist": "Nimbus"},
+                {"title": "Techno", "artist": "Dark Star"},
+                {"title": "Sunny Day", "artist": "Techno Kids"},
+            )
+        ]
+
+        def search(query, **kwargs):
+            return [track.id for track, _ in nd.library.search_tracks(query, **kwargs)]
+
+        self.assertEqual(sorted(search("dark techno")), sorted(t.id for t in tracks[:2]))
+        self.assertEqual(search("techno -dark"), [tracks[2].id])
+        self.assertEqual(search("dark techno", track_type="loop"), [])
+        embedding = nd.library.add_embedding(
+            embedding=NendoEmbeddingCreate(
+                track_id=tracks[2].id,
+                user_id=nd.library.user.id,
+                plugin_name="test_plugin_search",
+                plugin_version="0.1.0",
+                text="dark ambient",
+                embedding=np.array([1, 0]),
+            ),
+        )
+        # matches in the meta data rank higher than in the embedding texts
+        self.assertEqual(search("dark techno")[-1], tracks[2].id)
+        self.assertEqual(
+            [
+                track.id
+                for track in nd.library.filter_tracks_by_meta(
+                    search_meta={"": ["dark star"]},
+                    meta_match="full_text",
+                )
+            ],
+            [tracks[1].id],
+        )
+        tracks[0].meta = {"title": "Bright Techno Morning"}
+        tracks[0].save()
+        nd.library.remove_embedding(embedding.id)
+        self.assertEqual(search("dark techno"), [tracks[1].id])
+
+    def test_hybrid_search_fuses_text_and_vector_ranks(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_hybrid", "plugin_version": "0.1.0"}
+        tracks = []
+        for title, vec in (
+            ("Dark Techno, Dark Night", [1, 4]),
+            ("Dark Techno", [1, 1]),
+            ("Sunny Day", [1, 0]),
+            ("Rainy Day", [1, 9]),
+        ):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+                meta={"title": title},
+            )
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    text="",
+                    embedding=np.array(vec),
+                    **space,
+                ),
+            )
+            tracks.append(track)
+
+        def search(**kwargs):
+            return [
+                track.id
+                for track, _ in nd.library.hybrid_search(
+                    query="dark techno",
+                    vec=np.array([1, 0]),
+                    embedding_name=space["plugin_name"],
+                    embedding_version=space["plugin_version"],
+                    distance_metric="l2",
+                    **kwargs,
+                )
+            ]
+
+        # ranked 1st by text and 3rd by vector, 2nd by both, 1st by vector only
+        self.assertEqual(
+            search(limit=3),
+            [tracks[0].id, tracks[1].id, tracks[2].id],
+        )
+        self.assertEqual(search(limit=1, offset=1), [tracks[1].id])
+        self.assertEqual(search(vector_weight=1, limit=1), [tracks[2].id])
+        self.assertEqual(
+            search(fusion="weighted", vector_weight=0, limit=1),
+            [tracks[0].id],
+        )
+        self.assertEqual(search(track_type="loop"), [])
+        with self.assertRaises(ValueError):
+            search(vector_weight=2)
+        # filtered out tracks don't take the places of the vector candidates
+        max_tracks = nd.library.plugin_config.prefilter_max_tracks
+        nd.library.plugin_config.prefilter_max_tracks = 0
+        try:
+            results = nd.library.hybrid_search(
+                query="dark techno",
+                vec=np.array([1, 0]),
+                limit=1,
+                num_candidates=1,
+                vector_weight=1,
+                search_meta={"title": ["dark"]},
+                embedding_name=space["plugin_name"],
+                embedding_version=space["plugin_version"],
+                distance_metric="l2",
+            )
+        finally:
+            nd.library.plugin_config.prefilter_max_tracks = max_tracks
+        self.assertEqual([track.id for track, _ in results], [tracks[1].id])
+        self.assertGreater(results[0][1], 0)
+
+    def test_cursors_page_through_filter_and_nearest_results(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_pages", "plugin_version": "0.1.0"}
+        for i, vec in enumerate(([1, 0], [1, 1], [1, 1], [1, 1], [1, 3])):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+                meta={"title": f"track {i}", "genre": "techno"},
+            )
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    text="",
+                    embedding=np.array(vec),
+                    **space,
+                ),
+            )
+
+        def pages(search, **kwargs):
+            results, cursor = [], ""
+            while cursor is not None:
+                page = search(limit=2, cursor=cursor, **kwargs)
+                results.extend(page)
+                cursor = page.next_cursor
+            return results
+
+        for order in ("asc", "desc"):
+            self.assertEqual(
+                [t.id for t in pages(
+                    nd.library.filter_tracks_by_meta,
+                    search_meta={"genre": ["techno"]},
+                    order_by="created_at",
+                    order=order,
+                )],
+                [t.id for t in nd.library.filter_tracks_by_meta(
+                    search_meta={"genre": ["techno"]},
+                    order_by="created_at",
+                    order=order,
+                )],
+            )
+
+        def nearest(**kwargs):
+            return nd.library.nearest_by_vector_with_score(
+                vec=np.array([1, 0]),
+                embedding_name=space["plugin_name"],
+                embedding_version=space["plugin_version"],
+                distance_metric="l2",
+                **kwargs,
+            )
+
+        # the tied distances are split across pages, by embedding ID
+        for filters in ({}, {"search_meta": {"genre": ["techno"]}}):
+            results = pages(nearest, **filters)
+            expected = nearest(limit=5, **filters)
+            self.assertEqual(
+                [distance for _, distance in results],
+                [distance for _, distance in expected],
+            )
+            self.assertEqual(
+                {track.id for track, _ in results},
+                {track.id for track, _ in expected},
+            )
+        with self.assertRaises(ValueError):
+            nearest(limit=2, offset=2, cursor="")
+        with self.assertRaises(ValueError):
+            nd.library.filter_tracks_by_meta(
+                limit=2,
+                cursor=nearest(limit=2, cursor="").next_cursor,
+            )
+        # cursors missing a value of their kind are malformed
+        with self.assertRaises(ValueError):
+            nearest(limit=2, cursor=encode_cursor(CursorKind.nearest, id=uuid.uuid4()))
+        with self.assertRaises(ValueError):
+            nd.library.filter_tracks_by_meta(
+                limit=2,
+                cursor=encode_cursor(CursorKind.filter, order_by="id", order="asc"),
+            )
+
+    def test_nearest_by_vector_with_score_with_search_params(self):
+        nd.library.reset(force=True)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        for vec in ([1, 1, 1], [1, 1, 0], [1, 0, 0]):
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="nendo_plugin_embed_clap",
+                    plugin_version="0.1.0",
+                    text=str(vec),
+                    embedding=np.array(vec),
+                ),
+            )
+        retrieved_tracks_with_scores = nd.library.nearest_by_vector_with_score(
+            vec=np.array([1, 1, 1]),
+            limit=3,
+            ef_search=100,
+            probes=5,
+        )
+        self.assertEqual(len(retrieved_tracks_with_scores), 3)
+        self.assertEqual(retrieved_tracks_with_scores[0][1], 0.0)
+        # all embeddings belong to the track itself
+        num_nearest_by_track = nd.library.count_nearest_by_track(
+            track=track,
+            embedding_name="nendo_plugin_embed_clap",
+        )
+        self.assertEqual(num_nearest_by_track, 0)
+
+    def test_nearest_by_vector_with_score_beyond_default_ef_search(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_ef_search", "plugin_version": "0.1.0"}
+        nd.library.set_embedding_space(dimensions=8, **space)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        rng = np.random.default_rng(0)
+        nd.library.add_embeddings(
+            NendoEmbeddingCreate(
+                track_id=track.id,
+                user_id=nd.library.user.id,
+                text=str(i),
+                embedding=rng.random(8),
+                **space,
+            )
+            for i in range(1100)
+        )
+        nd.library.create_vector_index(
+            method="hnsw",
+            distance_metrics=["l2"],
+            **space,
+        )
+        # drop the entries of rows deleted by previous runs
+        nd.library.rebuild_vector_index(**space)
+
+        def force_index_scan(connection):
+            connection.exec_driver_sql(
+                "SET LOCAL enable_seqscan = off; "
+                "SET LOCAL enable_bitmapscan = off; "
+                "SET LOCAL enable_sort = off",
+            )
+
+        event.listen(nd.library.db, "begin", force_index_scan)
+        try:
+            for nearest in (
+                nd.library.nearest_by_vector_with_score,
+                nd.library.nearest_track_ids_by_vector_with_score,
+            ):
+                results = nearest(
+                    vec=rng.random(8),
+                    limit=60,
+                    offset=20,
+                    embedding_name=space["plugin_name"],
+                    embedding_version=space["plugin_version"],
+                    distance_metric="l2",
+                )
+                # HNSW scans return at most `hnsw.ef_search` rows, 40 by default
+                self.assertEqual(len(results), 60)
+            results = nd.library.nearest_by_vectors_with_score(
+                vecs=[rng.random(8), rng.random(8)],
+                limit=60,
+                embedding_name=space["plugin_name"],
+                embedding_version=space["plugin_version"],
+                distance_metric="l2",
+            )
+            self.assertEqual([len(nearest) for nearest in results], [60, 60])
+            # cursor pages beyond `MAX_EF_SEARCH` candidates need iterative scans
+            with nd.library.session_scope() as session:
+                iterative_scan = nd.library._supports_iterative_scan(session)
+            page_args = {
+                "vec": rng.random(8),
+                "limit": 600,
+                "cursor": "",
+                "embedding_name": space["plugin_name"],
+                "embedding_version": space["plugin_version"],
+                "distance_metric": "l2",
+            }
+            if iterative_scan:
+                page = nd.library.nearest_by_vector_with_score(**page_args)
+                self.assertEqual(len(page), 600)
+            else:
+                with self.assertRaises(ValueError):
+                    nd.library.nearest_by_vector_with_score(**page_args)
+        finally:
+            event.remove(nd.library.db, "begin", force_index_scan)
+
+    def test_nearest_by_vector_with_strategy_caches_space_sizes(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_sizes", "plugin_version": "0.1.0"}
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        search_args = {
+            "vec": np.array([1, 0]),
+            "embedding_name": space["plugin_name"],
+            "embedding_version": space["plugin_version"],
+        }
+        nd.library.add_embedding(
+            embedding=NendoEmbeddingCreate(
+                track_id=track.id,
+                user_id=nd.library.user.id,
+                text="Test",
+                embedding=np.array([1, 1]),
+                **space,
+            ),
+        )
+        _, strategy = nd.library.nearest_by_vector_with_strategy(**search_args)
+        self.assertEqual(strategy, "unfiltered")
+        self.assertIn(
+            (space["plugin_name"], space["plugin_version"]),
+            nd.library.shared_spaces,
+        )
+        # another user's embedding makes the user ID a filter
+        nd.library.add_embedding(
+            embedding=NendoEmbeddingCreate(
+                track_id=track.id,
+                user_id=uuid.uuid4(),
+                text="Other",
+                embedding=np.array([1, 2]),
+                **space,
+            ),
+        )
+        _, strategy = nd.library.nearest_by_vector_with_strategy(**search_args)
+        self.assertEqual(strategy, "prefilter")
+
+    def test_nearest_by_vector_with_strategy_in_shared_space(self):
+        nd.library.reset(force=True)
+        space = {"plugin_name": "test_plugin_shared", "plugin_version": "0.1.0"}
+        nd.library.set_embedding_space(dimensions=2, **space)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        other_user_id = uuid.uuid4()
+        # the other user's embeddings are all nearer to the query vector
+        nd.library.add_embeddings(
+            NendoEmbeddingCreate(
+                track_id=track.id,
+                user_id=user_id,
+                text=str(i + offset),
+                embedding=np.array([1, i + offset]),
+                **space,
+            )
+            for user_id, offset in ((other_user_id, 0), (nd.library.user.id, 1000))
+            for i in range(100)
+        )
+        nd.library.create_vector_index(
+            method="hnsw",
+            distance_metrics=["l2"],
+            **space,
+        )
+        nd.library.rebuild_vector_index(**space)
+        search_args = {
+            "vec": np.array([1, 0]),
+            "limit": 10,
+            "embedding_name": space["plugin_name"],
+            "embedding_version": space["plugin_version"],
+            "distance_metric": "l2",
+        }
+
+        def force_index_scan(connection):
+            connection.exec_driver_sql(
+                "SET LOCAL enable_seqscan = off; "
+                "SET LOCAL enable_bitmapscan = off; "
+                "SET LOCAL enable_sort = off",
+            )
+
+        event.listen(nd.library.db, "begin", force_index_scan)
+        max_tracks = nd.library.plugin_config.prefilter_max_tracks
+        try:
+            for max_prefilter_tracks, expected_strategy in (
+                (max_tracks, "prefilter"),
+                (0, "postfilter"),
+            ):
+                nd.library.plugin_config.prefilter_max_tracks = max_prefilter_tracks
+                results, strategy = nd.library.nearest_by_vector_with_strategy(
+                    **search_args,
+                )
+                self.assertEqual(strategy, expected_strategy)
+                self.assertEqual(
+                    [distance for _, distance in results],
+                    [float(1000 + i) for i in range(10)],
+                )
+        finally:
+            event.remove(nd.library.db, "begin", force_index_scan)
+            nd.library.plugin_config.prefilter_max_tracks = max_tracks
+
+    def test_add_embeddings_adds_embeddings(self):
+        nd.library.reset(force=True)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        test_embeddings = [
+            NendoEmbeddingCreate(
+                track_id=track.id,
+                user_id=nd.library.user.id,
+                plugin_name="nendo_plugin_embed_clap",
+                plugin_version="0.1.0",
+                text=f"Test{i}",
+                embedding=np.arange(10) * i,
+            )
+            for i in range(5)
+        ]
+        saved_embeddings = nd.library.add_embeddings(
+            embeddings=test_embeddings,
+            batch_size=2,
+        )
+        self.assertEqual(len(saved_embeddings), 5)
+        for test_embedding, saved_embedding in zip(test_embeddings, saved_embeddings):  # noqa: B905
+            retrieved_embedding = nd.library.get_embedding(
+                embedding_id=saved_embedding.id,
+            )
+            self.assertEqual(retrieved_embedding.text, test_embedding.text)
+            self.assertEqual(retrieved_embedding.track_id, track.id)
+            self.assertTrue(
+                (retrieved_embedding.embedding == test_embedding.embedding).all(),
+            )
+        saved_ids = nd.library.add_embeddings(
+            embeddings=(
+                e.model_copy(update={"text": f"Other{e.text}"})
+                for e in test_embeddings
+            ),
+            return_ids=True,
+        )
+        self.assertEqual(len(saved_ids), 5)
+        self.assertEqual(
+            len(nd.library.get_embeddings(track_id=track.id)),
+            10,
+        )
+
+    def test_upsert_embeddings_replaces_existing_embeddings(self):
+        nd.library.reset(force=True)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        space = {"plugin_name": "test_plugin_upsert", "plugin_version": "0.1.0"}
+
+        def make_embeddings(scale):
+            return [
+                NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    text=f"Test{i}",
+                    embedding=np.array([i, 1]) * scale,
+                    **space,
+                )
+                for i in range(5)
+            ]
+
+        added = nd.library.add_embeddings(embeddings=make_embeddings(1)[:3])
+        upserted = nd.library.upsert_embeddings(
+            embeddings=make_embeddings(2),
+            batch_size=2,
+        )
+        self.assertEqual([e.id for e in upserted[:3]], [e.id for e in added])
+        # re-running the same job does not add embeddings
+        upserted_ids = nd.library.upsert_embeddings(
+            embeddings=make_embeddings(3),
+            return_ids=True,
+        )
+        self.assertEqual(upserted_ids, [e.id for e in upserted])
+        embeddings = nd.library.get_embeddings(track_id=track.id, **space)
+        self.assertEqual(len(embeddings), 5)
+        for embedding in embeddings:
+            i = int(embedding.text[len("Test"):])
+            np.testing.assert_allclose(embedding.embedding, [3 * i, 3])
+        np.testing.assert_allclose(
+            nd.library.get_track_vector(track.id, **space),
+            [6, 3],
+        )
+        # the last of several embeddings with the same key wins
+        (last,) = set(
+            nd.library.upsert_embeddings(
+                embeddings=make_embeddings(4)[:1] + make_embeddings(5)[:1],
+                return_ids=True,
+            ),
+        )
+        np.testing.assert_allclose(
+            nd.library.get_embedding(embedding_id=last).embedding,
+            [0, 5],
+        )
+        # embeddings without a text conflict with each other as well
+        with self.assertRaises(IntegrityError), nd.library.db.begin() as connection:
+            for _ in range(2):
+                connection.execute(
+                    text(
+                        "INSERT INTO embeddings (id, track_id, user_id, "
+                        "plugin_name, plugin_version, embedding) VALUES (:id, "
+                        ":track_id, :user_id, :plugin_name, :plugin_version, "
+                        "'[1,1]')",
+                    ),
+                    {
+                        "id": uuid.uuid4(),
+                        "track_id": track.id,
+                        "user_id": nd.library.user.id,
+                        **space,
+                    },
+                )
+
+    def test_embedding_plugin_replaces_embedding_of_track(self):
+        nd.library.reset(force=True)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        space = {"plugin_name": "test_plugin_reembed", "plugin_version": "0.1.0"}
+        plugin = ConstantEmbeddingPlugin(
+            nendo_instance=nd,
+            config=NendoConfig(replace_plugin_data=False),
+            logger=logging.getLogger("test_plugin_reembed"),
+            vector=[1, 0],
+            **space,
+        )
+        first = plugin.embed_text(track=track)
+        plugin.vector = [0, 1]
+        second = plugin.embed_text(track=track)
+        self.assertEqual(second.id, first.id)
+        (embedding,) = nd.library.get_embeddings(track_id=track.id, **space)
+        np.testing.assert_allclose(embedding.embedding, [0, 1])
+        np.testing.assert_allclose(
+            nd.library.get_track_vector(track.id, **space),
+            [0, 1],
+        )
+        # so do bulk adds
+        nd.library.add_embeddings(
+            embeddings=[
+                NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    text=embedding.text,
+                    embedding=np.array([1, 1]),
+                    **space,
+                ),
+            ],
+        )
+        (embedding,) = nd.library.get_embeddings(track_id=track.id, **space)
+        self.assertEqual(embedding.id, first.id)
+        np.testing.assert_allclose(embedding.embedding, [1, 1])
+
+    def test_get_embedding_matrix_streams_embeddings(self):
+        nd.library.reset(force=True)
+        track = nd.library.add_track(file_path="tests/assets/test.mp3")
+        vectors = np.arange(50, dtype=np.float32).reshape(5, 10)
+        nd.library.add_embeddings(
+            embeddings=[
+                NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="test_plugin_export",
+                    plugin_version="0.1.0",
+                    text=f"Test{i}",
+                    embedding=vec,
+                )
+                for i, vec in enumerate(vectors)
+            ],
+        )
+        batches = list(
+            nd.library.iter_embedding_batches(
+                plugin_name="test_plugin_export",
+                plugin_version="0.1.0",
+                batch_size=2,
+            ),
+        )
+        self.assertEqual([len(ids) for ids, _ in batches], [2, 2, 1])
+        self.assertTrue(all(m.dtype == np.float32 for _, m in batches))
+        track_ids, matrix = nd.library.get_embedding_matrix(
+            plugin_name="test_plugin_export",
+            plugin_version="0.1.0",
+            batch_size=2,
+        )
+        self.assertEqual(matrix.shape, (5, 10))
+        self.assertEqual(set(track_ids), {track.id})
+        np.testing.assert_array_equal(
+            matrix[np.argsort(matrix[:, 0])],
+            vectors,
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out = os.path.join(tmp_dir, "embeddings.npy")
+            _, memmap = nd.library.get_embedding_matrix(
+                plugin_name="test_plugin_export",
+                plugin_version="0.1.0",
+                out=out,
+            )
+            self.assertIsInstance(memmap, np.memmap)
+            np.testing.assert_array_equal(np.load(out), memmap)
+
+    def test_vector_columns_are_cast_to_float32_arrays(self):
+        with nd.library.session_scope() as session:
+            vec = session.execute(text("SELECT '[1,2.5,3]'::vector")).scalar()
+        self.assertIsInstance(vec, np.ndarray)
+        self.assertEqual(vec.dtype, np.float32)
+        np.testing.assert_array_equal(vec, [1, 2.5, 3])
+
+    def test_nearest_by_vectors_with_score(self):
+        nd.library.reset(force=True)
+        tracks = []
+        for vec in ([1, 1, 1], [1, 1, 0], [1, 0, 0]):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="nendo_plugin_embed_clap",
+                    plugin_version="0.1.0",
+                    text=str(vec),
+                    embedding=np.array(vec),
+                ),
+            )
+            tracks.append(track)
+        results = nd.library.nearest_by_vectors_with_score(
+            vecs=[np.array([1, 0, 0]), np.array([1, 1, 1])],
+            limit=2,
+        )
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(results[0]), 2)
+        self.assertEqual(results[0][0][0].id, tracks[2].id)
+        self.assertEqual(results[0][0][1], 0.0)
+        self.assertEqual(results[1][0][0].id, tracks[0].id)
+        self.assertEqual(results[1][0][1], 0.0)
+        self.assertEqual(results[1][1][0].id, tracks[1].id)
+        self.assertEqual(nd.library.nearest_by_vectors_with_score(vecs=[]), [])
+
+    def test_nearest_track_ids_by_vector_with_score(self):
+        nd.library.reset(force=True)
+        tracks = []
+        for vec in ([1, 1, 1], [1, 1, 0], [1, 0, 0]):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="nendo_plugin_embed_clap",
+                    plugin_version="0.1.0",
+                    text=str(vec),
+                    embedding=np.array(vec),
+                ),
+            )
+            tracks.append(track)
+        results = nd.library.nearest_track_ids_by_vector_with_score(
+            vec=np.array([1, 1, 1]),
+            limit=2,
+        )
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0], (tracks[0].id, 0.0))
+        self.assertEqual(results[1][0], tracks[1].id)
+        results = nd.library.nearest_track_ids_by_vector_with_score(
+            vec=np.array([1, 0, 0]),
+            limit=1,
+            columns=["id", "track_type"],
+        )
+        self.assertEqual(results, [(tracks[2].id, "track", 0.0)])
+        with self.assertRaises(ValueError):
+            nd.library.nearest_track_ids_by_vector_with_score(
+                vec=np.array([1, 0, 0]),
+                columns=["embedding"],
+            )
+        hydrated_tracks = nd.library.get_tracks_by_ids(
+            track_ids=[tracks[2].id, tracks[0].id],
+        )
+        self.assertEqual([t.id for t in hydrated_tracks], [tracks[2].id, tracks[0].id])
+
+
+    def test_nearest_by_vector_with_score_uses_vector_cache(self):
+        nd.library.reset(force=True)
+        nd.library.vector_cache = VectorCache(max_bytes=1024 * 1024)
+        try:
+            tracks, embeddings = [], []
+            for vec in ([1, 1, 1], [1, 1, 0], [1, 0, 0]):
+                track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+                embeddings.append(nd.library.add_embedding(
+                    embedding=NendoEmbeddingCreate(
+                        track_id=track.id,
+                        user_id=nd.library.user.id,
+                        plugin_name="nendo_plugin_embed_clap",
+                        plugin_version="0.1.0",
+                        text=str(vec),
+                        embedding=np.array(vec),
+                    ),
+                ))
+                tracks.append(track)
+            for distance_metric in ("l2", "cosine", "inner"):
+                cached = nd.library.nearest_track_ids_by_vector_with_score(
+                    vec=np.array([1, 1, 0.5]),
+                    distance_metric=distance_metric,
+                )
+                # column projections are always answered by the database
+                uncached = nd.library.nearest_track_ids_by_vector_with_score(
+                    vec=np.array([1, 1, 0.5]),
+                    distance_metric=distance_metric,
+                    columns=["id", "user_id"],
+                )
+                self.assertEqual(
+                    [track_id for track_id, _ in cached],
+                    [track_id for track_id, _, _ in uncached],
+                )
+                for (_, d1), (_, _, d2) in zip(cached, uncached):  # noqa: B905
+                    self.assertAlmostEqual(d1, d2, places=5)
+            # writes are applied to the cache
+            embeddings[0].embedding = np.array([0, 0, 1])
+            nd.library.update_embedding(embedding=embeddings[0])
+            nd.library.remove_embedding(embedding_id=embeddings[2].id)
+            results = nd.library.nearest_by_vector_with_score(
+                vec=np.array([0, 0, 1]),
+            )
+            self.assertEqual(len(results), 2)
+            self.assertEqual(results[0][0].id, tracks[0].id)
+            self.assertAlmostEqual(results[0][1], 0.0, places=5)
+            nd.library.remove_track(track_id=tracks[0].id)
+            results = nd.library.nearest_by_vector_with_score(
+                vec=np.array([0, 0, 1]),
+            )
+            self.assertEqual([track.id for track, _ in results], [tracks[1].id])
+        finally:
+            nd.library.vector_cache = None
+
+    def test_vector_cache_applies_writes_made_while_loading(self):
+        cache = VectorCache(max_bytes=1024 * 1024)
+        key = (uuid.uuid4(), "test_plugin_cache", "0.1.0")
+        track_ids = [uuid.uuid4() for _ in range(3)]
+        embedding_ids = [uuid.uuid4() for _ in range(3)]
+
+        def load_rows():
+            # writes to the space while its rows are read
+            cache.upsert(key, embedding_ids[2], track_ids[2], np.array([0, 1]))
+            cache.remove(embedding_ids[0])
+            self.assertIsNone(
+                cache.search(key, np.array([1, 0]), 10, DistanceMetric.euclidean),
+            )
+            return [
+                (embedding_ids[0], track_ids[0], np.array([1, 0])),
+                (embedding_ids[1], track_ids[1], np.array([1, 1])),
+            ]
+
+        matrix = cache.get_or_load(key, load_rows)
+        self.assertEqual(matrix.size, 2)
+        results = cache.search(key, np.array([0, 1]), 10, DistanceMetric.euclidean)
+        self.assertEqual(
+            [track_id for track_id, _ in results],
+            [track_ids[2], track_ids[1]],
+        )
+        # snapshots are not changed by later writes
+        vectors, snapshot_track_ids = matrix.snapshot()
+        cache.remove(embedding_ids[1])
+        cache.upsert(key, embedding_ids[2], track_ids[2], None)
+        self.assertEqual(matrix.size, 0)
+        np.testing.assert_allclose(vectors, [[0, 1], [1, 1]])
+        self.assertEqual(snapshot_track_ids[:2], [track_ids[2], track_ids[1]])
+
+
+    def test_change_listener_receives_change_events(self):
+        nd.library.reset(force=True)
+        events = queue.Queue()
+        listener = ChangeListener(engine=nd.library.db, callback=events.put)
+        listener.start()
+        nd.library.plugin_config.change_notifications_enabled = True
+        try:
+            track = nd.library.add_track(file_path="tests/assets/test.mp3")
+            embedding = nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="nendo_plugin_embed_clap",
+                    plugin_version="0.1.0",
+                    text="Test",
+                    embedding=np.array([1, 0, 0]),
+                ),
+            )
+            nd.library.remove_embedding(embedding_id=embedding.id)
+            received = []
+            while len(received) < 3:  # noqa: PLR2004
+                received.append(events.get(timeout=10))
+        finally:
+            nd.library.plugin_config.change_notifications_enabled = False
+            listener.stop()
+        self.assertEqual(
+            [(e["entity"], e["action"]) for e in received],
+            [("track", "insert"), ("embedding", "insert"), ("embedding", "delete")],
+        )
+        self.assertEqual(received[1]["embedding_id"], str(embedding.id))
+        self.assertEqual(received[1]["plugin_name"], "nendo_plugin_embed_clap")
+        self.assertEqual(received[2]["origin"], nd.library.origin)
+        self.assertFalse(listener.is_alive())
+
+
+    def test_nearest_by_vector_with_score_uses_result_cache(self):
+        nd.library.reset(force=True)
+        nd.library.result_cache = ResultCache(max_entries=10)
+        try:
+            track = nd.library.add_track(file_path="tests/assets/test.mp3")
+            for vec in ([1, 1, 1], [1, 0, 0]):
+                nd.library.add_embedding(
+                    embedding=NendoEmbeddingCreate(
+                        track_id=track.id,
+                        user_id=nd.library.user.id,
+                        plugin_name="nendo_plugin_embed_clap",
+                        plugin_version="0.1.0",
+                        text=str(vec),
+                        embedding=np.array(vec),
+                    ),
+                )
+            first = nd.library.nearest_by_vector_with_score(vec=np.array([1, 0, 0]))
+            second = nd.library.nearest_by_vector_with_score(vec=np.array([1, 0, 0]))
+            self.assertEqual(
+                [(t.id, d) for t, d in first],
+                [(t.id, d) for t, d in second],
+            )
+            info = nd.library.nearest_cache_info()
+            self.assertEqual((info.hits, info.misses, info.currsize), (1, 1, 1))
+            # different arguments are cached separately
+            nd.library.nearest_track_ids_by_vector_with_score(
+                vec=np.array([1, 0, 0]),
+                limit=1,
+            )
+            self.assertEqual(nd.library.nearest_cache_info().currsize, 2)
+            # adding an embedding to the space invalidates its results
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="nendo_plugin_embed_clap",
+                    plugin_version="0.1.0",
+                    text="Test",
+                    embedding=np.array([1, 0, 0.1]),
+                ),
+            )
+            self.assertEqual(nd.library.nearest_cache_info().currsize, 0)
+            results = nd.library.nearest_by_vector_with_score(vec=np.array([1, 0, 0]))
+            self.assertEqual(len(results), 3)
+            nd.library.clear_nearest_cache()
+            self.assertEqual(nd.library.nearest_cache_info().currsize, 0)
+        finally:
+            nd.library.result_cache = None
+
+
+    def test_nearest_by_vector_with_strategy_filters_candidates(self):
+        nd.library.reset(force=True)
+        nd.library.set_embedding_space(
+            dimensions=2,
+            plugin_name="test_plugin_filtered",
+            plugin_version="0.1.0",
+        )
+        tracks = []
+        for i in range(20):
+            track = nd.library.add_track_from_signal(
+                signal=np.zeros((2, 1000)),
+                sr=44100,
+            )
+            nd.library.add_embedding(
+                embedding=NendoEmbeddingCreate(
+                    track_id=track.id,
+                    user_id=nd.library.user.id,
+                    plugin_name="test_plugin_filtered",
+                    plugin_version="0.1.0",
+                    text=str(i),
+                    embedding=np.array([1, i]),
+                ),
+            )
+            # only every fifth track passes the filter
+            nd.library.add_plugin_data(
+                track_id=track.id,
+                plugin_name="test_plugin",
+                plugin_version="1.0",
+                key="match",
+                value="yes" if i % 5 == 0 else "no",
+            )
+            tracks.append(track)
+        nd.library.create_vector_index(
+            plugin_name="test_plugin_filtered",
+            plugin_version="0.1.0",
+        )
+        search_args = {
+            "vec": np.array([1, 19]),
+            "limit": 3,
+            "embedding_name": "test_plugin_filtered",
+            "embedding_version": "0.1.0",
+            "distance_metric": "l2",
+        }
+        expected_ids = [tracks[15].id, tracks[10].id, tracks[5].id]
+
+        def nearest_by_vectors():
+            return [
+                [t.id for t, _ in results]
+                for results in nd.library.nearest_by_vectors_with_score(
+                    vecs=[search_args["vec"], np.array([1, 0])],
+                    filters={"match": "yes"},
+                    **{k: v for k, v in search_args.items() if k != "vec"},
+                )
+            ]
+
+        batch_expected_ids = [
+            expected_ids,
+            [tracks[0].id, tracks[5].id, tracks[10].id],
+        ]
+        results, strategy = nd.library.nearest_by_vector_with_strategy(
+            filters={"match": "yes"},
+            **search_args,
+        )
+        self.assertEqual(strategy, "prefilter")
+        self.assertEqual([t.id for t, _ in results], expected_ids)
+        self.assertEqual(nearest_by_vectors(), batch_expected_ids)
+        max_tracks = nd.library.plugin_config.prefilter_max_tracks
+        nd.library.plugin_config.prefilter_max_tracks = 0
+        try:
+            results, strategy = nd.library.nearest_by_vector_with_strategy(
+                filters={"match": "yes"},
+                **search_args,
+            )
+            self.assertEqual(strategy, "postfilter")
+            self.assertEqual([t.id for t, _ in results], expected_ids)
+            # the first window of candidates holds only two matches for [1, 19]
+            self.assertEqual(nearest_by_vectors(), batch_expected_ids)
+            results = nd.library.nearest_track_ids_by_vector_with_score(
+                filters={"match": "yes"},
+                offset=3,
+                **search_args,
+            )
+            self.assertEqual([track_id for track_id, _ in results], [tracks[0].id])
+        finally:
+            nd.library.plugin_config.prefilter_max_tracks = max_tracks
+        results, strategy = nd.library.nearest_by_vector_with_strategy(
+            **search_args,
+        )
+        self.assertEqual(strategy, "unfiltered")
+        self.assertEqual(len(results), 3)
 
 
 if __name__ == "__main__":